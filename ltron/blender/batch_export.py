@@ -1,12 +1,17 @@
 import os
+import re
+import json
+import hashlib
 import argparse
 from subprocess import Popen, PIPE, STDOUT
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import tqdm
 
 import splendor
 import splendor.assets as assets
 import ltron
+import ltron.settings as settings
 from ltron.dataset.parts import all_ldraw_parts
 
 parser = argparse.ArgumentParser()
@@ -16,61 +21,249 @@ parser.add_argument('--bricks', type=str, default=None)
 parser.add_argument('--debug', action='store_true')
 parser.add_argument('--overwrite', action='store_true')
 parser.add_argument('--quality', type=str, default='medium')
+parser.add_argument('--num-processes', type=int, default=1)
+parser.add_argument('--shard-size', type=int, default=64)
+parser.add_argument('--retries', type=int, default=1)
+parser.add_argument('--manifest', type=str, default=None)
+
+# these must match the markers printed by export_obj.export_bricks
+export_ok_marker = 'LTRON_EXPORT_OK'
+export_fail_marker = 'LTRON_EXPORT_FAIL'
+
+# the console prompt ('>>> ') and stderr share stdout with the markers, so
+# markers can appear anywhere in a line
+export_result_pattern = re.compile('(%s|%s) (\\S+)(?: (.*))?'%(
+    export_ok_marker, export_fail_marker))
+
+manifest_name = 'export_manifest.json'
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1<<20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(manifest, manifest_path):
+    # write to a temporary file first so an interrupted run never leaves
+    # a truncated manifest behind
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def brick_obj_path(brick, output_path):
+    return os.path.join(output_path, brick.replace('.dat', '.obj'))
+
+def needs_export(brick, entry, source_hash, quality, output_path):
+    if entry is None:
+        return True
+    if entry['status'] != 'exported':
+        return True
+    if entry['source_hash'] != source_hash:
+        return True
+    if entry['quality'] != quality:
+        return True
+    if not os.path.exists(brick_obj_path(brick, output_path)):
+        return True
+    return False
+
+def run_blender_export(blender, bricks, output_path, quality, debug=False):
+    '''
+    Exports a list of bricks in a single headless blender process.
+    Returns a dictionary mapping each brick to True (exported) or an error
+    string.  Bricks that never reported a result (because blender crashed)
+    are marked as failed.
+    '''
+    p = Popen(
+        [blender, '--background', '--python-console'],
+        stdout=PIPE,
+        stdin=PIPE,
+        stderr=STDOUT,
+    )
+    splendor_path = os.path.split(os.path.split(splendor.__file__)[0])[0]
+    ltron_path = os.path.split(os.path.split(ltron.__file__)[0])[0]
+    commands = [
+        b'import sys',
+        b'sys.path.append("%s")'%str.encode(splendor_path),
+        b'sys.path.append("%s")'%str.encode(ltron_path),
+        b'import ltron.blender.export_obj as export_obj',
+        b'export_obj.export_bricks('
+            b'%s,'
+            b'directory="%s",'
+            b'overwrite=True,'
+            b'**export_obj.%s_settings'
+        b')'%(
+            str.encode(repr(list(bricks))),
+            str.encode(output_path),
+            str.encode(quality),
+        )
+    ]
+    stdout, _ = p.communicate(input=b';'.join(commands))
+    stdout = stdout.decode('utf-8', errors='replace')
+    if debug:
+        print(stdout)
+
+    results = {}
+    for line in stdout.splitlines():
+        match = export_result_pattern.search(line)
+        if match is None:
+            continue
+        marker, brick, message = match.groups()
+        if marker == export_ok_marker:
+            results[brick] = True
+        else:
+            results[brick] = message if message else 'unknown'
+
+    for brick in bricks:
+        if brick not in results:
+            results[brick] = 'no result (blender exit code %s)'%p.returncode
+        elif results[brick] is True and not os.path.exists(
+            brick_obj_path(brick, output_path)
+        ):
+            results[brick] = 'no obj written'
+
+    return results
+
+def batch_export(
+    blender,
+    bricks,
+    output_path,
+    quality='medium',
+    num_processes=1,
+    shard_size=64,
+    retries=1,
+    overwrite=False,
+    manifest_path=None,
+    debug=False,
+):
+    if manifest_path is None:
+        manifest_path = os.path.join(output_path, manifest_name)
+    manifest = load_manifest(manifest_path)
+
+    part_directory = os.path.join(settings.paths['ldraw'], 'parts')
+    source_hashes = {}
+    todo = []
+    skipped = []
+    seeded = False
+    for brick in bricks:
+        source_hash = file_hash(os.path.join(part_directory, brick))
+        source_hashes[brick] = source_hash
+        obj_path = brick_obj_path(brick, output_path)
+        if (not overwrite and
+            brick not in manifest and
+            os.path.exists(obj_path)
+        ):
+            # meshes exported before the manifest existed are assumed to be
+            # up to date, like the old skip-if-exists behavior
+            manifest[brick] = {
+                'source_hash' : source_hash,
+                'quality' : quality,
+                'status' : 'exported',
+                'mesh_hash' : file_hash(obj_path),
+            }
+            seeded = True
+        if overwrite or needs_export(
+            brick, manifest.get(brick), source_hash, quality, output_path
+        ):
+            todo.append(brick)
+        else:
+            skipped.append(brick)
+    if seeded:
+        save_manifest(manifest, manifest_path)
+
+    def update_manifest(results):
+        for brick, result in results.items():
+            entry = {
+                'source_hash' : source_hashes[brick],
+                'quality' : quality,
+            }
+            if result is True:
+                entry['status'] = 'exported'
+                entry['mesh_hash'] = file_hash(
+                    brick_obj_path(brick, output_path))
+            else:
+                entry['status'] = 'failed'
+                entry['error'] = result
+            manifest[brick] = entry
+        save_manifest(manifest, manifest_path)
+
+    def export_shards(shards, description):
+        failed = []
+        with ThreadPoolExecutor(max_workers=num_processes) as executor:
+            futures = [
+                executor.submit(
+                    run_blender_export,
+                    blender,
+                    shard,
+                    output_path,
+                    quality,
+                    debug,
+                )
+                for shard in shards
+            ]
+            with tqdm.tqdm(total=sum(len(s) for s in shards)) as progress:
+                progress.set_description(description)
+                for future in as_completed(futures):
+                    results = future.result()
+                    update_manifest(results)
+                    failed.extend(
+                        brick for brick, result in results.items()
+                        if result is not True)
+                    progress.update(len(results))
+        return failed
+
+    # the first pass exports shards of many bricks per blender process to
+    # amortize blender startup, later passes retry each failure in its own
+    # process so one bad part cannot take down its neighbors
+    shards = [todo[i:i+shard_size] for i in range(0, len(todo), shard_size)]
+    failed = export_shards(shards, 'Exporting')
+    for retry in range(retries):
+        if not failed:
+            break
+        failed = export_shards(
+            [[brick] for brick in failed], 'Retry %i'%(retry+1))
+
+    failed = set(failed)
+    exported = [brick for brick in todo if brick not in failed]
+    return exported, skipped, sorted(failed)
 
 def main():
-    
+
     args = parser.parse_args()
     if args.bricks is None:
         bricks = all_ldraw_parts()
     else:
         bricks = [b.strip() for b in args.bricks.split(',')]
-    
+
     if args.output_path is None:
         ltron_assets = assets.AssetLibrary('ltron_assets')
         output_path = ltron_assets['meshes'].paths[0]
     else:
         output_path = args.output_path
-    
-    exported = []
-    skipped = []
-    for brick in tqdm.tqdm(bricks):
-        brick_dest = os.path.join(output_path, brick.replace('.dat', '.obj'))
-        if os.path.exists(brick_dest) and not args.overwrite:
-            skipped.append(brick)
-            continue
-        
-        p = Popen(
-            [args.blender, '--background', '--python-console'],
-            stdout=PIPE,
-            stdin=PIPE,
-            stderr=PIPE,
-        )
-        splendor_path = os.path.split(os.path.split(splendor.__file__)[0])[0]
-        ltron_path = os.path.split(os.path.split(ltron.__file__)[0])[0]
-        commands = [
-            b'import sys',
-            b'sys.path.append("%s")'%str.encode(splendor_path),
-            b'sys.path.append("%s")'%str.encode(ltron_path),
-            b'import ltron.blender.export_obj as export_obj',
-            b'export_obj.export_brick('
-                b'"%s",'
-                b'directory="%s",'
-                b'overwrite=True,'
-                b'**export_obj.%s_settings'
-            b')'%(
-                str.encode(brick),
-                str.encode(output_path),
-                str.encode(args.quality),
-            )
-        ]
-        stdout = p.communicate(input=b';'.join(commands))
-        if args.debug:
-            print(stdout)
-        
-        exported.append(brick)
-    
+
+    exported, skipped, failed = batch_export(
+        args.blender,
+        bricks,
+        output_path,
+        quality=args.quality,
+        num_processes=args.num_processes,
+        shard_size=args.shard_size,
+        retries=args.retries,
+        overwrite=args.overwrite,
+        manifest_path=args.manifest,
+        debug=args.debug,
+    )
+
     print('Skipped: %s'%(','.join(skipped)))
     print('Exported: %s'%(','.join(exported)))
+    print('Failed: %s'%(','.join(failed)))
 
 if __name__ == '__main__':
     main()
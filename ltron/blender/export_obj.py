@@ -131,6 +131,23 @@ def export_brick(brick,
                 axis_forward = axis_forward,
                 axis_up = axis_up)
 
+export_ok_marker = 'LTRON_EXPORT_OK'
+export_fail_marker = 'LTRON_EXPORT_FAIL'
+
+def export_bricks(bricks, **kwargs):
+    '''
+    Exports several bricks in one blender session.  A failure on one brick
+    does not stop the rest, and the result of each brick is printed on its
+    own line so that batch_export can parse it from stdout.
+    '''
+    for brick in bricks:
+        try:
+            export_brick(brick, **kwargs)
+        except Exception as e:
+            print('%s %s %s'%(export_fail_marker, brick, repr(e)), flush=True)
+        else:
+            print('%s %s'%(export_ok_marker, brick), flush=True)
+
 def export_scene_bricks(scene_path, **kwargs):
     #scene_document = LDrawDocument.parse_document(scene_path)
     brick_scene = BrickScene()
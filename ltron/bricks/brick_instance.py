@@ -48,6 +48,48 @@ class BrickInstanceTable(collections.abc.MutableMapping):
         self[instance_id] = new_instance
         return new_instance
     
+    def add_instances(
+        self,
+        brick_names,
+        brick_colors,
+        brick_transforms,
+        instance_ids=None,
+    ):
+        if instance_ids is None:
+            instance_ids = range(
+                self.next_instance_id,
+                self.next_instance_id + len(brick_names),
+            )
+        
+        # resolve each distinct shape and color once
+        brick_shapes = {
+            name : self.shape_library[name] for name in set(brick_names)}
+        colors = {
+            color : self.color_library[color] for color in set(brick_colors)}
+        
+        new_instances = []
+        for instance_id, name, color, transform in zip(
+            instance_ids, brick_names, brick_colors, brick_transforms
+        ):
+            instance_id = int(instance_id)
+            assert instance_id not in self
+            new_instance = BrickInstance(
+                instance_id,
+                brick_shapes[name],
+                colors[color],
+                transform,
+            )
+            self.instances[instance_id] = new_instance
+            new_instances.append(new_instance)
+        
+        if len(new_instances):
+            self.next_instance_id = max(
+                self.next_instance_id,
+                max(int(i) for i in new_instances) + 1,
+            )
+        
+        return new_instances
+    
     def import_document(self, document, transform=None, color=None):
         new_instances = []
         try:
@@ -134,7 +176,20 @@ class BrickInstance:
         return self.instance_name
     
     def get_upright_snaps(self):
-        return [snap for snap in self.snaps if snap.is_upright()]
+        # note that like SnapStyle.is_upright, this tests the snaps in the
+        # brick's local frame, use get_world_upright_snaps to include the pose
+        upright_ids = numpy.nonzero(self.brick_shape.snap_upright)[0]
+        return [self.snaps[i] for i in upright_ids]
+    
+    def get_world_upright_snaps(self, up=(0,1,0)):
+        upright_ids = self.brick_shape.get_upright_snap_ids(
+            transform=self.transform, up=up)
+        return [self.snaps[i] for i in upright_ids]
+    
+    def get_matching_snaps(self, polarity=None, style=None):
+        snap_ids = self.brick_shape.get_matching_snap_ids(
+            polarity=polarity, style=style)
+        return [self.snaps[i] for i in snap_ids]
     
     def splendor_instance_args(self):
         instance_args = {
@@ -192,31 +192,33 @@ class BrickScene:
         color_ids,
         match_instance_ids=False,
     ):
-        for i in range(len(assembly['shape'])):
-            instance_shape = assembly['shape'][i]
-            if instance_shape == 0:
-                continue
-            instance_color = assembly['color'][i]
-            instance_pose = assembly['pose'][i]
-            shape_labels = {
-                value:key for key, value in shape_ids.items()}
-            color_labels = {
-                value:key for key, value in color_ids.items()}
+        shape_labels = {value:key for key, value in shape_ids.items()}
+        color_labels = {value:key for key, value in color_ids.items()}
+        
+        indices = numpy.nonzero(assembly['shape'])[0]
+        brick_shapes = []
+        for instance_shape in assembly['shape'][indices].tolist():
             try:
-                brick_shape = shape_labels[instance_shape]
+                brick_shapes.append(shape_labels[instance_shape])
             except KeyError:
                 raise MissingClassError(instance_shape)
+        colors = []
+        for instance_color in assembly['color'][indices].tolist():
             try:
-                color = color_labels[instance_color]
+                colors.append(color_labels[instance_color])
             except KeyError:
                 raise MissingColorError
-            
-            if match_instance_ids:
-                instance_id = i
-            else:
-                instance_id = None
-            self.add_instance(
-                brick_shape, color, instance_pose, instance_id=instance_id)
+        
+        if match_instance_ids:
+            instance_ids = indices
+        else:
+            instance_ids = None
+        self.add_instances(
+            brick_shapes,
+            colors,
+            assembly['pose'][indices],
+            instance_ids=instance_ids,
+        )
         
         self.assembly_cache = None
     
@@ -328,6 +330,27 @@ class BrickScene:
         self.assembly_cache = None
         return brick_instance
     
+    def add_instances(
+        self, brick_shapes, brick_colors, transforms, instance_ids=None
+    ):
+        '''
+        Batched version of add_instance.  Shapes, colors, meshes and
+        materials are loaded once per distinct value, and the renderer and
+        snap tracker are updated in one call each.
+        '''
+        for brick_shape in set(brick_shapes):
+            self.shape_library.add_shape(brick_shape)
+        self.color_library.load_colors(set(brick_colors))
+        brick_instances = self.instances.add_instances(
+            brick_shapes, brick_colors, transforms, instance_ids=instance_ids)
+        if self.renderable:
+            self.render_environment.add_instances(brick_instances)
+        if self.track_snaps:
+            self.insert_instance_snaps(brick_instances)
+        
+        self.assembly_cache = None
+        return brick_instances
+    
     def move_instance(self, instance, transform):
         instance = self.instances[instance]
         instance.transform = transform
@@ -399,6 +422,33 @@ class BrickScene:
             snap_position = snap.transform[:3,3]
             self.snap_tracker.insert(snap_id, snap_position)
     
+    def insert_instance_snaps(self, instances):
+        # snap tracking for newly added instances: the snap positions for all
+        # instances of the same shape are computed with one matrix product
+        assert self.track_snaps
+        instances_by_shape = {}
+        for instance in instances:
+            instance = self.instances[instance]
+            instances_by_shape.setdefault(
+                str(instance.brick_shape), []).append(instance)
+        
+        for shape_instances in instances_by_shape.values():
+            snap_styles = shape_instances[0].brick_shape.snaps
+            if not len(snap_styles):
+                continue
+            snap_positions = numpy.stack(
+                [snap.transform[:,3] for snap in snap_styles], axis=-1)
+            instance_transforms = numpy.stack(
+                [instance.transform for instance in shape_instances])
+            positions = (instance_transforms @ snap_positions)[:,:3]
+            positions = positions.transpose(0,2,1).reshape(-1,3)
+            snap_ids = [
+                (int(instance), int(snap))
+                for instance in shape_instances
+                for snap in snap_styles
+            ]
+            self.snap_tracker.insert_many(snap_ids, positions)
+    
     def get_matching_snaps(
         self,
         instances=None,
@@ -410,12 +460,8 @@ class BrickScene:
         matching_snaps = []
         for instance in instances:
             instance = self.instances[instance]
-            for snap in instance.snaps:
-                if polarity is not None and snap.polarity != polarity:
-                    continue
-                if style is not None and snap.style not in style:
-                    continue
-                matching_snaps.append(snap)
+            matching_snaps.extend(instance.get_matching_snaps(
+                polarity=polarity, style=style))
         
         return matching_snaps
     
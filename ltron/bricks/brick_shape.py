@@ -1,3 +1,4 @@
+import threading
 import collections
 
 import numpy
@@ -18,9 +19,11 @@ from ltron.ldraw.documents import (
     LDrawMPDInternalFile,
     LDrawLDR,
     LDrawDAT,
+    shared_reference_table,
 )
 from ltron.bricks.snap import (
     Snap, SnapStyle, SnapStyleSequence, SnapClear, deduplicate_snaps, griderate)
+from ltron.geometry.utils import unscale_transforms
 
 class BrickShapeLibrary(collections.abc.MutableMapping):
     def __init__(self, brick_shapes=None):
@@ -32,8 +35,16 @@ class BrickShapeLibrary(collections.abc.MutableMapping):
         if new_shape in self:
             return self[new_shape]
         
-        if not isinstance(new_shape, BrickShape):
-            new_shape = BrickShape(new_shape)
+        if isinstance(new_shape, LDrawDAT):
+            # parts loaded through the shared reference table are identical
+            # across scenes, so reuse the registry's copy instead of
+            # resolving the snaps again for every scene
+            if new_shape.reference_table is shared_reference_table:
+                new_shape = get_brick_shape(new_shape.reference_name)
+            else:
+                new_shape = BrickShape(new_shape)
+        elif not isinstance(new_shape, BrickShape):
+            new_shape = get_brick_shape(new_shape)
         self[new_shape.reference_name] = new_shape
         return new_shape
     
@@ -207,6 +218,129 @@ class BrickShape:
              bb[0][2], bb[1][2], bb[0][2], bb[1][2]],
             [1, 1, 1, 1, 1, 1, 1, 1]
         ])
+        
+        self.construct_snap_features()
+    
+    def construct_snap_features(self):
+        '''
+        Compact per-snap arrays, so that snap subsets can be found by boolean
+        indexing instead of filtering the snaps one at a time:
+        snap_transforms : (n,4,4) shape-space snap transforms
+        snap_polarity : (n,) '+', '-' or '' for snaps without a polarity
+        snap_style_class : (n,) index into snap_style_names, which holds the
+            names of the snap classes (Stud, StudHole, ...) used by the shape
+        snap_axes : (n,3) unit +y axis of each snap in shape space
+        snap_upright : (n,) the same test as Snap.is_upright
+        '''
+        num_snaps = len(self.snaps)
+        if num_snaps:
+            self.snap_transforms = numpy.stack(
+                [snap.transform for snap in self.snaps])
+        else:
+            self.snap_transforms = numpy.zeros((0,4,4))
+        self.snap_polarity = numpy.array(
+            [getattr(snap, 'polarity', '') for snap in self.snaps],
+            dtype='<U1',
+        )
+        class_names = [type(snap).__name__ for snap in self.snaps]
+        self.snap_style_names = tuple(sorted(set(class_names)))
+        self.snap_style_class = numpy.array(
+            [self.snap_style_names.index(name) for name in class_names],
+            dtype=numpy.int64,
+        )
+        self.snap_axes = unscale_transforms(self.snap_transforms)[:,:3,1]
+        self.snap_upright = self.snap_axes[:,1] >= 0.999
+    
+    def get_matching_snap_ids(self, polarity=None, style=None):
+        '''
+        Returns the ids of the snaps with the given polarity ('+' or '-') and
+        style (a snap class name or a sequence of them).
+        '''
+        mask = numpy.ones(len(self.snaps), dtype=bool)
+        if polarity is not None:
+            mask &= self.snap_polarity == polarity
+        if style is not None:
+            if isinstance(style, str):
+                style = (style,)
+            style_classes = [
+                self.snap_style_names.index(name) for name in style
+                if name in self.snap_style_names
+            ]
+            mask &= numpy.isin(self.snap_style_class, style_classes)
+        return numpy.nonzero(mask)[0]
+    
+    def get_upright_snap_ids(self, transform=None, up=(0,1,0)):
+        '''
+        Returns the ids of the snaps whose +y axis points along up.  If
+        transform is specified the snaps are first posed by it, so the test
+        is done in world space.
+        '''
+        axes = self.snap_axes
+        if transform is not None:
+            rotation = unscale_transforms(transform)[:3,:3]
+            axes = axes @ rotation.T
+        return numpy.nonzero(axes @ numpy.array(up) >= 0.999)[0]
     
     def get_upright_snaps(self):
-        return [snap for snap in self.snaps if snap.is_upright()]
+        return [self.snaps[i] for i in numpy.nonzero(self.snap_upright)[0]]
+
+class BrickShapeRegistry:
+    '''
+    Process-wide cache of BrickShapes parsed from the shared reference table,
+    keyed on shape name.  Building a BrickShape walks the LDraw documents and
+    resolves every snap, so code that only needs to look shapes up (the
+    planners in particular) should go through get_brick_shape.  The cache is
+    a bounded LRU and is safe to use from multiple threads.  BrickShapes
+    returned from the registry are shared and should not be modified.
+    '''
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self.brick_shapes = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, name):
+        name = str(name)
+        with self.lock:
+            if name in self.brick_shapes:
+                self.hits += 1
+                self.brick_shapes.move_to_end(name)
+                return self.brick_shapes[name]
+            self.misses += 1
+        
+        # parse outside the lock so other threads can keep reading, if two
+        # threads race on the same name the first one stored wins
+        brick_shape = BrickShape(name)
+        with self.lock:
+            brick_shape = self.brick_shapes.setdefault(name, brick_shape)
+            self.brick_shapes.move_to_end(name)
+            while len(self.brick_shapes) > self.max_size:
+                self.brick_shapes.popitem(last=False)
+        
+        return brick_shape
+    
+    def __contains__(self, name):
+        return str(name) in self.brick_shapes
+    
+    def __len__(self):
+        return len(self.brick_shapes)
+    
+    def clear(self):
+        with self.lock:
+            self.brick_shapes.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self):
+        return {
+            'size' : len(self.brick_shapes),
+            'max_size' : self.max_size,
+            'hits' : self.hits,
+            'misses' : self.misses,
+        }
+
+brick_shape_registry = BrickShapeRegistry()
+
+def get_brick_shape(name):
+    return brick_shape_registry.get(name)
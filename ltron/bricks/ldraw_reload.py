@@ -0,0 +1,308 @@
+import os
+import re
+
+import numpy
+
+from ltron.ldraw.parts import LDRAW_PARTS, get_reference_name
+from ltron.ldraw.commands import LDrawCommand, LDrawImportCommand
+from ltron.ldraw.documents import (
+    LDrawDocument,
+    LDrawDAT,
+    LDrawMPDMainFile,
+    LDrawMPDInternalFile,
+    LDrawLDR,
+)
+from ltron.dataset.paths import resolve_subdocument
+
+'''
+Incremental reloading for files that are being edited while they are loaded
+(see ltron.visualization.ltron_viewer).  Instead of clearing the scene and
+importing the file again, LDrawReloader reparses only the sections of an MPD
+file whose text changed, flattens the file to a list of bricks and applies
+the difference to the scene as adds, removes, recolors and moves.
+
+The bricks are flattened the same way BrickScene.import_ldraw imports them,
+but instance ids are not renumbered, so after an incremental reload they can
+differ from the ids a fresh import would assign.
+'''
+
+def is_file_line(line):
+    # matches the lines that LDrawCommand.parse_command turns into an
+    # LDrawFileComment
+    line = re.sub('[^!-~]+', ' ', line).strip()
+    tokens = line.split(None, 2)
+    return len(tokens) == 3 and tokens[0] == '0' and tokens[1] == 'FILE'
+
+def split_sections(lines):
+    '''
+    Splits the lines of an MPD file into (reference_name, text) pairs, one
+    for each "0 FILE" section.  Returns None if the file is not an MPD file.
+    '''
+    file_lines = [i for i, line in enumerate(lines) if is_file_line(line)]
+    if not file_lines:
+        return None
+    if LDrawCommand.parse_commands(lines[:file_lines[0]]):
+        return None
+
+    sections = []
+    file_lines.append(len(lines))
+    for start, end in zip(file_lines[:-1], file_lines[1:]):
+        file_name = re.sub('[^!-~]+', ' ', lines[start]).strip().split(
+            None, 2)[2]
+        sections.append((get_reference_name(file_name), lines[start:end]))
+
+    return sections
+
+def flatten_document(document):
+    '''
+    Returns the shape names, colors and (n,4,4) transforms of the bricks in
+    an LDraw document, mirroring BrickInstanceTable.import_document.
+    '''
+    names = []
+    colors = []
+    transforms = []
+    for command in document.commands:
+        if not isinstance(command, LDrawImportCommand):
+            continue
+        reference_name = command.reference_name
+        reference_document = document.reference_table['ldraw'][reference_name]
+        if isinstance(reference_document, LDrawDAT):
+            if reference_name in LDRAW_PARTS:
+                names.append(reference_name)
+                colors.append(command.color)
+                transforms.append(command.transform[None])
+        elif isinstance(
+            reference_document,
+            (LDrawMPDMainFile, LDrawMPDInternalFile, LDrawLDR),
+        ):
+            child_names, child_colors, child_transforms = flatten_document(
+                reference_document)
+            names.extend(child_names)
+            colors.extend(child_colors)
+            transforms.append(command.transform @ child_transforms)
+
+    return names, colors, concatenate_transforms(transforms)
+
+def concatenate_transforms(transforms):
+    if len(transforms):
+        return numpy.concatenate(transforms, axis=0)
+    else:
+        return numpy.zeros((0,4,4))
+
+class LDrawReloader:
+    def __init__(self, scene, path):
+        self.scene = scene
+        self.path = path
+        self.file_path, self.subdocument = resolve_subdocument(path)
+        self.reference_name = get_reference_name(self.file_path)
+
+        # text -> parsed commands, for the sections of the current file
+        self.section_commands = {}
+        # section key -> flattened bricks, for the sections of the current file
+        self.section_bricks = {}
+
+    def clear(self):
+        self.section_commands.clear()
+        self.section_bricks.clear()
+
+    def read_sections(self):
+        with open(self.file_path, encoding='latin-1') as f:
+            lines = f.readlines()
+        sections = split_sections(lines)
+        if sections is None:
+            sections = [(self.reference_name, lines)]
+            main_name = self.reference_name
+        else:
+            main_name = sections[0][0]
+
+        section_commands = {}
+        commands = {}
+        num_parsed = 0
+        for reference_name, section_lines in sections:
+            text = ''.join(section_lines)
+            if text in self.section_commands:
+                section_commands[text] = self.section_commands[text]
+            else:
+                section_commands[text] = LDrawCommand.parse_commands(
+                    section_lines)
+                num_parsed += 1
+            # like the reference table, later sections replace earlier ones
+            commands[reference_name] = (text, section_commands[text])
+
+        self.section_commands = section_commands
+        return main_name, commands, num_parsed
+
+    def flatten(self):
+        main_name, commands, num_parsed = self.read_sections()
+        section_bricks = {}
+        keys = {}
+
+        def section_key(reference_name, visiting):
+            # a section's flattened bricks depend on its own text and on the
+            # flattened bricks of every section it references
+            if reference_name in keys:
+                return keys[reference_name]
+            if reference_name in visiting:
+                raise ValueError(
+                    'Recursive reference to %s in %s'%(
+                        reference_name, self.file_path))
+            visiting.add(reference_name)
+            text, section_commands = commands[reference_name]
+            child_keys = tuple(
+                section_key(command.reference_name, visiting)
+                for command in section_commands
+                if isinstance(command, LDrawImportCommand) and
+                command.reference_name in commands
+            )
+            visiting.remove(reference_name)
+            keys[reference_name] = (text, child_keys)
+            return keys[reference_name]
+
+        def flatten_section(reference_name):
+            key = section_key(reference_name, set())
+            if key in section_bricks:
+                return section_bricks[key]
+            if key in self.section_bricks:
+                section_bricks[key] = self.section_bricks[key]
+                return section_bricks[key]
+
+            names = []
+            colors = []
+            transforms = []
+            text, section_commands = commands[reference_name]
+            for command in section_commands:
+                if not isinstance(command, LDrawImportCommand):
+                    continue
+                child_name = command.reference_name
+                if child_name in commands:
+                    child_names, child_colors, child_transforms = (
+                        flatten_section(child_name))
+                elif child_name in LDRAW_PARTS and child_name.endswith('.dat'):
+                    names.append(child_name)
+                    colors.append(command.color)
+                    transforms.append(command.transform[None])
+                    continue
+                elif os.path.splitext(child_name)[1] == '.dat':
+                    # subparts and primitives are not bricks
+                    continue
+                else:
+                    child_names, child_colors, child_transforms = (
+                        flatten_document(
+                            LDrawDocument.parse_document(child_name)))
+                names.extend(child_names)
+                colors.extend(child_colors)
+                transforms.append(command.transform @ child_transforms)
+
+            section_bricks[key] = (
+                names, colors, concatenate_transforms(transforms))
+            return section_bricks[key]
+
+        if self.subdocument is not None:
+            root_name = self.subdocument
+        else:
+            root_name = main_name
+        names, colors, transforms = flatten_section(root_name)
+        self.section_bricks = section_bricks
+
+        transforms = self.scene.upright @ transforms
+        return names, colors, transforms, num_parsed
+
+    def reload(self, full=False):
+        '''
+        Brings the scene up to date with the file and returns a dictionary
+        counting the bricks that were added, removed, recolored, moved and
+        left unchanged, and the number of sections that were reparsed.  If
+        full is True, the scene and all cached sections are cleared first.
+        '''
+        if full:
+            self.clear()
+            self.scene.clear_instances()
+
+        names, colors, transforms, num_parsed = self.flatten()
+        colors = [str(color) for color in colors]
+
+        # match unchanged bricks exactly
+        old_instances = {}
+        for instance_id, instance in self.scene.instances.items():
+            key = (
+                str(instance.brick_shape),
+                str(instance.color),
+                instance.transform.tobytes(),
+            )
+            old_instances.setdefault(key, []).append(instance_id)
+
+        unmatched_new = []
+        num_unchanged = 0
+        for i, (name, color, transform) in enumerate(
+            zip(names, colors, transforms)
+        ):
+            old_ids = old_instances.get((name, color, transform.tobytes()))
+            if old_ids:
+                old_ids.pop(0)
+                num_unchanged += 1
+            else:
+                unmatched_new.append(i)
+        unmatched_old = sorted(
+            instance_id for old_ids in old_instances.values()
+            for instance_id in old_ids
+        )
+
+        # then pair the remaining bricks up as recolors (same shape and
+        # transform) and moves (same shape and color), in instance order
+        def pair(old_key, new_key):
+            old_by_key = {}
+            for instance_id in unmatched_old:
+                old_by_key.setdefault(old_key(instance_id), []).append(
+                    instance_id)
+            pairs = []
+            still_unmatched_new = []
+            for i in unmatched_new:
+                old_ids = old_by_key.get(new_key(i))
+                if old_ids:
+                    pairs.append((old_ids.pop(0), i))
+                else:
+                    still_unmatched_new.append(i)
+            paired_old = set(instance_id for instance_id, i in pairs)
+            return (
+                pairs,
+                [i for i in unmatched_old if i not in paired_old],
+                still_unmatched_new,
+            )
+
+        def instance(instance_id):
+            return self.scene.instances[instance_id]
+
+        recolors, unmatched_old, unmatched_new = pair(
+            lambda j : (
+                str(instance(j).brick_shape),
+                instance(j).transform.tobytes(),
+            ),
+            lambda i : (names[i], transforms[i].tobytes()),
+        )
+        for instance_id, i in recolors:
+            self.scene.set_instance_color(instance_id, colors[i])
+
+        moves, unmatched_old, unmatched_new = pair(
+            lambda j : (str(instance(j).brick_shape), str(instance(j).color)),
+            lambda i : (names[i], colors[i]),
+        )
+        for instance_id, i in moves:
+            self.scene.move_instance(instance_id, numpy.array(transforms[i]))
+
+        for instance_id in unmatched_old:
+            self.scene.remove_instance(instance_id)
+        if unmatched_new:
+            self.scene.add_instances(
+                [names[i] for i in unmatched_new],
+                [colors[i] for i in unmatched_new],
+                transforms[unmatched_new],
+            )
+
+        return {
+            'added' : len(unmatched_new),
+            'removed' : len(unmatched_old),
+            'recolored' : len(recolors),
+            'moved' : len(moves),
+            'unchanged' : num_unchanged,
+            'reparsed_sections' : num_parsed,
+        }
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+import os
+import tempfile
+
+import numpy
+
+from ltron.bricks.brick_scene import BrickScene
+from ltron.bricks.ldraw_reload import LDrawReloader
+
+main_section = '''0 FILE main.mpd
+1 4 0 0 0 1 0 0 0 1 0 0 0 1 3001.dat
+1 1 0 -24 0 1 0 0 0 1 0 0 0 1 3001.dat
+1 14 100 0 0 1 0 0 0 1 0 0 0 1 sub.ldr
+1 14 200 0 0 1 0 0 0 1 0 0 0 1 sub.ldr
+1 14 0 0 100 0 0 1 0 1 0 -1 0 0 other.ldr
+'''
+
+# brick 1 recolored, brick 2 moved
+edited_main_section = '''0 FILE main.mpd
+1 2 0 0 0 1 0 0 0 1 0 0 0 1 3001.dat
+1 1 0 -48 0 1 0 0 0 1 0 0 0 1 3001.dat
+1 14 100 0 0 1 0 0 0 1 0 0 0 1 sub.ldr
+1 14 200 0 0 1 0 0 0 1 0 0 0 1 sub.ldr
+1 14 0 0 100 0 0 1 0 1 0 -1 0 0 other.ldr
+'''
+
+sub_section = '''0 FILE sub.ldr
+1 2 0 0 0 1 0 0 0 1 0 0 0 1 3003.dat
+1 5 0 -24 0 1 0 0 0 1 0 0 0 1 3003.dat
+'''
+
+# one brick added
+edited_sub_section = '''0 FILE sub.ldr
+1 2 0 0 0 1 0 0 0 1 0 0 0 1 3003.dat
+1 5 0 -24 0 1 0 0 0 1 0 0 0 1 3003.dat
+1 7 0 -48 0 1 0 0 0 1 0 0 0 1 3003.dat
+'''
+
+other_section = '''0 FILE other.ldr
+1 4 0 0 0 1 0 0 0 1 0 0 0 1 3001.dat
+1 15 20 -24 0 1 0 0 0 1 0 0 0 1 3003.dat
+'''
+
+def write_mpd(path, *sections):
+    with open(path, 'w') as f:
+        f.write(''.join(sections))
+
+def scene_bricks(scene):
+    bricks = [
+        (str(instance.brick_shape), str(instance.color), instance.transform)
+        for instance in scene.instances.values()
+    ]
+    return sorted(bricks, key=lambda brick : (
+        brick[0], brick[1], tuple(numpy.round(brick[2], 4).reshape(-1))))
+
+def assert_matches_fresh_import(scene, path):
+    fresh_scene = BrickScene()
+    fresh_scene.import_ldraw(path)
+    bricks = scene_bricks(scene)
+    fresh_bricks = scene_bricks(fresh_scene)
+    assert len(bricks) == len(fresh_bricks)
+    for brick, fresh_brick in zip(bricks, fresh_bricks):
+        assert brick[:2] == fresh_brick[:2]
+        assert numpy.allclose(brick[2], fresh_brick[2])
+
+def test_ldraw_reload():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'main.mpd')
+        write_mpd(path, main_section, sub_section, other_section)
+        
+        scene = BrickScene()
+        scene.import_ldraw(path)
+        reloader = LDrawReloader(scene, path)
+        
+        # the first reload parses every section but leaves the scene alone
+        changes = reloader.reload()
+        assert changes == {
+            'added' : 0,
+            'removed' : 0,
+            'recolored' : 0,
+            'moved' : 0,
+            'unchanged' : 8,
+            'reparsed_sections' : 3,
+        }
+        assert_matches_fresh_import(scene, path)
+        
+        # move one brick, recolor one and add a brick to a submodel that is
+        # used twice, other.ldr is unchanged and comes from the cache
+        write_mpd(path, edited_main_section, edited_sub_section, other_section)
+        changes = reloader.reload()
+        assert changes == {
+            'added' : 2,
+            'removed' : 0,
+            'recolored' : 1,
+            'moved' : 1,
+            'unchanged' : 6,
+            'reparsed_sections' : 2,
+        }
+        assert len(scene.instances) == 10
+        assert_matches_fresh_import(scene, path)
+        
+        # nothing changed
+        changes = reloader.reload()
+        assert changes['unchanged'] == 10
+        assert changes['reparsed_sections'] == 0
+        
+        # revert the submodel, which removes the added bricks again
+        write_mpd(path, edited_main_section, sub_section, other_section)
+        changes = reloader.reload()
+        assert changes == {
+            'added' : 0,
+            'removed' : 2,
+            'recolored' : 0,
+            'moved' : 0,
+            'unchanged' : 8,
+            'reparsed_sections' : 1,
+        }
+        assert_matches_fresh_import(scene, path)
+        
+        # a full reload rebuilds the scene from scratch
+        changes = reloader.reload(full=True)
+        assert changes['added'] == 8
+        assert changes['reparsed_sections'] == 3
+        assert_matches_fresh_import(scene, path)
+
+if __name__ == '__main__':
+    test_ldraw_reload()
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import numpy
 
 def tile_frame(frame, tile_height, tile_width):
@@ -13,6 +15,170 @@ def tile_frame(frame, tile_height, tile_width):
     
     return frame
 
+# tile hashing =================================================================
+'''
+Tiles of integer frames are compared by hashing.  Each tile row is viewed as
+machine words without copying, and each tile gets a 64-bit hash in one
+einsum pass.  The hash is a sum of the tile's 32-bit words times fixed random
+odd multipliers.  Tiles whose hash differs from the previous frame's hash
+have changed, and only the tiles whose hashes match are compared in full, so
+the result is exactly the same as an elementwise comparison even when
+hashes collide.  With verify=False the hashes are trusted and the full
+comparison is skipped.
+
+Float frames are always compared elementwise.  Equal values (0. and -0.)
+can have different bytes, and equal bytes (nan) can compare unequal.
+'''
+
+tile_hash_seed = 1234567
+
+def tile_words(frames, tile_height, tile_width):
+    '''
+    Views (..., h, w, c) frames as (..., hh, tile_height, ww, n) words,
+    where hh and ww are the number of tiles down and across and each tile row
+    is n words.
+    '''
+    *batch, h, w, c = frames.shape
+    assert h % tile_height == 0
+    assert w % tile_width == 0
+    hh = h // tile_height
+    ww = w // tile_width
+    
+    frames = numpy.ascontiguousarray(frames)
+    row_bytes = tile_width * c * frames.itemsize
+    word_size = next(size for size in (8,4,2,1) if row_bytes % size == 0)
+    words = frames.view(numpy.uint8).reshape(
+        *batch, hh, tile_height, ww, row_bytes)
+    return words.view(numpy.dtype('u%i'%word_size))
+
+@lru_cache(maxsize=None)
+def tile_hash_multipliers(tile_height, num_words):
+    random = numpy.random.RandomState(tile_hash_seed)
+    multipliers = random.randint(
+        0, 2**64, size=(tile_height, num_words), dtype=numpy.uint64)
+    multipliers |= numpy.uint64(1)
+    multipliers.setflags(write=False)
+    return multipliers
+
+def tile_hashes(words):
+    '''
+    Returns a (..., hh, ww) uint64 hash for each tile of a tile_words view.
+    '''
+    # hash 32-bit words so that a change in the high bits of a word cannot
+    # be multiplied out of the low 64 bits
+    if words.itemsize == 8:
+        words = words.view(numpy.uint32)
+    *batch, tile_height, ww, num_words = words.shape
+    multipliers = tile_hash_multipliers(tile_height, num_words)
+    return numpy.einsum(
+        '...rwj,rj->...w', words, multipliers, dtype=numpy.uint64)
+
+def compare_tiles(
+    words, hashes, previous_words, previous_hashes, verify=True
+):
+    '''
+    Returns a boolean array shaped like hashes that is True where the tile
+    words differ from previous_words.
+    '''
+    modified = hashes != previous_hashes
+    if not verify:
+        return modified
+    
+    hits = numpy.nonzero(~modified)
+    if len(hits[0]) > modified.size // 4:
+        # when most tiles are hits, comparing everything is cheaper than
+        # gathering the hits, and tiles with different hashes differ anyway
+        return numpy.any(words != previous_words, axis=(-3,-1))
+    
+    elif len(hits[0]):
+        previous_words = numpy.broadcast_to(previous_words, words.shape)
+        index = hits[:-1] + (slice(None),) + hits[-1:]
+        modified[hits] = numpy.any(
+            words[index] != previous_words[index], axis=(1,2))
+    
+    return modified
+
+def hashable_frames(frames, background=0):
+    # scalar backgrounds are broadcast the same way as in the elementwise
+    # comparison, so they only have to survive the multiplication
+    if not isinstance(background, numpy.ndarray):
+        background = background * numpy.ones(1, dtype=frames.dtype)
+    return frames.dtype.kind in 'biu' and background.dtype == frames.dtype
+
+def background_tile_words(
+    background, frame_shape, dtype, tile_height, tile_width
+):
+    '''
+    Returns the tile_words and tile_hashes of a background that is either a
+    scalar or an array with frame_shape, broadcast to frame_shape.
+    '''
+    *batch, h, w, c = frame_shape
+    try:
+        background = background.reshape(*batch, h, w, c)
+    except AttributeError:
+        background = background * numpy.ones(
+            (tile_height, tile_width, c), dtype=dtype)
+    words = tile_words(background, tile_height, tile_width)
+    hashes = tile_hashes(words)
+    *batch_words, hh, th, ww, n = words.shape
+    words_shape = (*batch, h // tile_height, th, w // tile_width, n)
+    hashes_shape = (*batch, h // tile_height, w // tile_width)
+    return (
+        numpy.broadcast_to(words, words_shape),
+        numpy.broadcast_to(hashes, hashes_shape),
+    )
+
+def batch_modified_tiles(
+    seqs, tile_height, tile_width, background=0, verify=True
+):
+    '''
+    Returns an (s, b, hh, ww) boolean array marking the tiles of the
+    (s, b, h, w, c) frames seqs that differ from the same tile in the previous
+    frame.  The first frame is compared against the background, which is
+    either a scalar or a (b, h, w, c) array.  See compare_tiles for verify.
+    '''
+    s, b, h, w, c = seqs.shape
+    assert h % tile_height == 0
+    assert w % tile_width == 0
+    hh = h // tile_height
+    ww = w // tile_width
+    
+    if not hashable_frames(seqs, background):
+        seq_tiles = seqs.reshape(s, b, hh, tile_height, ww, tile_width, c)
+        seq_tiles = seq_tiles.transpose(0, 1, 2, 4, 3, 5, 6)
+        seq_tiles = seq_tiles.reshape(s, b, hh, ww, -1)
+        try:
+            background = background.reshape(
+                1, b, hh, tile_height, ww, tile_width, c)
+            background = background.transpose(0, 1, 2, 4, 3, 5, 6)
+            background = background.reshape(1, b, hh, ww, -1)
+        except AttributeError:
+            background = background * numpy.ones(
+                (1, b, hh, ww, tile_height*tile_width*c),
+                dtype=seq_tiles.dtype,
+            )
+        prev_tiles = numpy.concatenate((background, seq_tiles[:-1]), axis=0)
+        return numpy.any(seq_tiles != prev_tiles, axis=-1)
+    
+    words = tile_words(seqs, tile_height, tile_width)
+    hashes = tile_hashes(words)
+    background_words, background_hashes = background_tile_words(
+        background, (b, h, w, c), seqs.dtype, tile_height, tile_width)
+    
+    modified = numpy.zeros((s, b, hh, ww), dtype=bool)
+    if s:
+        modified[0] = compare_tiles(
+            words[0],
+            hashes[0],
+            background_words,
+            background_hashes,
+            verify=verify,
+        )
+        modified[1:] = compare_tiles(
+            words[1:], hashes[1:], words[:-1], hashes[:-1], verify=verify)
+    
+    return modified
+
 def deduplicate_tiled_seq(frames, tile_height, tile_width, background=0):
     frames = [tile_frame(frame, tile_height, tile_width) for frame in frames]
     n, th, tw, *c = frames[0].shape
@@ -156,6 +322,7 @@ def batch_deduplicate_tiled_seqs(
     tile_height,
     background=0,
     s_start=None,
+    verify=True,
 ):
     s, b, h, w, c = seqs.shape
     assert h % tile_height == 0
@@ -163,26 +330,11 @@ def batch_deduplicate_tiled_seqs(
     hh = h // tile_height
     ww = w // tile_width
     
-    # reshape to b x s x hh x ww x (tile_height*tile_width*c)
-    # batch must come first because this makes it possible to map
-    # the extracted tiles onto the compressed batch tensor later
-    seq_tiles = seqs.reshape(s, b, hh, tile_height, ww, tile_width, c)
-    seq_tiles = seq_tiles.transpose(1, 0, 2, 4, 3, 5, 6)
-    seq_tiles = seq_tiles.reshape(b, s, hh, ww, -1)
-    
-    # make the background
-    try:
-        background = background.reshape(
-            b, 1, hh, tile_height, ww, tile_width, c)
-        background = background.transpose(0, 1, 2, 4, 3, 5, 6)
-        background = background.reshape(b, 1, hh, ww, -1)
-    except AttributeError:
-        background = background * numpy.ones(
-            (b, 1, hh, ww, tile_height*tile_width*c), dtype=seq_tiles.dtype)
-    
-    # compute tiles that change
-    prev_tiles = numpy.concatenate((background, seq_tiles[:,:-1]), axis=1)
-    nonstatic_tiles = numpy.any(seq_tiles != prev_tiles, axis=-1)
+    # compute tiles that change, with batch first so that the extracted
+    # tiles can be mapped onto the compressed batch tensor later
+    nonstatic_tiles = batch_modified_tiles(
+        seqs, tile_height, tile_width, background=background, verify=verify)
+    nonstatic_tiles = nonstatic_tiles.transpose(1, 0, 2, 3)
     
     # get indices of changing tiles
     b_coord, s_coord, h_coord, w_coord = numpy.where(nonstatic_tiles)
@@ -193,17 +345,13 @@ def batch_deduplicate_tiled_seqs(
     h_coord = h_coord[nonpadded_indices]
     w_coord = w_coord[nonpadded_indices]
     
-    # extract the changing tiles
-    compressed_len = len(b_coord)
-    compressed_tiles = seq_tiles[b_coord, s_coord, h_coord, w_coord]
-    compressed_tiles = compressed_tiles.reshape(
-        compressed_len, tile_height, tile_width, c)
+    # extract the changing tiles straight from the frames
+    seq_tiles = seqs.reshape(s, b, hh, tile_height, ww, tile_width, c)
+    compressed_tiles = seq_tiles[s_coord, b_coord, h_coord, :, w_coord]
     
     # compute the coordinates for the tiles on the new padded grid
     # this time the padding is not based on the original frame sequences,
     # but on the lengths of the newly computed tile sequences
-    # the reason why the batch dimension must come first above, is so that
-    # b_coord will align properly with t_coord below
     batch_pad = numpy.bincount(b_coord, minlength=b)
     max_len = numpy.max(batch_pad)
     t_coord = numpy.concatenate([numpy.arange(cc) for cc in batch_pad])
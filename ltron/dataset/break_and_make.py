@@ -1,5 +1,7 @@
 import random
 import os
+import traceback
+import multiprocessing
 
 import numpy
 
@@ -8,12 +10,14 @@ import tqdm
 from splendor.contexts import egl
 
 import ltron.settings as settings
-from ltron.hierarchy import stack_numpy_hierarchies
+from ltron.hierarchy import TreeSpec
 from ltron.gym.envs.break_and_make_env import (
     BreakAndMakeEnv, BreakAndMakeEnvConfig)
 from ltron.plan.roadmap import Roadmap, PlannerTimeoutError
-from ltron.dataset.paths import get_dataset_info, get_dataset_paths
+from ltron.dataset.paths import get_dataset_info
 from ltron.geometry.collision import build_collision_map
+from ltron.dataset.columnar_episode import save_columnar_episode
+from ltron.dataset.episode_replay import save_action_episode
 
 class BreakAndMakeEpisodeConfig(BreakAndMakeEnvConfig):
     episodes_per_model = 1
@@ -34,6 +38,43 @@ class BreakAndMakeEpisodeConfig(BreakAndMakeEnvConfig):
     timeout = None
     
     allow_snap_flip = False
+    
+    # where the planner keeps edge observations while searching, 'memory',
+    # 'spill' or 'regenerate' (see ltron.plan.path_store), and how many env
+    # states it may hold at once (None for unbounded)
+    observation_storage = 'memory'
+    max_resident_states = None
+    
+    num_processes = 1
+    egl_devices = None
+    overwrite = False
+    
+    # 'npz', 'columnar' (see ltron.dataset.columnar_episode) or 'actions'
+    # (see ltron.dataset.episode_replay)
+    episode_format = 'npz'
+
+def parse_egl_devices(egl_devices):
+    # egl_devices may come from the command line as an int, a json list or
+    # a comma separated string
+    if egl_devices is None or egl_devices == '':
+        return None
+    if isinstance(egl_devices, int):
+        return [egl_devices]
+    if isinstance(egl_devices, str):
+        return [int(d) for d in egl_devices.split(',')]
+    return [int(d) for d in egl_devices]
+
+def episode_seed(seed, dataset_id, episode):
+    # a seed that only depends on the model and episode index, so results
+    # do not change with the number of processes or when resuming
+    return int(numpy.random.SeedSequence(
+        [seed, dataset_id, episode]).generate_state(1)[0])
+
+def get_episode_path(episode_path, model_path, episode):
+    file_name = os.path.basename(model_path)
+    file_name = file_name.replace('.mpd', '_%i.npz'%episode)
+    file_name = file_name.replace('.ldr', '_%i.npz'%episode)
+    return os.path.join(episode_path, file_name)
 
 def generate_episodes_for_dataset(config=None):
     if config is None:
@@ -42,43 +83,115 @@ def generate_episodes_for_dataset(config=None):
         config = BreakAndMakeEpisodeConfig.from_commandline()
     
     config.dataset_reset_mode = 'single_pass'
+    
+    episode_path = os.path.join(
+        settings.collections[config.collection], config.episode_directory)
+    if not os.path.exists(episode_path):
+        os.makedirs(episode_path)
+    
+    print('='*80)
+    print('Planning Plans')
+    size = config.num_processes
+    egl_devices = parse_egl_devices(config.egl_devices)
+    shard_args = []
+    for rank in range(size):
+        if egl_devices is None:
+            egl_device = config.egl_device
+        else:
+            egl_device = egl_devices[rank % len(egl_devices)]
+        shard_args.append((config, rank, size, egl_device))
+    
+    if size == 1:
+        summaries = [generate_episodes_for_shard(*shard_args[0])]
+    else:
+        # spawn rather than fork so that each worker creates its own EGL
+        # context from scratch
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(size) as pool:
+            summaries = pool.starmap(generate_episodes_for_shard, shard_args)
+    
+    summary = {
+        key : sum((s[key] for s in summaries), [])
+        for key in ('completed', 'skipped', 'errors', 'timeouts', 'final_r')
+    }
+    
+    print('='*80)
+    print('Completed: %i'%len(summary['completed']))
+    print('Skipped (already on disk): %i'%len(summary['skipped']))
+    if len(summary['final_r']):
+        print('Average final reward: %f'%(
+            sum(summary['final_r'])/len(summary['final_r'])))
+    
+    if len(summary['errors']):
+        print('Errors for items:')
+        for file_name, error in sorted(summary['errors']):
+            print('-'*80)
+            print(file_name)
+            print(error)
+    else:
+        print('No errors')
+    
+    if len(summary['timeouts']):
+        print('Timeout for items:')
+        print(sorted(summary['timeouts']))
+    
+    return summary
+
+def generate_episodes_for_shard(config, rank, size, egl_device=None):
     timeout = config.timeout
     if timeout is None:
         timeout = float('inf')
     
-    random.seed(config.seed)
-    numpy.random.seed(config.seed)
+    config.egl_device = egl_device
     
     dataset_info = get_dataset_info(config.dataset)
     shape_ids = dataset_info['shape_ids']
     color_ids = dataset_info['color_ids']
-    dataset_paths = get_dataset_paths(
-        config.dataset, config.split, config.subset)
     
     episode_path = os.path.join(
         settings.collections[config.collection], config.episode_directory)
-    if not os.path.exists(episode_path):
-        os.makedirs(episode_path)
-    
-    #num_models = len(dataset_paths['mpd'])
-    #if config.end is None:
-    #    end = num_models
-    #else:
-    #    end = config.end
     
     env = BreakAndMakeEnv(
-        config, rank=0, size=1, print_traceback=True)
+        config, rank=rank, size=size, print_traceback=True)
+    dataset_component = env.components['dataset']
+    dataset_paths = dataset_component.dataset_paths
     
-    print('='*80)
-    print('Planning Plans')
-    iterate = tqdm.tqdm(range(env.components['dataset'].length))
-    errors = []
-    timeout_i = []
-    final_rs = []
-    for i in iterate:
+    summary = {
+        'completed' : [],
+        'skipped' : [],
+        'errors' : [],
+        'timeouts' : [],
+        'final_r' : [],
+    }
+    # every episode from this env has the same observation and action
+    # structure, so the specs are compiled from the first one
+    observation_spec = None
+    action_spec = None
+    iterate = tqdm.tqdm(
+        enumerate(dataset_component.dataset_ids),
+        total=len(dataset_component.dataset_ids),
+        position=rank,
+    )
+    for i, dataset_id in iterate:
         for j in range(config.episodes_per_model):
-            #env = BreakAndMakeEnv(
-            #    config, rank=i, size=num_models, print_traceback=True)
+            path = get_episode_path(
+                episode_path, dataset_paths['mpd'][dataset_id], j)
+            file_name = os.path.basename(path)
+            if os.path.exists(path) and not config.overwrite:
+                summary['skipped'].append(file_name)
+                continue
+            
+            # point the dataset at this model, so that the reset below loads
+            # it regardless of which episodes were skipped
+            dataset_component.set_state({
+                'initialized' : True,
+                'finished' : False,
+                'episode_id' : i-1,
+                'dataset_id' : dataset_id,
+            })
+            seed = episode_seed(config.seed, dataset_id, j)
+            random.seed(seed)
+            numpy.random.seed(seed)
             first_observation = env.reset()
             
             try:
@@ -90,47 +203,50 @@ def generate_episodes_for_dataset(config=None):
                         split_cursor_actions=config.split_cursor_actions,
                         allow_snap_flip=config.allow_snap_flip,
                         timeout = timeout,
+                        observation_storage=config.observation_storage,
+                        max_resident_states=config.max_resident_states,
                     )
-                    final_r = r[-1]
-                    final_rs.append(final_r)
+                    summary['final_r'].append(r[-1])
                 except PlannerTimeoutError:
-                    timeout_i.append(i)
+                    summary['timeouts'].append(file_name)
                     continue
                 
-                o = stack_numpy_hierarchies(*o)
-                a = stack_numpy_hierarchies(*a)
+                if observation_spec is None:
+                    observation_spec = TreeSpec(o[0])
+                    action_spec = TreeSpec(a[0])
+                o = observation_spec.stack(*o)
+                a = action_spec.stack(*a)
                 r = numpy.array(r)
                 
-                file_name = os.path.basename(dataset_paths['mpd'][i])
-                file_name = file_name.replace('.mpd', '_%i.npz'%j)
-                file_name = file_name.replace('.ldr', '_%i.npz'%j)
-                path = os.path.join(episode_path, file_name)
                 episode = {'observations':o, 'actions':a, 'reward':r}
-                numpy.savez_compressed(path, episode=episode)
+                # write then rename so an interrupted run never leaves a
+                # partial episode that would be skipped on resume
+                if config.episode_format == 'columnar':
+                    save_columnar_episode(path, episode)
+                elif config.episode_format == 'actions':
+                    save_action_episode(path, dataset_id, seed, a, r)
+                else:
+                    tmp_path = path.replace('.npz', '.tmp.npz')
+                    numpy.savez_compressed(tmp_path, episode=episode)
+                    os.replace(tmp_path, path)
+                summary['completed'].append(file_name)
             except KeyboardInterrupt:
                 raise
             except:
                 if config.error_handling == 'count':
-                    errors.append(i)
+                    summary['errors'].append(
+                        (file_name, traceback.format_exc()))
                 else:
                     raise
         
-        if len(final_rs):
-            avg_final_r = sum(final_rs)/len(final_rs)
+        if len(summary['final_r']):
+            avg_final_r = sum(summary['final_r'])/len(summary['final_r'])
         else:
             avg_final_r = 0.
         iterate.set_description('Errors: %i, Timeout: %i, R: %f'%(
-            len(errors), len(timeout_i), avg_final_r))
+            len(summary['errors']), len(summary['timeouts']), avg_final_r))
     
-    if len(errors):
-        print('Errors for items:')
-        print(errors)
-    else:
-        print('No errors')
-    
-    if len(timeout_i):
-        print('Timeout for items:')
-        print(timeout_i)
+    return summary
 
 def plan_break_and_make(
     env,
@@ -141,6 +257,8 @@ def plan_break_and_make(
     split_cursor_actions=False,
     allow_snap_flip=False,
     timeout=float('inf'),
+    observation_storage='memory',
+    max_resident_states=None,
 ):
     # get the full and empty assemblies
     full_assembly = observation['table_assembly']
@@ -176,6 +294,8 @@ def plan_break_and_make(
         target_steps_per_view_change=target_steps_per_view_change,
         split_cursor_actions=split_cursor_actions,
         allow_snap_flip=allow_snap_flip,
+        observation_storage=observation_storage,
+        max_resident_states=max_resident_states,
     )
     break_path = break_roadmap.plan(timeout=timeout)
     o, a, r = break_roadmap.get_observation_action_reward_seq(
@@ -216,6 +336,8 @@ def plan_break_and_make(
         target_steps_per_view_change=target_steps_per_view_change,
         split_cursor_actions=split_cursor_actions,
         allow_snap_flip=allow_snap_flip,
+        observation_storage=observation_storage,
+        max_resident_states=max_resident_states,
     )
     make_path = make_roadmap.plan(timeout=timeout)
     o, a, r = make_roadmap.get_observation_action_reward_seq(
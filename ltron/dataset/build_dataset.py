@@ -6,10 +6,38 @@ import glob
 import tqdm
 
 from ltron.bricks.brick_scene import BrickScene
+from ltron.dataset.map_reduce import map_reduce, print_errors
+from ltron.exceptions import LtronException
 
 random.seed(141414)
 
-def build_metadata(name, path_root, test_percent):
+def scene_metadata(path):
+    scene = BrickScene(track_snaps=True)
+    scene.import_ldraw(path)
+    edges = scene.get_assembly_edges(unidirectional=False)
+    return {
+        'brick_names' : set(scene.shape_library.keys()),
+        'color_names' : set(scene.color_library.keys()),
+        'num_instances' : len(scene.instances),
+        'num_edges' : edges.shape[1],
+    }
+
+def add_scene_metadata(total, path, scene_metadata):
+    total['brick_names'] |= scene_metadata['brick_names']
+    total['color_names'] |= scene_metadata['color_names']
+    total['num_instances'] = max(
+        total['num_instances'], scene_metadata['num_instances'])
+    total['num_edges'] = max(
+        total['num_edges'], scene_metadata['num_edges'])
+    return total
+
+def build_metadata(
+    name,
+    path_root,
+    test_percent,
+    num_processes=1,
+    checkpoint_path=None,
+):
     metadata = {}
     mpds = glob.glob(os.path.join(path_root, 'ldraw', '*.mpd'))
     num_test = round(len(mpds) * test_percent)
@@ -20,24 +48,27 @@ def build_metadata(name, path_root, test_percent):
         'test':'{%s}/ldraw/*.mpd[%i:]'%(name, num_train),
     }
     
-    max_instances_per_scene = 0
-    max_edges_per_scene = 0
-    all_brick_names = set()
-    all_color_names = set()
-    for mpd in tqdm.tqdm(mpds):
-        scene = BrickScene(track_snaps=True)
-        scene.import_ldraw(mpd)
-        brick_names = set(scene.shape_library.keys())
-        all_brick_names |= brick_names
-        color_names = set(scene.color_library.keys())
-        all_color_names |= color_names
-        
-        num_instances = len(scene.instances)
-        max_instances_per_scene = max(num_instances, max_instances_per_scene)
-        
-        edges = scene.get_assembly_edges(unidirectional=False)
-        num_edges = edges.shape[1]
-        max_edges_per_scene = max(num_edges, max_edges_per_scene)
+    total, errors = map_reduce(
+        mpds,
+        scene_metadata,
+        add_scene_metadata,
+        {
+            'brick_names' : set(),
+            'color_names' : set(),
+            'num_instances' : 0,
+            'num_edges' : 0,
+        },
+        num_processes=num_processes,
+        checkpoint_path=checkpoint_path,
+    )
+    if errors:
+        print_errors(errors)
+        raise LtronException('Unable to load %i scenes'%len(errors))
+    
+    max_instances_per_scene = total['num_instances']
+    max_edges_per_scene = total['num_edges']
+    all_brick_names = total['brick_names']
+    all_color_names = total['color_names']
     
     metadata['max_instances_per_scene'] = max_instances_per_scene
     metadata['max_edges_per_scene'] = max_edges_per_scene
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+import os
+import io
+import json
+import glob
+import zipfile
+import argparse
+
+import numpy
+
+import tqdm
+
+from ltron.hierarchy import flatten_hierarchy, unflatten_hierarchy
+
+'''
+Columnar episodes store each leaf of an episode hierarchy as its own typed
+array, split along the step axis into chunks.  The file is a zip archive
+with one .npy member per chunk named "<key path>/<chunk index>.npy" and a
+"metadata.json" member, so readers only decompress the keys and steps they
+actually use.
+
+Because every member is a .npy file, numpy.load can also open these files
+directly as an NpzFile.
+'''
+
+metadata_name = 'metadata.json'
+columnar_version = 1
+default_chunk_size = 64
+
+def chunk_name(key, chunk):
+    return '%s/%06i.npy'%(key, chunk)
+
+def save_columnar_episode(
+    path,
+    episode,
+    chunk_size=default_chunk_size,
+    compress=True,
+):
+    flat_episode = flatten_hierarchy(episode)
+    if compress:
+        compression = zipfile.ZIP_DEFLATED
+    else:
+        compression = zipfile.ZIP_STORED
+
+    metadata = {
+        'version' : columnar_version,
+        'chunk_size' : chunk_size,
+        'keys' : {},
+    }
+    tmp_path = path + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', compression=compression) as z:
+        for key, value in flat_episode.items():
+            value = numpy.asarray(value)
+            if value.dtype == object:
+                raise ValueError(
+                    'Cannot store object array "%s" in a columnar episode'%key)
+            if value.ndim == 0:
+                chunks = [value]
+            else:
+                chunks = [
+                    value[i:i+chunk_size]
+                    for i in range(0, max(len(value), 1), chunk_size)
+                ]
+            for i, chunk in enumerate(chunks):
+                with z.open(chunk_name(key, i), 'w', force_zip64=True) as f:
+                    numpy.lib.format.write_array(
+                        f,
+                        numpy.require(chunk, requirements='C'),
+                        allow_pickle=False,
+                    )
+            metadata['keys'][key] = {
+                'shape' : list(value.shape),
+                'dtype' : value.dtype.str,
+                'num_chunks' : len(chunks),
+            }
+
+        z.writestr(metadata_name, json.dumps(metadata))
+
+    os.replace(tmp_path, path)
+
+class ColumnarEpisode:
+    '''
+    Lazy reader for columnar episodes.  Indexing with a key path returns the
+    full array for a leaf, or another lazy ColumnarEpisode for a branch:
+
+    episode = ColumnarEpisode(path)
+    actions = episode['actions'].load()
+    color = episode['observations/table_color_render'][10:20]
+    '''
+    def __init__(self, path, prefix='', zip_file=None, metadata=None):
+        self.path = path
+        self.prefix = prefix
+        if zip_file is None:
+            zip_file = zipfile.ZipFile(path, 'r')
+            metadata = json.loads(zip_file.read(metadata_name))
+            if metadata['version'] != columnar_version:
+                raise ValueError(
+                    'Unsupported columnar episode version %s: %s'%(
+                        metadata['version'], path))
+        self.zip_file = zip_file
+        self.metadata = metadata
+
+    def close(self):
+        self.zip_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def full_key(self, key):
+        if self.prefix:
+            return '%s/%s'%(self.prefix, key)
+        return key
+
+    def leaf_keys(self):
+        if not self.prefix:
+            return list(self.metadata['keys'].keys())
+        start = self.prefix + '/'
+        return [
+            key[len(start):] for key in self.metadata['keys']
+            if key.startswith(start)
+        ]
+
+    def keys(self):
+        return list(dict.fromkeys(
+            key.split('/')[0] for key in self.leaf_keys()))
+
+    def __contains__(self, key):
+        full_key = self.full_key(key)
+        return full_key in self.metadata['keys'] or any(
+            k.startswith(full_key + '/') for k in self.metadata['keys'])
+
+    def __len__(self):
+        # number of steps, taken from the first leaf
+        for key in self.leaf_keys():
+            shape = self.metadata['keys'][self.full_key(key)]['shape']
+            if len(shape):
+                return shape[0]
+        return 0
+
+    def shape(self, key):
+        return tuple(self.metadata['keys'][self.full_key(key)]['shape'])
+
+    def read_chunk(self, full_key, chunk):
+        with self.zip_file.open(chunk_name(full_key, chunk)) as f:
+            return numpy.lib.format.read_array(
+                io.BytesIO(f.read()), allow_pickle=False)
+
+    def read_leaf(self, full_key, steps=None):
+        entry = self.metadata['keys'][full_key]
+        if not len(entry['shape']):
+            return self.read_chunk(full_key, 0)
+
+        chunk_size = self.metadata['chunk_size']
+        if steps is None:
+            steps = slice(None)
+        if isinstance(steps, slice):
+            start, stop, step = steps.indices(entry['shape'][0])
+            if step != 1:
+                return self.read_leaf(full_key)[steps]
+            if stop <= start:
+                return numpy.zeros(
+                    (0, *entry['shape'][1:]),
+                    dtype=numpy.dtype(entry['dtype']),
+                )
+            first_chunk = start // chunk_size
+            last_chunk = (stop - 1) // chunk_size
+            chunks = [
+                self.read_chunk(full_key, c)
+                for c in range(first_chunk, last_chunk+1)
+            ]
+            data = numpy.concatenate(chunks, axis=0)
+            offset = first_chunk * chunk_size
+            return data[start-offset:stop-offset]
+        else:
+            # integer or array index, only read the chunks that are needed
+            indices = numpy.arange(entry['shape'][0])[steps]
+            scalar = numpy.ndim(indices) == 0
+            indices = numpy.atleast_1d(indices)
+            chunk_ids = indices // chunk_size
+            result = numpy.zeros(
+                (len(indices), *entry['shape'][1:]),
+                dtype=numpy.dtype(entry['dtype']),
+            )
+            for c in numpy.unique(chunk_ids):
+                chunk = self.read_chunk(full_key, int(c))
+                where = chunk_ids == c
+                result[where] = chunk[indices[where] - c * chunk_size]
+            if scalar:
+                return result[0]
+            return result
+
+    def load(self, keys=None, steps=None):
+        '''
+        Loads a nested dictionary of arrays.  If keys is specified, only
+        those key paths (relative to this branch) are read.  If steps is
+        specified, only those steps of each leaf are read.
+        '''
+        if keys is None:
+            keys = ['']
+        flat = {}
+        for key in keys:
+            full_key = self.full_key(key) if key else self.prefix
+            if full_key in self.metadata['keys']:
+                flat[key] = self.read_leaf(full_key, steps)
+                continue
+            start = full_key + '/' if full_key else ''
+            leaves = [k for k in self.metadata['keys'] if k.startswith(start)]
+            if not leaves:
+                raise KeyError(key)
+            for leaf in leaves:
+                local_key = leaf[len(self.prefix)+1:] if self.prefix else leaf
+                flat[local_key] = self.read_leaf(leaf, steps)
+
+        return unflatten_hierarchy(flat)
+
+    def __getitem__(self, key):
+        full_key = self.full_key(key)
+        if full_key in self.metadata['keys']:
+            return LazyColumn(self, full_key)
+        if key in self:
+            return ColumnarEpisode(
+                self.path,
+                prefix=full_key,
+                zip_file=self.zip_file,
+                metadata=self.metadata,
+            )
+        raise KeyError(key)
+
+class LazyColumn:
+    def __init__(self, episode, full_key):
+        self.episode = episode
+        self.full_key = full_key
+        entry = episode.metadata['keys'][full_key]
+        self.shape = tuple(entry['shape'])
+        self.dtype = numpy.dtype(entry['dtype'])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, steps):
+        return self.episode.read_leaf(self.full_key, steps)
+
+    def __array__(self, dtype=None):
+        data = self.episode.read_leaf(self.full_key)
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+def load_episode_keys(path, observation_keys=(), other_keys=('actions',)):
+    '''
+    Dataloader helper: reads only the actions (or other_keys) and the
+    selected observation keys from a columnar episode.
+    '''
+    keys = list(other_keys) + [
+        'observations/%s'%key for key in observation_keys]
+    with ColumnarEpisode(path) as episode:
+        return episode.load(keys)
+
+def convert_npz_episode(
+    npz_path,
+    columnar_path,
+    chunk_size=default_chunk_size,
+    compress=True,
+):
+    data = numpy.load(npz_path, allow_pickle=True)
+    episode = data['episode'].item()
+    save_columnar_episode(
+        columnar_path, episode, chunk_size=chunk_size, compress=compress)
+
+def convert_npz_episodes(
+    episode_directory,
+    output_directory,
+    chunk_size=default_chunk_size,
+    compress=True,
+    overwrite=False,
+):
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    npz_paths = sorted(glob.glob(os.path.join(episode_directory, '*.npz')))
+    for npz_path in tqdm.tqdm(npz_paths):
+        columnar_path = os.path.join(
+            output_directory, os.path.basename(npz_path))
+        if os.path.exists(columnar_path) and not overwrite:
+            continue
+        convert_npz_episode(
+            npz_path,
+            columnar_path,
+            chunk_size=chunk_size,
+            compress=compress,
+        )
+
+parser = argparse.ArgumentParser()
+parser.add_argument('episode_directory', type=str)
+parser.add_argument('output_directory', type=str)
+parser.add_argument('--chunk-size', type=int, default=default_chunk_size)
+parser.add_argument('--no-compress', action='store_true')
+parser.add_argument('--overwrite', action='store_true')
+
+def main():
+    args = parser.parse_args()
+    convert_npz_episodes(
+        os.path.expanduser(args.episode_directory),
+        os.path.expanduser(args.output_directory),
+        chunk_size=args.chunk_size,
+        compress=not args.no_compress,
+        overwrite=args.overwrite,
+    )
+
+if __name__ == '__main__':
+    main()
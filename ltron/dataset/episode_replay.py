@@ -0,0 +1,135 @@
+import copy
+import random
+import multiprocessing
+
+import numpy
+
+from ltron.hierarchy import TreeSpec
+from ltron.dataset.columnar_episode import (
+    save_columnar_episode, ColumnarEpisode)
+
+'''
+Action-only episodes store the dataset id, the seed used before env.reset and
+the action sequence.  Every observation is a deterministic function of these,
+so they can be regenerated on demand by EpisodeReplay, at any render
+resolution, instead of being stored.
+'''
+
+def save_action_episode(path, dataset_id, seed, actions, rewards):
+    episode = {
+        'dataset_id' : numpy.array(dataset_id),
+        'seed' : numpy.array(seed, dtype=numpy.int64),
+        'actions' : actions,
+        'reward' : numpy.asarray(rewards),
+    }
+    save_columnar_episode(path, episode)
+
+def load_action_episode(path):
+    with ColumnarEpisode(path) as episode:
+        data = episode.load(['dataset_id', 'seed', 'actions', 'reward'])
+    data['dataset_id'] = int(data['dataset_id'])
+    data['seed'] = int(data['seed'])
+    return data
+
+class EpisodeReplay:
+    '''
+    Regenerates the observations of action-only episodes with a
+    BreakAndMakeEnv.  The env config should match the one the episodes were
+    generated with, except for render settings, which may differ.
+    '''
+    def __init__(self, config):
+        # imported here so that reading episodes does not require gym
+        from ltron.gym.envs.break_and_make_env import BreakAndMakeEnv
+        config = copy.copy(config)
+        config.dataset_reset_mode = 'single_pass'
+        self.env = BreakAndMakeEnv(config, rank=0, size=1)
+        self.dataset_component = self.env.components['dataset']
+
+        # the env's actions and observations have a fixed structure, so the
+        # specs are compiled once, the observation specs once for each
+        # selection of observation_keys
+        self.action_spec = None
+        self.observation_specs = {}
+
+    def replay(self, episode, observation_keys=None):
+        '''
+        Returns the stacked observations preceding each action, in the same
+        layout as the stored observations of a full episode.  If
+        observation_keys is specified, only those top level observation keys
+        are kept.
+        '''
+        if isinstance(episode, str):
+            episode = load_action_episode(episode)
+
+        self.dataset_component.set_state({
+            'initialized' : True,
+            'finished' : False,
+            'episode_id' : -1,
+            'dataset_id' : episode['dataset_id'],
+        })
+        # single_pass mode indexes dataset_ids by episode_id
+        self.dataset_component.dataset_ids = [episode['dataset_id']]
+
+        random.seed(episode['seed'])
+        numpy.random.seed(episode['seed'])
+
+        def select(observation):
+            if observation_keys is None:
+                return observation
+            return {key : observation[key] for key in observation_keys}
+
+        observation = self.env.reset()
+        observations = [select(observation)]
+        actions = episode['actions']
+        if self.action_spec is None:
+            self.action_spec = TreeSpec(actions)
+        num_actions = self.action_spec.len(actions)
+        for i in range(num_actions - 1):
+            action = self.action_spec.index(actions, i)
+            observation, reward, terminal, info = self.env.step(action)
+            observations.append(select(observation))
+
+        if observation_keys is None:
+            spec_key = None
+        else:
+            spec_key = tuple(observation_keys)
+        if spec_key not in self.observation_specs:
+            self.observation_specs[spec_key] = TreeSpec(observations[0])
+        return self.observation_specs[spec_key].stack(*observations)
+
+    def replay_batch(self, episodes, observation_keys=None):
+        return [
+            self.replay(episode, observation_keys=observation_keys)
+            for episode in episodes
+        ]
+
+def replay_worker(config, episodes, observation_keys):
+    replay = EpisodeReplay(config)
+    return replay.replay_batch(episodes, observation_keys=observation_keys)
+
+def replay_episodes(
+    config,
+    episodes,
+    observation_keys=None,
+    num_processes=1,
+):
+    '''
+    Regenerates observations for many episodes, optionally spread across
+    num_processes spawned workers, each with its own env and EGL context.
+    Results are returned in the same order as episodes.
+    '''
+    if num_processes == 1:
+        return replay_worker(config, episodes, observation_keys)
+
+    shards = [episodes[rank::num_processes] for rank in range(num_processes)]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(num_processes) as pool:
+        shard_results = pool.starmap(
+            replay_worker,
+            [(config, shard, observation_keys) for shard in shards],
+        )
+
+    results = [None] * len(episodes)
+    for rank, shard_result in enumerate(shard_results):
+        results[rank::num_processes] = shard_result
+    return results
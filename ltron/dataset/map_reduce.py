@@ -0,0 +1,138 @@
+import os
+import pickle
+import traceback
+import multiprocessing
+
+import tqdm
+
+'''
+A process-parallel map-reduce runner for the dataset maintenance passes that
+load every file in a collection.
+
+mapper(path) is called once per path in a worker process and should return a
+picklable result.  Workers live for the whole run, so the shared LDraw
+reference table and the BrickShape registry stay warm from one file to the
+next.  reducer(total, path, result) merges each result into the running total
+in the parent process and returns the new total.  Results arrive in
+completion order, so reducers should not depend on the order of paths.
+
+If checkpoint_path is given, the result of each path is appended to a log
+there, and a later run with the same checkpoint_path replays the log through
+the reducer and skips the finished paths.  Only the new results are written,
+so checkpointing stays linear in the number of paths even when the total
+grows.  The log is flushed every checkpoint_every paths.
+
+mapper and reducer must be importable module-level functions (or
+functools.partial objects wrapping them) because workers are spawned rather
+than forked.  Forked workers would share the open LDraw zip file handles
+with the parent.
+'''
+
+def map_path(mapper, path):
+    try:
+        return path, mapper(path), None
+    except KeyboardInterrupt:
+        raise
+    except:
+        return path, None, traceback.format_exc()
+
+def map_path_star(args):
+    return map_path(*args)
+
+def load_checkpoint(checkpoint_path, reducer, initial):
+    '''
+    Replays the (path, result, error) records in the log at checkpoint_path.
+    A partially written final record from an interrupted run is truncated so
+    that new records can be appended after the valid ones.
+    '''
+    total, finished, errors = initial, set(), {}
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return total, finished, errors
+
+    with open(checkpoint_path, 'r+b') as f:
+        valid_end = 0
+        while True:
+            try:
+                path, result, error = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError, ValueError):
+                break
+            if error is None:
+                total = reducer(total, path, result)
+            else:
+                errors[path] = error
+            finished.add(path)
+            valid_end = f.tell()
+        f.truncate(valid_end)
+
+    return total, finished, errors
+
+def map_reduce(
+    paths,
+    mapper,
+    reducer,
+    initial,
+    num_processes=1,
+    checkpoint_path=None,
+    checkpoint_every=64,
+    description=None,
+):
+    '''
+    Returns the reduced total and a dictionary mapping each path whose mapper
+    raised an exception to its traceback.  Failed paths are not retried when
+    resuming from a checkpoint.
+    '''
+    total, finished, errors = load_checkpoint(
+        checkpoint_path, reducer, initial)
+    todo = [path for path in paths if path not in finished]
+
+    iterate = tqdm.tqdm(total=len(paths), initial=len(paths)-len(todo))
+    if description is not None:
+        iterate.set_description(description)
+
+    def results():
+        if num_processes == 1:
+            for path in todo:
+                yield map_path(mapper, path)
+        else:
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(num_processes) as pool:
+                yield from pool.imap_unordered(
+                    map_path_star,
+                    [(mapper, path) for path in todo],
+                )
+
+    if checkpoint_path is not None:
+        checkpoint = open(checkpoint_path, 'ab')
+    since_checkpoint = 0
+    try:
+        for path, result, error in results():
+            if error is None:
+                total = reducer(total, path, result)
+            else:
+                errors[path] = error
+            finished.add(path)
+            iterate.update(1)
+
+            if checkpoint_path is not None:
+                pickle.dump(
+                    (path, result, error),
+                    checkpoint,
+                    pickle.HIGHEST_PROTOCOL,
+                )
+                since_checkpoint += 1
+                if since_checkpoint >= checkpoint_every:
+                    checkpoint.flush()
+                    since_checkpoint = 0
+    finally:
+        if checkpoint_path is not None:
+            checkpoint.close()
+
+    iterate.close()
+
+    return total, errors
+
+def print_errors(errors):
+    for path, error in sorted(errors.items()):
+        print('-'*80)
+        print('Error while processing: %s'%path)
+        print(error)
@@ -1,14 +1,20 @@
 from pathlib import Path
+from functools import partial
 
 from ltron.bricks.brick_scene import BrickScene
 from ltron.dataset.submodel_extraction import blacklist_computation
+from ltron.dataset.map_reduce import map_reduce
 import json
 import os
 
-import tqdm
-
 def blacklist_out(
-    directory, dest, blacklist_dest, threshold=400, blacklist=None):
+    directory,
+    dest,
+    blacklist_dest,
+    threshold=400,
+    blacklist=None,
+    num_processes=1,
+):
     
     if blacklist is None:
         blacklist = []
@@ -18,30 +24,31 @@ def blacklist_out(
         with open(blacklist_path) as f:
             blacklist = blacklist + json.load(f)
     else:
-        blacklist = blacklist + blacklist_computation(threshold)
+        blacklist = blacklist + blacklist_computation(
+            threshold, num_processes=num_processes)
     with open(blacklist_path, 'w') as f:
         json.dump(blacklist, f)
     path = Path(directory).expanduser()
-    modelList = list(path.rglob('*'))
+    modelList = [str(model) for model in path.rglob('*')]
     print('-'*80)
     print('Removing Blacklisted Bricks From Scenes')
-    for model in tqdm.tqdm(modelList):
-        model = str(model)
-        try:
-            scene = BrickScene(track_snaps=False)
-            scene.import_ldraw(model)
-        except:
-            print("Can't open: " + model + " during blacklisting")
-            continue
+    _, errors = map_reduce(
+        modelList,
+        partial(blacklist_model, dest=dest, blacklist=set(blacklist)),
+        count_models,
+        0,
+        num_processes=num_processes,
+    )
+    for model in sorted(errors):
+        print("Can't open: " + model + " during blacklisting")
+
+def blacklist_model(model, dest, blacklist):
+    scene = BrickScene(track_snaps=False)
+    scene.import_ldraw(model)
+
+    model_name = model.split("/")[-1]
+    keep = [i+1 for i in range(len(scene.instances)) if scene.instances.instances[i+1].brick_shape.reference_name not in blacklist]
+    scene.export_ldraw(dest + model_name, instances=keep)
 
-        model_name = model.split("/")[-1]
-        keep = [i+1 for i in range(len(scene.instances)) if scene.instances.instances[i+1].brick_shape.reference_name not in blacklist]
-        # for i in range(len(scene.instances)):
-        #     try:
-        #         if scene.instances.instances[i+1].brick_shape.reference_name in blacklist:
-        #             scene.remove_instance(i+1)
-        #     except:
-        #         print(scene.instances.instances)
-        #         print(i)
-        #         print(scene.instances.instances[i+1].brick_shape)
-        scene.export_ldraw(dest + model_name, instances=keep)
+def count_models(total, model, result):
+    return total + 1
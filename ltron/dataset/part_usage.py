@@ -1,40 +1,29 @@
 #!/usr/bin/env python
 import os
 import json
+import argparse
 
 import numpy
 
-import tqdm
-
 import ltron.settings as settings
 from ltron.bricks.brick_scene import BrickScene
+from ltron.dataset.map_reduce import map_reduce
 
-omr_ldraw_directory = os.path.join(settings.paths['omr'], 'ldraw')
-
-file_names = list(sorted(os.listdir(omr_ldraw_directory)))
-
-path_data = {}
-
-for file_name in tqdm.tqdm(file_names):
-    path = os.path.join(omr_ldraw_directory, file_name)
+def scene_part_usage(path):
     scene = BrickScene(track_snaps=True)
-    try:
-        scene.import_ldraw(path)
-    except:
-        print('Unable to load path: %s'%path)
-        continue
+    scene.import_ldraw(path)
 
-    path_data[file_name] = {}
+    path_data = {}
 
-    path_data[file_name]['brick_counts'] = {}
+    path_data['brick_counts'] = {}
     for instance_id, instance in scene.instances.items():
         brick_shape = str(instance.brick_shape)
-        if brick_shape not in path_data[file_name]['brick_counts']:
-            path_data[file_name]['brick_counts'][brick_shape] = 0
-        path_data[file_name]['brick_counts'][brick_shape] += 1
+        if brick_shape not in path_data['brick_counts']:
+            path_data['brick_counts'][brick_shape] = 0
+        path_data['brick_counts'][brick_shape] += 1
 
     edges = scene.get_assembly_edges(unidirectional=True)
-    path_data[file_name]['edge_data'] = {}
+    path_data['edge_data'] = {}
     for a, b in edges.T:
         instance_a = scene.instances[a]
         brick_shape_a = str(instance_a.brick_shape)
@@ -47,10 +36,44 @@ for file_name in tqdm.tqdm(file_names):
         ab = numpy.dot(numpy.linalg.inv(transform_a), transform_b)
 
         edge_string = '%s,%s'%(brick_shape_a, brick_shape_b)
-        if edge_string not in path_data[file_name]['edge_data']:
-            path_data[file_name]['edge_data'][edge_string] = []
-        path_data[file_name]['edge_data'][edge_string].append(ab.tolist())
+        if edge_string not in path_data['edge_data']:
+            path_data['edge_data'][edge_string] = []
+        path_data['edge_data'][edge_string].append(ab.tolist())
+
+    return path_data
+
+def add_part_usage(path_data, path, scene_data):
+    path_data[os.path.basename(path)] = scene_data
+    return path_data
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--num-processes', type=int, default=1)
+parser.add_argument('--checkpoint', type=str, default=None)
+
+def main():
+    args = parser.parse_args()
+
+    omr_ldraw_directory = os.path.join(settings.paths['omr'], 'ldraw')
+    paths = [
+        os.path.join(omr_ldraw_directory, file_name)
+        for file_name in sorted(os.listdir(omr_ldraw_directory))
+    ]
+
+    path_data, errors = map_reduce(
+        paths,
+        scene_part_usage,
+        add_part_usage,
+        {},
+        num_processes=args.num_processes,
+        checkpoint_path=args.checkpoint,
+    )
+    for path in sorted(errors):
+        print('Unable to load path: %s'%path)
 
-with open(os.path.join(settings.paths['omr'], 'scene_data.json'), 'w') as f:
-    json.dump(path_data, f, indent=2)
+    path_data = {
+        file_name : path_data[file_name] for file_name in sorted(path_data)}
+    with open(os.path.join(settings.paths['omr'], 'scene_data.json'), 'w') as f:
+        json.dump(path_data, f, indent=2)
 
+if __name__ == '__main__':
+    main()
@@ -50,25 +50,31 @@ def get_subset_slice(subset):
         s = subset
     return slice(*s)
 
-def process_file_paths(file_paths, subset=None, rank=0, size=1):
-    file_paths = file_paths.split(',')
+def parse_file_path(file_path):
+    file_path = file_path.format(**settings.collections)
+    file_path, subdocument = resolve_subdocument(file_path)
+    if '[' in file_path:
+        file_path, path_slice = file_path.split('[')
+        path_slice = path_slice.replace(']', '').split(':')
+        path_slice = [None if s == '' else int(s) for s in path_slice]
+        path_slice = slice(*path_slice)
+    else:
+        path_slice = slice(None)
+    
+    return file_path, path_slice, subdocument
+
+def glob_file_paths(file_paths):
     all_file_paths = []
-    for file_path in file_paths:
-        file_path = file_path.format(**settings.collections)
-        file_path, subdocument = resolve_subdocument(file_path)
-        if '[' in file_path:
-            file_path, path_slice = file_path.split('[')
-            path_slice = path_slice.replace(']', '').split(':')
-            path_slice = [None if s == '' else int(s) for s in path_slice]
-            path_slice = slice(*path_slice)
-        else:
-            path_slice = slice(None)
-        
+    for file_path in file_paths.split(','):
+        file_path, path_slice, subdocument = parse_file_path(file_path)
         file_paths = sorted(glob.glob(file_path))[path_slice]
         if subdocument is not None:
             file_paths = ['%s#%s'%(fp, subdocument) for fp in file_paths]
         all_file_paths.extend(file_paths)
     
+    return all_file_paths
+
+def select_file_paths(all_file_paths, subset=None, rank=0, size=1):
     if subset is not None:
         #if isinstance(subset, int):
         #    path_subset = (subset,)
@@ -80,12 +86,208 @@ def process_file_paths(file_paths, subset=None, rank=0, size=1):
     paths = all_file_paths[rank::size]
     return numpy.array(paths, dtype=object)
 
-def get_dataset_paths(dataset, split_name, subset=None, rank=0, size=1):
+def process_file_paths(file_paths, subset=None, rank=0, size=1):
+    all_file_paths = glob_file_paths(file_paths)
+    return select_file_paths(
+        all_file_paths, subset=subset, rank=rank, size=size)
+
+# dataset path index ===========================================================
+'''
+Resolving the split globs of a large dataset directory (especially on a
+network mount) is slow, and every env worker does it on startup.  The path
+index stores the resolved split globs of a dataset next to its json file as
+"<dataset>.index.json":
+
+files : the sorted list of matched files with their size and mtime
+leaves : for each glob string in the splits, the (file id, subdocument)
+    pairs it resolves to
+splits : the sorted file ids that belong to each split
+directories : the mtime of every directory the globs searched, including
+    the parents of wildcard directories (see glob_directories)
+
+The index is valid as long as the dataset json and the searched directories
+have not been modified since it was built (adding, removing or renaming a
+file updates the mtime of its directory), so checking it only takes a few
+stat calls.  Stale indices are rebuilt automatically.
+'''
+
+index_version = 1
+dataset_indices = {}
+
+def get_dataset_index_path(dataset):
+    dataset_path = os.path.expanduser(settings.datasets[dataset])
+    return os.path.splitext(dataset_path)[0] + '.index.json'
+
+def get_directory_mtimes(directories):
+    mtimes = {}
+    for directory in directories:
+        try:
+            mtimes[directory] = os.stat(directory).st_mtime
+        except FileNotFoundError:
+            mtimes[directory] = None
+    return mtimes
+
+def glob_directories(file_path):
+    '''
+    Returns every directory whose contents a glob of file_path depends on:
+    the parent of each wildcard directory component, every directory matched
+    along the way and the directories the files are matched in.  A new match
+    anywhere in the glob changes the mtime of one of these.
+    '''
+    directory = os.path.dirname(file_path)
+    parts = directory.split(os.sep)
+    prefixes = [
+        os.sep.join(parts[:i]) for i, part in enumerate(parts)
+        if glob.has_magic(part)
+    ]
+    prefixes.append(directory)
+    
+    directories = set()
+    for prefix in prefixes:
+        prefix = prefix or (os.sep if directory.startswith(os.sep) else '.')
+        if glob.has_magic(prefix):
+            directories.update(
+                d for d in glob.glob(prefix) if os.path.isdir(d))
+        else:
+            directories.add(prefix)
+    
+    return directories
+
+def build_dataset_index(dataset):
+    dataset_path = os.path.expanduser(settings.datasets[dataset])
+    dataset_mtime = os.stat(dataset_path).st_mtime
+    splits = get_dataset_info(dataset)['splits']
+    
+    file_ids = {}
+    directories = set()
+    split_leaves = {}
+    
+    def index_leaf(file_paths):
+        leaf = []
+        for file_path in file_paths.split(','):
+            file_path, path_slice, subdocument = parse_file_path(file_path)
+            matches = sorted(glob.glob(file_path))
+            directories.update(glob_directories(file_path))
+            for match in matches[path_slice]:
+                file_id = file_ids.setdefault(match, len(file_ids))
+                leaf.append((file_id, subdocument))
+        return leaf
+    
+    for split_name, split in splits.items():
+        leaves = {}
+        def index_split_leaf(file_paths):
+            if file_paths not in leaves:
+                leaves[file_paths] = index_leaf(file_paths)
+            return None
+        map_hierarchies(index_split_leaf, split)
+        split_leaves[split_name] = leaves
+    
+    # renumber the files in sorted order
+    file_paths = sorted(file_ids)
+    sorted_ids = {file_path : i for i, file_path in enumerate(file_paths)}
+    remap = {file_ids[file_path] : sorted_ids[file_path]
+        for file_path in file_paths}
+    
+    files = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        files.append({
+            'path' : file_path,
+            'size' : stat.st_size,
+            'mtime' : stat.st_mtime,
+        })
+    
+    leaves = {}
+    split_membership = {}
+    for split_name, split_leaf_data in split_leaves.items():
+        members = set()
+        for file_paths, leaf in split_leaf_data.items():
+            leaf = [[remap[file_id], subdocument]
+                for file_id, subdocument in leaf]
+            leaves[file_paths] = leaf
+            members.update(file_id for file_id, subdocument in leaf)
+        split_membership[split_name] = sorted(members)
+    
+    index = {
+        'version' : index_version,
+        'dataset_mtime' : dataset_mtime,
+        'collections' : dict(settings.collections),
+        'directories' : get_directory_mtimes(sorted(directories)),
+        'files' : files,
+        'leaves' : leaves,
+        'splits' : split_membership,
+    }
+    
+    # the index is only a cache, so it is fine if it can't be saved
+    index_path = get_dataset_index_path(dataset)
+    # several workers may rebuild the index at once
+    tmp_path = '%s.%i.tmp'%(index_path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    
+    return index
+
+def dataset_index_valid(dataset, index):
+    if index.get('version', None) != index_version:
+        return False
+    dataset_path = os.path.expanduser(settings.datasets[dataset])
+    if os.stat(dataset_path).st_mtime != index['dataset_mtime']:
+        return False
+    if index['collections'] != dict(settings.collections):
+        return False
+    directories = index['directories']
+    return get_directory_mtimes(directories) == directories
+
+def get_dataset_index(dataset, rebuild=False):
+    if not rebuild:
+        index = dataset_indices.get(dataset, None)
+        if index is None:
+            index_path = get_dataset_index_path(dataset)
+            if os.path.exists(index_path):
+                try:
+                    with open(index_path) as f:
+                        index = json.load(f)
+                except ValueError:
+                    index = None
+        if index is not None and dataset_index_valid(dataset, index):
+            dataset_indices[dataset] = index
+            return index
+    
+    index = build_dataset_index(dataset)
+    dataset_indices[dataset] = index
+    return index
+
+def indexed_file_paths(index, file_paths):
+    all_file_paths = []
+    for file_id, subdocument in index['leaves'][file_paths]:
+        file_path = index['files'][file_id]['path']
+        if subdocument is not None:
+            file_path = '%s#%s'%(file_path, subdocument)
+        all_file_paths.append(file_path)
+    
+    return all_file_paths
+
+def get_dataset_paths(
+    dataset, split_name, subset=None, rank=0, size=1, use_index=True
+):
     split = get_dataset_info(dataset)['splits'][split_name]
+    if use_index:
+        index = get_dataset_index(dataset)
     
     def process_fn(file_paths):
-        return process_file_paths(
-            file_paths, subset=subset, rank=rank, size=size)
+        if use_index:
+            all_file_paths = indexed_file_paths(index, file_paths)
+        else:
+            all_file_paths = glob_file_paths(file_paths)
+        return select_file_paths(
+            all_file_paths, subset=subset, rank=rank, size=size)
     
     paths = map_hierarchies(process_fn, split)
     return concatenate_lists(paths)
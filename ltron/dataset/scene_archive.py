@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+import os
+import json
+import shutil
+import argparse
+from functools import partial
+
+import numpy
+
+from ltron.hierarchy import hierarchy_branch
+from ltron.bricks.brick_scene import BrickScene
+from ltron.dataset.paths import get_dataset_paths, get_dataset_info
+from ltron.dataset.map_reduce import map_reduce, print_errors
+from ltron.exceptions import LtronException
+
+'''
+A scene archive stores the assemblies of every scene in a dataset split so
+that environments can reset with BrickScene.set_assembly instead of parsing
+LDraw files.  The archive is a directory of .npy files:
+
+shape.npy, color.npy : (total instances,) int64, concatenated over scenes
+pose.npy : (total instances, 4, 4) float64
+edges.npy : (4, total edges) int64
+instance_offsets.npy, edge_offsets.npy : (num scenes + 1,) int64
+metadata.json : paths, shape_ids, color_ids and where the split came from
+
+Scene i occupies instances instance_offsets[i]:instance_offsets[i+1] and the
+edges edge_offsets[i]:edge_offsets[i+1].  Each scene keeps the padding entry
+for instance 0 so that instance ids survive the round trip.  The arrays are
+opened with mmap_mode='r', so opening an archive is cheap and each lookup
+only touches the pages of one scene.
+'''
+
+archive_version = 1
+metadata_name = 'metadata.json'
+array_names = (
+    'shape', 'color', 'pose', 'edges', 'instance_offsets', 'edge_offsets')
+
+class SceneArchiveException(LtronException):
+    pass
+
+def scene_assembly(path, shape_ids, color_ids):
+    scene = BrickScene(track_snaps=True)
+    scene.import_ldraw(path)
+    return scene.get_assembly(shape_ids, color_ids)
+
+def add_scene_assembly(assemblies, path, assembly):
+    assemblies[path] = assembly
+    return assemblies
+
+def save_scene_archive(
+    archive_path,
+    paths,
+    shape_ids,
+    color_ids,
+    num_processes=1,
+    extra_metadata=None,
+):
+    assemblies, errors = map_reduce(
+        paths,
+        partial(scene_assembly, shape_ids=shape_ids, color_ids=color_ids),
+        add_scene_assembly,
+        {},
+        num_processes=num_processes,
+        description='Packing scenes',
+    )
+    if errors:
+        print_errors(errors)
+        raise SceneArchiveException(
+            'Unable to pack %i scenes'%len(errors))
+
+    assemblies = [assemblies[path] for path in paths]
+    num_instances = [len(assembly['shape']) for assembly in assemblies]
+    num_edges = [assembly['edges'].shape[1] for assembly in assemblies]
+    arrays = {
+        'shape' : numpy.concatenate(
+            [numpy.zeros(0, dtype=numpy.int64)] +
+            [assembly['shape'] for assembly in assemblies]),
+        'color' : numpy.concatenate(
+            [numpy.zeros(0, dtype=numpy.int64)] +
+            [assembly['color'] for assembly in assemblies]),
+        'pose' : numpy.concatenate(
+            [numpy.zeros((0,4,4))] +
+            [assembly['pose'] for assembly in assemblies]),
+        'edges' : numpy.concatenate(
+            [numpy.zeros((4,0), dtype=numpy.int64)] +
+            [assembly['edges'] for assembly in assemblies], axis=1),
+        'instance_offsets' : numpy.cumsum([0] + num_instances),
+        'edge_offsets' : numpy.cumsum([0] + num_edges),
+    }
+
+    metadata = {
+        'version' : archive_version,
+        'paths' : list(paths),
+        'shape_ids' : shape_ids,
+        'color_ids' : color_ids,
+    }
+    if extra_metadata is not None:
+        metadata.update(extra_metadata)
+
+    tmp_path = archive_path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        numpy.save(
+            os.path.join(tmp_path, '%s.npy'%name),
+            numpy.ascontiguousarray(array).astype(
+                numpy.float64 if name == 'pose' else numpy.int64),
+            allow_pickle=False,
+        )
+    with open(os.path.join(tmp_path, metadata_name), 'w') as f:
+        json.dump(metadata, f)
+
+    if os.path.exists(archive_path):
+        shutil.rmtree(archive_path)
+    os.replace(tmp_path, archive_path)
+
+def save_dataset_scene_archive(
+    archive_path,
+    dataset,
+    split,
+    subset=None,
+    path_location=('mpd',),
+    num_processes=1,
+):
+    dataset_info = get_dataset_info(dataset)
+    paths = hierarchy_branch(
+        get_dataset_paths(dataset, split, subset), path_location)
+    save_scene_archive(
+        archive_path,
+        paths,
+        dataset_info['shape_ids'],
+        dataset_info['color_ids'],
+        num_processes=num_processes,
+        extra_metadata={
+            'dataset' : dataset,
+            'split' : split,
+            'subset' : subset,
+        },
+    )
+
+class SceneArchive:
+    '''
+    Random access to the assemblies in a scene archive:
+
+    archive = SceneArchive(path)
+    scene.set_assembly(archive[i], archive.shape_ids, archive.color_ids)
+    '''
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        with open(os.path.join(archive_path, metadata_name)) as f:
+            self.metadata = json.load(f)
+        if self.metadata['version'] != archive_version:
+            raise SceneArchiveException(
+                'Unsupported scene archive version %s: %s'%(
+                    self.metadata['version'], archive_path))
+        self.paths = self.metadata['paths']
+        self.shape_ids = self.metadata['shape_ids']
+        self.color_ids = self.metadata['color_ids']
+
+        self.arrays = {
+            name : numpy.load(
+                os.path.join(archive_path, '%s.npy'%name), mmap_mode='r')
+            for name in array_names
+        }
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        i0, i1 = self.arrays['instance_offsets'][index:index+2]
+        e0, e1 = self.arrays['edge_offsets'][index:index+2]
+        return {
+            'shape' : numpy.array(self.arrays['shape'][i0:i1]),
+            'color' : numpy.array(self.arrays['color'][i0:i1]),
+            'pose' : numpy.array(self.arrays['pose'][i0:i1]),
+            'edges' : numpy.array(self.arrays['edges'][:,e0:e1]),
+        }
+
+parser = argparse.ArgumentParser()
+parser.add_argument('dataset', type=str)
+parser.add_argument('split', type=str)
+parser.add_argument('archive_path', type=str)
+parser.add_argument('--subset', type=int, default=None)
+parser.add_argument('--path-location', type=str, default='mpd')
+parser.add_argument('--num-processes', type=int, default=1)
+
+def main():
+    args = parser.parse_args()
+    save_dataset_scene_archive(
+        os.path.expanduser(args.archive_path),
+        args.dataset,
+        args.split,
+        subset=args.subset,
+        path_location=args.path_location.split('/'),
+        num_processes=args.num_processes,
+    )
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,7 @@ from ltron.gym.components.viewpoint import (
         RandomizedAzimuthalViewpointComponent,
         FixedAzimuthalViewpointComponent)
 from ltron.bricks.brick_shape import BrickShape
+from ltron.dataset.map_reduce import map_reduce, print_errors
 import copy
 import collections
 import math
@@ -81,21 +82,40 @@ def compute_boxsize(instance, scene, complete=False):
     offset = bbox_max - bbox_min
     return max(offset)
 
-def blacklist_computation(threshold):
+def part_max_dimension(part):
+    bshape = BrickShape(part)
+    return bshape.reference_name, numpy.max(bshape.bbox[1] - bshape.bbox[0])
+
+def add_part_max_dimension(max_dims, part, result):
+    reference_name, max_dim = result
+    max_dims[part] = (reference_name, max_dim)
+    return max_dims
+
+def blacklist_computation(threshold, num_processes=1):
     path = Path("~/.cache/ltron/ldraw/parts").expanduser()
-    partlist = list(path.glob("*.dat"))
+    partlist = [
+        str(part) for part in path.glob("*.dat")
+        if "30520.dat" not in str(part)
+    ]
 
-    blacklist = []
     print('-'*80)
     print('Finding Large Bricks to Blacklist')
-    for part in tqdm.tqdm(partlist):
-        part = str(part)
-        if "30520.dat" in part:
+    max_dims, errors = map_reduce(
+        partlist,
+        part_max_dimension,
+        add_part_max_dimension,
+        {},
+        num_processes=num_processes,
+    )
+    print_errors(errors)
+
+    blacklist = []
+    for part in partlist:
+        if part not in max_dims:
             continue
-        bshape = BrickShape(part)
-        max_dim = numpy.max(bshape.bbox[1] - bshape.bbox[0])
+        reference_name, max_dim = max_dims[part]
         if max_dim > threshold:
-            blacklist.append(bshape.reference_name)
+            blacklist.append(reference_name)
 
     blacklist.append("30520.dat")
     return blacklist
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import os
+import random
+import tempfile
+
+import numpy
+
+from ltron.hierarchy import TreeSpec
+from ltron.gym.envs.break_and_make_env import (
+    BreakAndMakeEnv, BreakAndMakeEnvConfig)
+from ltron.dataset.episode_replay import save_action_episode, EpisodeReplay
+
+def generate_episode(config, seed, num_steps):
+    '''
+    Runs random actions in a BreakAndMakeEnv the same way the break-and-make
+    generator runs the planner's actions, and returns the dataset id, the
+    stacked observations preceding each action and the stacked actions.
+    '''
+    env = BreakAndMakeEnv(config, rank=0, size=1)
+    dataset_component = env.components['dataset']
+    dataset_id = dataset_component.dataset_ids[0]
+    dataset_component.set_state({
+        'initialized' : True,
+        'finished' : False,
+        'episode_id' : -1,
+        'dataset_id' : dataset_id,
+    })
+    random.seed(seed)
+    numpy.random.seed(seed)
+    env.action_space.seed(seed)
+    
+    observation = env.reset()
+    observations = [observation]
+    actions = []
+    rewards = []
+    for i in range(num_steps):
+        action = env.action_space.sample()
+        actions.append(action)
+        observation, reward, terminal, info = env.step(action)
+        rewards.append(reward)
+        if terminal or i == num_steps - 1:
+            break
+        observations.append(observation)
+    
+    observations = TreeSpec(observations[0]).stack(*observations)
+    actions = TreeSpec(actions[0]).stack(*actions)
+    return dataset_id, observations, actions, numpy.array(rewards)
+
+def assert_hierarchies_equal(a, b):
+    spec = TreeSpec(a)
+    leaves_a = spec.flatten(a)
+    leaves_b = spec.flatten(b)
+    assert len(leaves_a) == len(leaves_b)
+    for leaf_a, leaf_b in zip(leaves_a, leaves_b):
+        assert numpy.array_equal(leaf_a, leaf_b)
+
+def test_replay_matches_stored_observations():
+    config = BreakAndMakeEnvConfig(subset=1, dataset_reset_mode='single_pass')
+    seed = 1234
+    dataset_id, observations, actions, rewards = generate_episode(
+        config, seed, 8)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'episode_0.npz')
+        save_action_episode(path, dataset_id, seed, actions, rewards)
+        
+        replay = EpisodeReplay(config)
+        replayed_observations = replay.replay(path)
+        assert_hierarchies_equal(observations, replayed_observations)
+        
+        # replaying again from the same env gives the same result
+        keys = list(observations.keys())[:2]
+        replayed_observations = replay.replay(path, observation_keys=keys)
+        assert list(replayed_observations.keys()) == keys
+        assert_hierarchies_equal(
+            {key : observations[key] for key in keys},
+            replayed_observations,
+        )
+
+if __name__ == '__main__':
+    test_replay_matches_stored_observations()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+import os
+import json
+import time
+import shutil
+import tempfile
+
+import ltron.settings as settings
+import ltron.dataset.paths as paths
+from ltron.dataset.paths import get_dataset_paths, get_dataset_index_path
+
+dataset_name = 'path_index_test'
+
+splits = {
+    'all' : '{path_index_test}/*/*.mpd',
+    'nested' : {
+        'first' : '{path_index_test}/a/*.mpd[:2]',
+        'rest' : '{path_index_test}/*/*.mpd[2:],{path_index_test}/a/*.ldr',
+    },
+    'sub' : '{path_index_test}/a/*.mpd#Sub.ldr',
+}
+
+def touch(path):
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        f.write('0 FILE %s\n'%os.path.basename(path))
+
+def wait_for_mtime():
+    # directory mtimes come from a coarse kernel clock
+    time.sleep(0.05)
+
+def as_lists(paths):
+    if isinstance(paths, dict):
+        return {key : as_lists(value) for key, value in paths.items()}
+    return paths.tolist()
+
+def assert_index_matches_glob():
+    for split_name in splits:
+        indexed = get_dataset_paths(dataset_name, split_name, use_index=True)
+        globbed = get_dataset_paths(dataset_name, split_name, use_index=False)
+        assert as_lists(indexed) == as_lists(globbed)
+
+def test_index_matches_glob():
+    directory = tempfile.mkdtemp()
+    dataset_path = os.path.join(directory, 'path_index_test.json')
+    collection_path = os.path.join(directory, 'collection')
+    settings.datasets[dataset_name] = dataset_path
+    settings.collections[dataset_name] = collection_path
+    paths.dataset_indices.pop(dataset_name, None)
+    try:
+        with open(dataset_path, 'w') as f:
+            json.dump({'splits' : splits}, f)
+        for name in ('a/1.mpd', 'a/2.mpd', 'a/3.mpd', 'a/4.ldr', 'b/1.mpd'):
+            touch(os.path.join(collection_path, name))
+        
+        assert_index_matches_glob()
+        assert os.path.exists(get_dataset_index_path(dataset_name))
+        assert not any(
+            name.endswith('.tmp') for name in os.listdir(directory))
+        assert len(get_dataset_paths(dataset_name, 'all')) == 4
+        
+        # add files
+        wait_for_mtime()
+        touch(os.path.join(collection_path, 'a/0.mpd'))
+        touch(os.path.join(collection_path, 'b/2.mpd'))
+        assert_index_matches_glob()
+        assert len(get_dataset_paths(dataset_name, 'all')) == 6
+        
+        # remove files
+        wait_for_mtime()
+        os.remove(os.path.join(collection_path, 'a/2.mpd'))
+        os.remove(os.path.join(collection_path, 'a/4.ldr'))
+        assert_index_matches_glob()
+        assert len(get_dataset_paths(dataset_name, 'all')) == 5
+        
+        # add a new directory matched by the wildcard
+        wait_for_mtime()
+        touch(os.path.join(collection_path, 'c/1.mpd'))
+        assert_index_matches_glob()
+        assert len(get_dataset_paths(dataset_name, 'all')) == 6
+        
+        # a fresh process reads the saved index from disk
+        paths.dataset_indices.pop(dataset_name, None)
+        assert_index_matches_glob()
+        
+        # remove a whole directory
+        wait_for_mtime()
+        shutil.rmtree(os.path.join(collection_path, 'b'))
+        assert_index_matches_glob()
+        assert len(get_dataset_paths(dataset_name, 'all')) == 4
+    
+    finally:
+        settings.datasets.pop(dataset_name, None)
+        settings.collections.pop(dataset_name, None)
+        paths.dataset_indices.pop(dataset_name, None)
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    test_index_matches_glob()
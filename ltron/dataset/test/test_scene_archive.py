@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import os
+import tempfile
+
+import numpy
+
+from ltron.bricks.brick_scene import BrickScene
+from ltron.dataset.scene_archive import save_scene_archive, SceneArchive
+
+stack_mpd = '''0 FILE stack.mpd
+1 4 0 0 0 1 0 0 0 1 0 0 0 1 3001.dat
+1 1 20 -24 0 1 0 0 0 1 0 0 0 1 3001.dat
+1 14 0 -48 -10 0 0 1 0 1 0 -1 0 0 3003.dat
+'''
+
+def sorted_edges(edges):
+    return sorted(map(tuple, edges.T.tolist()))
+
+def test_scene_archive_matches_ldraw():
+    with tempfile.TemporaryDirectory() as directory:
+        mpd_path = os.path.join(directory, 'stack.mpd')
+        with open(mpd_path, 'w') as f:
+            f.write(stack_mpd)
+        
+        ldraw_scene = BrickScene(track_snaps=True)
+        ldraw_scene.import_ldraw(mpd_path)
+        shape_ids = ldraw_scene.make_shape_ids()
+        color_ids = ldraw_scene.make_color_ids()
+        ldraw_assembly = ldraw_scene.get_assembly(shape_ids, color_ids)
+        
+        archive_path = os.path.join(directory, 'stack_archive')
+        save_scene_archive(archive_path, [mpd_path], shape_ids, color_ids)
+        archive = SceneArchive(archive_path)
+        assert len(archive) == 1
+        assert archive.paths == [mpd_path]
+        
+        archive_scene = BrickScene(track_snaps=True)
+        archive_scene.set_assembly(archive[0], shape_ids, color_ids)
+        archive_assembly = archive_scene.get_assembly(shape_ids, color_ids)
+        
+        assert (
+            list(archive_scene.instances.keys()) ==
+            list(ldraw_scene.instances.keys())
+        )
+        assert numpy.array_equal(
+            archive_assembly['shape'], ldraw_assembly['shape'])
+        assert numpy.array_equal(
+            archive_assembly['color'], ldraw_assembly['color'])
+        assert numpy.array_equal(
+            archive_assembly['pose'], ldraw_assembly['pose'])
+        assert (
+            sorted_edges(archive_assembly['edges']) ==
+            sorted_edges(ldraw_assembly['edges'])
+        )
+        assert (
+            sorted_edges(archive[0]['edges']) ==
+            sorted_edges(ldraw_assembly['edges'])
+        )
+
+if __name__ == '__main__':
+    test_scene_archive_matches_ldraw()
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 import numpy
 
 import PIL.Image as Image
@@ -33,75 +35,212 @@ def f1(precision, recall):
     return 2 * (precision * recall) / (precision + recall)
 
 def ap(scores, ground_truth, false_negatives):
+    '''
+    Average precision of predictions with the given scores, where
+    ground_truth is the true value of each prediction and false_negatives
+    counts the ground truth that was not predicted.  Returns the (n,2)
+    precision/recall curve in descending score order, its concave version
+    and the score.
     
-    sorted_ground_truth = [
-            gt for s, gt
-            in reversed(sorted(zip(scores, ground_truth)))]
-    gt_total = sum(ground_truth) + false_negatives
-    
-    pr_curve = []
-    gt_so_far = 0
-    
-    for i, gt in enumerate(sorted_ground_truth):
-        gt_so_far += gt
-        precision = gt_so_far / (i+1)
-        if gt_total == 0:
-            recall = 0
-        else:
-            recall = gt_so_far / gt_total
-        pr_curve.append([precision, recall])
+    Every sum is accumulated sequentially in descending score order, so the
+    scores are bitwise identical to the original loop implementation.
+    '''
+    scores = numpy.asarray(scores, dtype=numpy.float64).reshape(-1)
+    ground_truth = numpy.asarray(ground_truth, dtype=numpy.float64).reshape(-1)
+    n = len(scores)
     
-    concave_pr_curve = []
-    last_precision = 0
-    for precision, recall in reversed(pr_curve):
-        if precision < last_precision:
-            precision = last_precision
-        else:
-            last_precision = precision
-        concave_pr_curve.append([precision, recall])
+    # descending by score, then by ground truth, like reversed(sorted(...))
+    order = numpy.lexsort((-ground_truth, -scores))
+    sorted_ground_truth = ground_truth[order]
+    if n:
+        gt_total = numpy.cumsum(ground_truth)[-1] + false_negatives
+    else:
+        gt_total = false_negatives
     
-    concave_pr_curve = list(reversed(concave_pr_curve))
+    gt_so_far = numpy.cumsum(sorted_ground_truth)
+    precision = gt_so_far / numpy.arange(1, n+1)
+    if gt_total == 0:
+        recall = numpy.zeros(n)
+    else:
+        recall = gt_so_far / gt_total
+    pr_curve = numpy.stack((precision, recall), axis=1)
     
-    max_precision = {}
-    for precision, recall in concave_pr_curve:
-        max_precision[recall] = max(max_precision.get(recall, 0), precision)
+    concave_precision = numpy.maximum(
+        numpy.maximum.accumulate(precision[::-1])[::-1], 0.)
+    concave_pr_curve = numpy.stack((concave_precision, recall), axis=1)
     
-    if len(max_precision) and gt_total:
-        ap_score = sum(max_precision.values()) / gt_total
+    # maximum precision for each distinct recall, summed in the order the
+    # recall values first appear
+    if n and gt_total:
+        unique_recall, first_index, inverse = numpy.unique(
+            recall, return_index=True, return_inverse=True)
+        max_precision = numpy.zeros(len(unique_recall))
+        numpy.maximum.at(max_precision, inverse.reshape(-1), concave_precision)
+        max_precision = max_precision[numpy.argsort(first_index)]
+        ap_score = float(numpy.cumsum(max_precision)[-1] / gt_total)
     else:
         ap_score = 0.0
     
     return pr_curve, concave_pr_curve, ap_score
 
+def batch_ap(scores, ground_truth, false_negatives, segments):
+    '''
+    Computes ap separately for each segment of a batch of predictions, for
+    example one segment per scene or per class.  segments labels each
+    prediction, and false_negatives is a dictionary (or array) of false
+    negative counts per segment label.  Returns a dictionary mapping each
+    segment label to its ap score, in the order the labels first appear.
+    '''
+    scores = numpy.asarray(scores, dtype=numpy.float64).reshape(-1)
+    ground_truth = numpy.asarray(ground_truth, dtype=numpy.float64).reshape(-1)
+    segments = numpy.asarray(segments).reshape(-1)
+    
+    # a stable sort keeps the original order inside each segment so that
+    # the sequential sums match ap
+    labels, first_index, counts = numpy.unique(
+        segments, return_index=True, return_counts=True)
+    order = numpy.argsort(segments, kind='stable')
+    ends = numpy.cumsum(counts)
+    starts = ends - counts
+    
+    segment_ap = {}
+    for i in numpy.argsort(first_index):
+        label = labels[i].item()
+        segment_order = order[starts[i]:ends[i]]
+        _, _, segment_ap[label] = ap(
+            scores[segment_order],
+            ground_truth[segment_order],
+            false_negatives[label],
+        )
+    
+    return segment_ap
+
+def key_rows(*key_arrays):
+    '''
+    Reshapes key arrays to (n,k), taking k from the non-empty arrays so that
+    empty arrays of any shape are accepted.
+    '''
+    key_arrays = [numpy.asarray(k) for k in key_arrays]
+    width = max([k.size // len(k) for k in key_arrays if len(k)] + [1])
+    return [k.reshape(len(k), width) for k in key_arrays]
+
+def encode_keys(*key_arrays):
+    '''
+    Maps the rows of several (n,k) integer key arrays to shared integer ids
+    by sorting, so that rows can be joined with searchsorted.
+    '''
+    key_arrays = key_rows(*key_arrays)
+    all_keys = numpy.concatenate(key_arrays, axis=0)
+    _, inverse = numpy.unique(all_keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    splits = numpy.cumsum([len(k) for k in key_arrays])[:-1]
+    return numpy.split(inverse, splits)
+
+def join_ground_truth(
+    keys, ground_truth_keys, ground_truth_scores, ground_truth_segments=None
+):
+    '''
+    Looks up the ground truth score of each predicted key (0 if missing)
+    with a sorted join, and counts the ground truth keys that were not
+    predicted, per segment if ground_truth_segments is given.
+    '''
+    ground_truth_scores = numpy.asarray(
+        ground_truth_scores, dtype=numpy.float64).reshape(-1)
+    ids, ground_truth_ids = encode_keys(keys, ground_truth_keys)
+    gt_order = numpy.argsort(ground_truth_ids)
+    sorted_gt_ids = ground_truth_ids[gt_order]
+    
+    location = numpy.searchsorted(sorted_gt_ids, ids)
+    location = numpy.minimum(location, max(len(sorted_gt_ids)-1, 0))
+    if len(sorted_gt_ids):
+        found = sorted_gt_ids[location] == ids
+    else:
+        found = numpy.zeros(len(ids), dtype=bool)
+    scores = numpy.zeros(len(ids))
+    scores[found] = ground_truth_scores[gt_order[location[found]]]
+    
+    predicted = numpy.isin(ground_truth_ids, ids)
+    if ground_truth_segments is None:
+        return scores, int(numpy.sum(~predicted))
+    else:
+        ground_truth_segments = numpy.asarray(ground_truth_segments)
+        missed, counts = numpy.unique(
+            ground_truth_segments[~predicted], return_counts=True)
+        false_negatives = {
+            label.item() : int(count) for label, count in zip(missed, counts)}
+        return scores, false_negatives
+
 def edge_ap(edges, ground_truth):
-    scores = []
-    ground_truth_scores = []
-    for edge, score in edges.items():
-        scores.append(score)
-        ground_truth_scores.append(ground_truth.get(edge, 0.0))
+    '''
+    edges and ground_truth map edge keys to scores.
+    '''
+    scores = numpy.fromiter(
+        edges.values(), dtype=numpy.float64, count=len(edges))
+    ground_truth_scores = [ground_truth.get(edge, 0.0) for edge in edges]
     false_negatives = len(set(ground_truth.keys()) - set(edges.keys()))
     return ap(scores, ground_truth_scores, false_negatives)
 
+def edge_ap_arrays(
+    edge_keys, scores, ground_truth_keys, ground_truth_scores
+):
+    '''
+    Array version of edge_ap, where edge keys are encoded as the rows of
+    (n,k) integer arrays.  Keys must be unique.
+    '''
+    ground_truth, false_negatives = join_ground_truth(
+        edge_keys, ground_truth_keys, ground_truth_scores)
+    return ap(scores, ground_truth, false_negatives)
+
+def batch_edge_ap(
+    edge_keys,
+    scores,
+    scene_ids,
+    ground_truth_keys,
+    ground_truth_scores,
+    ground_truth_scene_ids,
+):
+    '''
+    Evaluates edge_ap for many scenes in one call.  Each edge and ground
+    truth edge is labelled with the scene it belongs to.  Returns a
+    dictionary mapping each scene id with at least one predicted edge to
+    its ap score.
+    '''
+    scene_ids = numpy.asarray(scene_ids).reshape(-1)
+    ground_truth_scene_ids = numpy.asarray(ground_truth_scene_ids).reshape(-1)
+    edge_keys, ground_truth_keys = key_rows(edge_keys, ground_truth_keys)
+    keys = numpy.concatenate(
+        (scene_ids[:,None], edge_keys), axis=1)
+    ground_truth_keys = numpy.concatenate(
+        (ground_truth_scene_ids[:,None], ground_truth_keys), axis=1)
+    ground_truth, false_negatives = join_ground_truth(
+        keys,
+        ground_truth_keys,
+        ground_truth_scores,
+        ground_truth_segments=ground_truth_scene_ids,
+    )
+    false_negatives = defaultdict(int, false_negatives)
+    return batch_ap(scores, ground_truth, false_negatives, scene_ids)
+
 def instance_map(
         instance_class_predictions, class_false_negatives, extant_classes):
     
-    per_class_predictions = {}
-    per_class_ground_truth = {}
-    for (class_label, score), true_label in instance_class_predictions:
-        if class_label not in per_class_predictions:
-            per_class_predictions[class_label] = []
-            per_class_ground_truth[class_label] = []
-        per_class_predictions[class_label].append(float(score))
-        per_class_ground_truth[class_label].append(
-                float(class_label == true_label))
+    if len(instance_class_predictions):
+        class_scores, true_labels = zip(*instance_class_predictions)
+        class_labels, scores = zip(*class_scores)
+    else:
+        class_labels, scores, true_labels = (), (), ()
+    class_labels = numpy.asarray(class_labels)
+    scores = numpy.asarray(scores, dtype=numpy.float64)
+    ground_truth = (class_labels == numpy.asarray(true_labels)).astype(
+        numpy.float64)
     
-    class_ap = {}
-    for class_label in per_class_predictions:
-        if class_label not in extant_classes:
-            continue
-        _, _, class_ap[class_label] = ap(
-                per_class_predictions[class_label],
-                per_class_ground_truth[class_label],
-                class_false_negatives.get(class_label, 0))
+    extant = numpy.isin(class_labels, list(extant_classes))
+    false_negatives = defaultdict(int, class_false_negatives)
+    class_ap = batch_ap(
+        scores[extant],
+        ground_truth[extant],
+        false_negatives,
+        class_labels[extant],
+    )
     
     return sum(class_ap.values())/len(class_ap), class_ap
@@ -144,6 +144,110 @@ def build_collision_map(
     
     return collision_map
 
+class BitmaskCollisionMap:
+    '''
+    A compiled form of the output of build_collision_map.  Each
+    (instance, (axis, polarity, snap_group)) entry becomes one row of
+    blockers, a fixed width bitmask over instance ids stored as uint64 words.
+    Memberships are encoded the same way with encode, so testing whether a
+    group is free of collisions for a given membership is a single AND over
+    all groups at once.
+    '''
+    def __init__(self, collision_map):
+        max_id = 0
+        for instance, groups in collision_map.items():
+            max_id = max(max_id, int(instance))
+            for colliders in groups.values():
+                max_id = max(max_id, max(colliders, default=0))
+        self.num_bits = max_id + 1
+        self.num_words = (self.num_bits + 63) // 64
+        self.encoded = {}
+        
+        self.group_keys = []
+        group_instance = []
+        self.blockers = []
+        self.instance_groups = {}
+        for instance, groups in collision_map.items():
+            instance = int(instance)
+            group_ids = []
+            for key, colliders in groups.items():
+                group_ids.append(len(self.group_keys))
+                self.group_keys.append(key)
+                group_instance.append(instance)
+                self.blockers.append(self.encode(colliders))
+            self.instance_groups[instance] = numpy.array(
+                group_ids, dtype=numpy.int64)
+        
+        self.group_instance = numpy.array(group_instance, dtype=numpy.int64)
+        if self.blockers:
+            self.blockers = numpy.stack(self.blockers)
+        else:
+            self.blockers = numpy.zeros((0, self.num_words), dtype=numpy.uint64)
+    
+    def encode(self, instances):
+        '''
+        Encodes a collection of instance ids as a (num_words,) uint64 array.
+        Ids outside the map cannot collide with anything and are dropped.
+        Encodings of frozensets (roadmap memberships) are cached.
+        '''
+        if isinstance(instances, frozenset):
+            if instances not in self.encoded:
+                self.encoded[instances] = self.encode(tuple(instances))
+            return self.encoded[instances]
+        
+        ids = numpy.fromiter(
+            (int(i) for i in instances), dtype=numpy.int64)
+        ids = ids[(ids >= 0) & (ids < self.num_bits)]
+        words = numpy.zeros(self.num_words, dtype=numpy.uint64)
+        numpy.bitwise_or.at(
+            words,
+            ids >> 6,
+            numpy.left_shift(numpy.uint64(1), (ids & 63).astype(numpy.uint64)),
+        )
+        return words
+    
+    def free_groups(self, membership_words, groups=None):
+        '''
+        Returns a boolean array marking the groups (all of them, or the
+        given group indices) with no blockers in the membership.
+        '''
+        blockers = self.blockers
+        if groups is not None:
+            blockers = blockers[groups]
+        return ~numpy.any(blockers & membership_words, axis=-1)
+    
+    def has_free_group(self, instance, membership_words):
+        groups = self.instance_groups.get(int(instance), None)
+        if groups is None or not len(groups):
+            return False
+        return bool(numpy.any(self.free_groups(membership_words, groups)))
+    
+    def free_snaps(self, instance, membership_words):
+        groups = self.instance_groups.get(int(instance), ())
+        if not len(groups):
+            return []
+        free = self.free_groups(membership_words, groups)
+        snaps = []
+        for group in numpy.array(groups)[free]:
+            axis, polarity, snap_group = self.group_keys[group]
+            snaps.extend(snap_group)
+        return snaps
+    
+    def all_have_free_group(self, instances, membership_words):
+        '''
+        Returns True if every one of the instances has at least one group
+        with no blockers in the membership.
+        '''
+        instances = numpy.fromiter(
+            (int(i) for i in instances), dtype=numpy.int64)
+        if not len(instances):
+            return True
+        free = self.free_groups(membership_words)
+        has_free = numpy.zeros(
+            max(self.num_bits, int(instances.max()) + 1), dtype=bool)
+        has_free[self.group_instance[free]] = True
+        return bool(numpy.all(has_free[instances]))
+
 def check_snap_collision(
     scene,
     target_instances,
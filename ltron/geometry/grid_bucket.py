@@ -1,6 +1,8 @@
 import math
 import itertools
 
+import numpy
+
 from ltron.geometry.utils import metric_close_enough, immutable_vector
 
 class GridBucket:
@@ -37,8 +39,18 @@ class GridBucket:
         self.value_to_cell_positions[value].add((cell, position))
     
     def insert_many(self, values, positions):
-        for value, position in zip(values, positions):
-            self.insert(value, position)
+        # compute all cells in one pass, then fill the lookup tables
+        positions = numpy.asarray(positions, dtype=float).reshape(-1, 3)
+        cells = numpy.floor(positions / self.cell_size).astype(numpy.int64)
+        for value, position, cell in zip(
+            values, positions.tolist(), cells.tolist()
+        ):
+            position = immutable_vector(position)
+            cell = tuple(cell)
+            self.cell_to_value_positions.setdefault(cell, set()).add(
+                (value, position))
+            self.value_to_cell_positions.setdefault(value, set()).add(
+                (cell, position))
     
     def remove(self, value):
         if value in self.value_to_cell_positions:
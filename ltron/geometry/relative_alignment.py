@@ -4,45 +4,97 @@ import numpy
 
 from pyquaternion import Quaternion
 
-def relative_alignment(transforms, relative_estimates, iterations):
-    for i in range(iterations):
-        new_transforms = []
-        for i, transform in enumerate(transforms):
-            estimates = []
-            for j, other in enumerate(transforms):
-                estimate = other @ relative_estimates[j][i] # or something it
-                estimates.append(estimate)
-            average = average_transforms(estimates)
-            new_transforms.append(average)
-        
-        transforms = new_transforms
+def matrices_to_quaternions(rotations):
+    '''
+    Converts an (...,3,3) array of rotation matrices to an (...,4) array of
+    unit (w,x,y,z) quaternions, choosing the most numerically stable branch
+    for each matrix.
+    '''
+    r = numpy.asarray(rotations, dtype=numpy.float64)
+    shape = r.shape[:-2]
+    r = r.reshape(-1,3,3)
+    m00, m01, m02 = r[:,0,0], r[:,0,1], r[:,0,2]
+    m10, m11, m12 = r[:,1,0], r[:,1,1], r[:,1,2]
+    m20, m21, m22 = r[:,2,0], r[:,2,1], r[:,2,2]
     
-    return transforms
+    # four candidate solutions (each row is a scaled quaternion), pick the
+    # one with the largest diagonal term
+    candidates = numpy.stack((
+        numpy.stack((1+m00+m11+m22, m21-m12, m02-m20, m10-m01), axis=-1),
+        numpy.stack((m21-m12, 1+m00-m11-m22, m01+m10, m02+m20), axis=-1),
+        numpy.stack((m02-m20, m01+m10, 1-m00+m11-m22, m12+m21), axis=-1),
+        numpy.stack((m10-m01, m02+m20, m12+m21, 1-m00-m11+m22), axis=-1),
+    ), axis=1)
+    diagonal = numpy.stack(
+        (m00+m11+m22, m00, m11, m22), axis=-1)
+    best = numpy.argmax(diagonal, axis=-1)
+    q = candidates[numpy.arange(len(r)), best]
+    q /= numpy.linalg.norm(q, axis=-1, keepdims=True)
+    
+    return q.reshape(*shape, 4)
 
-def average_transforms(transforms):
+def quaternions_to_matrices(quaternions):
+    q = numpy.asarray(quaternions, dtype=numpy.float64)
+    w, x, y, z = q[...,0], q[...,1], q[...,2], q[...,3]
+    r = numpy.stack((
+        1-2*(y*y+z*z), 2*(x*y-w*z), 2*(x*z+w*y),
+        2*(x*y+w*z), 1-2*(x*x+z*z), 2*(y*z-w*x),
+        2*(x*z-w*y), 2*(y*z+w*x), 1-2*(x*x+y*y),
+    ), axis=-1)
+    
+    return r.reshape(*q.shape[:-1], 3, 3)
+
+def average_transform_stack(transforms, axis=0):
     '''
-    Kids, don't do this, this is not ok.
+    Averages an array of transforms along axis.  Translations are averaged
+    directly.  Rotations are averaged in closed form as the eigenvector with
+    the largest eigenvalue of the sum of quaternion outer products, which
+    does not depend on the sign of each quaternion.
     '''
-    average = numpy.eye(4)
-    translates = [transform[:3,3] for transform in transforms]
-    average_translate = sum(translates)/len(translates)
-    average[:3,3] = average_translate
+    transforms = numpy.moveaxis(numpy.asarray(transforms), axis, -3)
+    translates = transforms[...,:3,3].mean(axis=-2)
+    qs = matrices_to_quaternions(transforms[...,:3,:3])
+    outer = numpy.einsum('...ni,...nj->...ij', qs, qs)
+    eigenvalues, eigenvectors = numpy.linalg.eigh(outer)
+    averaged_qs = eigenvectors[...,:,-1]
     
-    qs = [Quaternion(matrix=transform[:3,:3], rtol=1e-4, atol=1e-4) for transform in transforms]
-    base = random.choice(qs)
-    flipped_qs = []
-    for q in qs:
-        if q[0]*base[0] + q[1]*base[1] + q[2]*base[2] + q[3]*base[3] < 0:
-            flipped_qs.append(-q)
-        else:
-            flipped_qs.append(q)
-    
-    averaged_q = sum(flipped_qs) / len(flipped_qs)
-    averaged_q = averaged_q.normalised
-    average[:3,:3] = averaged_q.rotation_matrix
+    average = numpy.zeros((*translates.shape[:-1], 4, 4))
+    average[...,:3,:3] = quaternions_to_matrices(averaged_qs)
+    average[...,:3,3] = translates
+    average[...,3,3] = 1.
     
     return average
 
+def average_transforms(transforms):
+    return average_transform_stack(transforms, axis=0)
+
+def relative_alignment(
+    transforms, relative_estimates, iterations, max_chunk_size=2**20
+):
+    '''
+    transforms is an (n,4,4) array and relative_estimates an (n,n,4,4) array
+    where relative_estimates[j,i] is the pose of i relative to j.  Each
+    iteration replaces every transform i with the average of the estimates
+    transforms[j] @ relative_estimates[j,i] over all j.  The estimates are
+    built in blocks of columns with at most max_chunk_size transforms so
+    that memory stays bounded for large n.
+    '''
+    transforms = numpy.asarray(transforms, dtype=numpy.float64)
+    relative_estimates = numpy.asarray(relative_estimates, dtype=numpy.float64)
+    n = len(transforms)
+    chunk = max(1, max_chunk_size // max(n, 1))
+    for _ in range(iterations):
+        new_transforms = numpy.zeros_like(transforms)
+        for start in range(0, n, chunk):
+            end = min(start + chunk, n)
+            estimates = (
+                transforms[:,None] @ relative_estimates[:,start:end])
+            new_transforms[start:end] = average_transform_stack(
+                estimates, axis=0)
+        transforms = new_transforms
+    
+    return transforms
+
 def test():
     def random_configuration(n):
         def random_orientation():
@@ -69,13 +121,12 @@ def test():
     goal_configuration = random_configuration(n)
     current_configuration = random_configuration(n)
     
-    offsets = []
-    for i, t1 in enumerate(goal_configuration):
-        row = []
-        for j, t2 in enumerate(goal_configuration):
-            offset = numpy.linalg.inv(t1) @ t2
-            row.append(offset)
-        offsets.append(row)
+    goal_configuration = numpy.array(goal_configuration)
+    current_configuration = numpy.array(current_configuration)
+    offsets = (
+        numpy.linalg.inv(goal_configuration)[:,None] @
+        goal_configuration[None,:]
+    )
     
     print('Goal:')
     print(offsets[0][1])
@@ -2,6 +2,8 @@ import math
 import os
 import glob
 import json
+import shutil
+import multiprocessing
 
 import numpy
 
@@ -25,9 +27,14 @@ import ltron.settings as settings
 from ltron.home import get_ltron_home
 from ltron.bricks.brick_scene import BrickScene
 from ltron.bricks.brick_shape import BrickShape
-from ltron.ldraw.parts import LDRAW_PARTS, LDRAW_BLACKLIST_ALL
+from ltron.ldraw.parts import (
+    LDRAW_PARTS, LDRAW_BLACKLIST_ALL, LDRAW_PATHS, ldraw_zip)
 from ltron.geometry.utils import (
-    metric_close_enough, vector_angle_close_enough, unscale_transform)
+    metric_close_enough,
+    vector_angle_close_enough,
+    unscale_transform,
+    unscale_transforms,
+)
 
 symmetry_table_path = os.path.join(
     get_ltron_home(), 'symmetry_table.json')
@@ -204,6 +211,27 @@ for symmetry_name, (axis, angle) in symmetry_tests.items():
             Quaternion(axis=axis, angle=a).transformation_matrix)
         a += angle
 
+symmetry_test_names = list(symmetry_tests.keys())
+symmetry_test_axes = numpy.array(
+    [symmetry_tests[name][0] for name in symmetry_test_names], dtype=float)
+symmetry_test_angles = numpy.array(
+    [symmetry_tests[name][1] for name in symmetry_test_names])
+
+def compile_symmetry_mask(symmetries):
+    '''
+    Converts a list of symmetry names to a boolean mask over
+    symmetry_test_names.
+    '''
+    return numpy.array([name in symmetries for name in symmetry_test_names])
+
+# LDRAW_SYMMETRY compiled to one row of symmetry_test_names flags per part
+LDRAW_SYMMETRY_INDEX = {
+    part_name : i for i, part_name in enumerate(sorted(LDRAW_SYMMETRY))}
+LDRAW_SYMMETRY_MASK = numpy.zeros(
+    (len(LDRAW_SYMMETRY_INDEX), len(symmetry_test_names)), dtype=bool)
+for part_name, i in LDRAW_SYMMETRY_INDEX.items():
+    LDRAW_SYMMETRY_MASK[i] = compile_symmetry_mask(LDRAW_SYMMETRY[part_name])
+
 def brick_symmetry_offsets(brick_shape):
     symmetries = LDRAW_SYMMETRY[str(brick_shape)]
     offsets = [numpy.eye(4)]
@@ -308,54 +336,207 @@ def check_brickshape_symmetry(
         raise
         return 'FAIL (EXCEPTION)'
 
+def brick_source_hash(brick):
+    # the zip CRC of the part's .dat file is free to read and changes
+    # whenever the file changes
+    return ldraw_zip.getinfo(LDRAW_PATHS[brick]).CRC
+
+def load_symmetry_checkpoint(checkpoint_directory):
+    results = {}
+    sources = {}
+    if not os.path.isdir(checkpoint_directory):
+        return results, sources
+    for shard_path in sorted(glob.glob(
+        os.path.join(checkpoint_directory, 'shard_*.jsonl'))
+    ):
+        with open(shard_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a partially written final line from an interrupted run
+                    continue
+                results[entry['brick']] = entry['symmetries']
+                sources[entry['brick']] = entry['source_hash']
+    return results, sources
+
+def symmetry_table_worker(
+    rank,
+    bricks,
+    checkpoint_directory,
+    resolution,
+    tolerance,
+    error_handling,
+    egl_device,
+):
+    # each worker owns its own scene and EGL context
+    scene = BrickScene(
+        renderable=True,
+        render_args={'opengl_mode':'egl', 'egl_device':egl_device},
+    )
+    framebuffer = FrameBufferWrapper(
+        resolution, resolution, anti_alias=False)
+    shard_path = os.path.join(checkpoint_directory, 'shard_%i.jsonl'%rank)
+    iterate = tqdm.tqdm(bricks, position=rank)
+    with open(shard_path, 'a') as f:
+        for brick_shape in iterate:
+            iterate.set_description(brick_shape.ljust(20))
+            scene.clear_instances()
+            if error_handling == 'skip':
+                try:
+                    symmetries = check_brickshape_symmetry(
+                        brick_shape, scene, framebuffer, tolerance)
+                except SplendorAssetException:
+                    print('Could not find brick "%s"'%brick_shape)
+                    continue
+                except KeyboardInterrupt:
+                    raise
+                except:
+                    print('Error for brick "%s"'%brick_shape)
+                    continue
+            elif error_handling == 'raise':
+                try:
+                    symmetries = check_brickshape_symmetry(
+                        brick_shape, scene, framebuffer, tolerance)
+                except:
+                    print('Error for brick "%s"'%brick_shape)
+                    raise
+            else:
+                raise ValueError(
+                    '"error_handling" must be "skip" or "raise"')
+            
+            f.write(json.dumps({
+                'brick':brick_shape,
+                'symmetries':symmetries,
+                'source_hash':brick_source_hash(brick_shape),
+            }) + '\n')
+            f.flush()
+
 def build_symmetry_table(
     bricks=None,
     symmetry_table_path=symmetry_table_path,
     resolution=default_resolution,
     tolerance=default_tolerance,
     error_handling='raise',
+    num_processes=1,
+    egl_devices=None,
+    incremental=False,
 ):
-    #all_brick_shapes = glob.glob(
-    #    os.path.join(settings.paths['ldraw'], 'parts', '*.dat'))
+    """
+    Renders each brick under each candidate rotation and writes the
+    resulting symmetry table to symmetry_table_path.
+    
+    The bricks are split into num_processes shards, each rendered by a
+    separate process with its own EGL context (egl_devices[rank %
+    len(egl_devices)] if egl_devices is specified).  Each result is appended
+    to a per-shard checkpoint file next to the table as soon as it is
+    computed, so rerunning after an interruption only computes what is
+    missing.  The checkpoint is removed once the table has been written with
+    a result for every requested brick.  If some bricks were skipped
+    (error_handling='skip'), the table is written with the bricks that
+    succeeded and the checkpoint is kept so that a rerun retries the rest.
     
+    If incremental is True, the existing table is kept and only bricks that
+    are missing from it, or whose .dat file has changed since it was
+    computed, are rendered.  Source hashes are stored alongside the table in
+    symmetry_table_sources.json.  Bricks with no recorded source hash are
+    treated as changed.
+    """
     if bricks is None:
         bricks = LDRAW_PARTS
-    bricks = set(bricks) - LDRAW_BLACKLIST_ALL
+    bricks = set(os.path.split(brick)[-1] for brick in bricks)
+    bricks = sorted(bricks - LDRAW_BLACKLIST_ALL)
+    
+    table_directory = os.path.dirname(symmetry_table_path)
+    sources_path = os.path.join(
+        table_directory, 'symmetry_table_sources.json')
+    checkpoint_directory = symmetry_table_path + '.checkpoint'
     
     symmetry_table = {}
-    scene = BrickScene(renderable=True)
-    framebuffer = FrameBufferWrapper(
-        resolution, resolution, anti_alias=False)
-    iterate = tqdm.tqdm(bricks)
-    for brick_shape in iterate:
-        brick_name = os.path.split(brick_shape)[-1]
-        iterate.set_description(brick_name.ljust(20))
-        brick_shape = os.path.split(brick_shape)[-1]
-        if error_handling == 'skip':
-            try:
-                symmetry_table[brick_shape] = check_brickshape_symmetry(
-                    brick_shape, scene, framebuffer, tolerance)
-            except SplendorAssetException:
-                print('Could not find brick "%s"'%brick_shape)
-            except KeyboardInterrupt:
-                break
-            except:
-                print('Error for brick "%s"'%brick_shape)
-        elif error_handling == 'raise':
-            try:
-                symmetry_table[brick_shape] = check_brickshape_symmetry(
-                    brick_shape, scene, framebuffer, tolerance)
-            except:
-                print('Error for brick "%s"'%brick_shape)
-                raise
+    symmetry_sources = {}
+    if incremental:
+        if os.path.exists(symmetry_table_path):
+            with open(symmetry_table_path) as f:
+                symmetry_table.update(json.load(f))
+        if os.path.exists(sources_path):
+            with open(sources_path) as f:
+                symmetry_sources.update(json.load(f))
+        bricks = [
+            brick for brick in bricks
+            if brick not in symmetry_table
+            or symmetry_sources.get(brick) != brick_source_hash(brick)
+        ]
+    
+    requested_sources = {brick:brick_source_hash(brick) for brick in bricks}
+    checkpoint_results, checkpoint_sources = load_symmetry_checkpoint(
+        checkpoint_directory)
+    bricks = [
+        brick for brick in bricks
+        if checkpoint_sources.get(brick) != requested_sources[brick]
+    ]
+    
+    if len(bricks):
+        if not os.path.exists(checkpoint_directory):
+            os.makedirs(checkpoint_directory)
+        worker_args = []
+        for rank in range(num_processes):
+            if egl_devices is None:
+                egl_device = None
+            else:
+                egl_device = egl_devices[rank % len(egl_devices)]
+            worker_args.append((
+                rank,
+                bricks[rank::num_processes],
+                checkpoint_directory,
+                resolution,
+                tolerance,
+                error_handling,
+                egl_device,
+            ))
+        
+        if num_processes == 1:
+            symmetry_table_worker(*worker_args[0])
         else:
-            raise ValueError('"error_handling" must be "skip" or "raise"')
+            # spawn rather than fork so that no OpenGL state is shared
+            context = multiprocessing.get_context('spawn')
+            processes = [
+                context.Process(target=symmetry_table_worker, args=args)
+                for args in worker_args
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            failed = [
+                rank for rank, process in enumerate(processes)
+                if process.exitcode != 0
+            ]
+            if failed:
+                raise RuntimeError(
+                    'Symmetry workers %s failed, rerun to resume from the '
+                    'checkpoint in %s'%(failed, checkpoint_directory))
         
-        scene.clear_instances()
+        checkpoint_results, checkpoint_sources = load_symmetry_checkpoint(
+            checkpoint_directory)
+    
+    symmetry_table.update(checkpoint_results)
+    symmetry_sources.update(checkpoint_sources)
     
-    symmetry_table_path = os.path.join(get_ltron_home(), 'symmetry_table.json')
     with open(symmetry_table_path, 'w') as f:
         json.dump(symmetry_table, f, indent=2)
+    with open(sources_path, 'w') as f:
+        json.dump(symmetry_sources, f, indent=2)
+    
+    missing = [
+        brick for brick, source_hash in requested_sources.items()
+        if checkpoint_sources.get(brick) != source_hash
+    ]
+    if missing:
+        print('No symmetries for %i bricks, keeping the checkpoint in %s '
+            'so they are retried on the next run'%(
+                len(missing), checkpoint_directory))
+    elif os.path.exists(checkpoint_directory):
+        shutil.rmtree(checkpoint_directory)
 
 def pose_match_under_symmetries(
     symmetries,
@@ -423,3 +604,81 @@ def brick_pose_match_under_symmetry(
     symmetries = LDRAW_SYMMETRY[part_name]
     return pose_match_under_symmetries(
         symmetries, pose_a, pose_b, metric_tolerance, angular_tolerance)
+
+def batch_pose_match_under_symmetries(
+    symmetry_masks,
+    poses_a,
+    poses_b,
+    metric_tolerance=1.,
+    angular_tolerance=0.08,
+):
+    '''
+    Vectorized version of pose_match_under_symmetries that produces the same
+    results.  symmetry_masks is an (N,6) boolean array of the symmetries
+    allowed for each pair (see compile_symmetry_mask) and poses_a and
+    poses_b are (N,4,4).  Returns a boolean array of length N.
+    '''
+    poses_a = numpy.asarray(poses_a, dtype=float)
+    poses_b = numpy.asarray(poses_b, dtype=float)
+    if not len(poses_a):
+        return numpy.zeros(0, dtype=bool)
+    
+    offsets = poses_a[:,:3,3] - poses_b[:,:3,3]
+    metric_match = (
+        numpy.einsum('ni,ni->n', offsets, offsets) <= metric_tolerance**2)
+    
+    r_a = unscale_transforms(poses_a[:,:3,:3])
+    r_b = unscale_transforms(poses_b[:,:3,:3])
+    r_ab = numpy.einsum('nji,njk->nik', r_a, r_b)
+    
+    t = (numpy.trace(r_ab, axis1=1, axis2=2) - 1) / 2.
+    angle = numpy.arccos(numpy.clip(t, -1., 1.))
+    identity_match = numpy.abs(angle) < angular_tolerance
+    
+    axis = numpy.stack((
+        r_ab[:,2,1] - r_ab[:,1,2],
+        r_ab[:,0,2] - r_ab[:,2,0],
+        r_ab[:,1,0] - r_ab[:,0,1],
+    ), axis=1)
+    s = numpy.linalg.norm(axis, axis=1)
+    degenerate = s < 0.000001
+    axis[degenerate] = [0,1,0]
+    axis[~degenerate] /= s[~degenerate,None]
+    
+    dot_threshold = math.cos(angular_tolerance)
+    axis_match = numpy.abs(
+        numpy.einsum('ni,ki->nk', axis, symmetry_test_axes)) > dot_threshold
+    angle_offset = numpy.abs(
+        numpy.round(angle[:,None] / symmetry_test_angles) *
+        symmetry_test_angles - angle[:,None]
+    )
+    symmetry_match = numpy.any(
+        symmetry_masks & axis_match & (angle_offset < angular_tolerance),
+        axis=1,
+    )
+    
+    return metric_match & (identity_match | symmetry_match)
+
+def batch_pose_match(
+    part_ids,
+    poses_a,
+    poses_b,
+    metric_tolerance=1.,
+    angular_tolerance=0.08,
+):
+    '''
+    Vectorized version of brick_pose_match_under_symmetry that tests N pose
+    pairs at once against the precompiled LDRAW_SYMMETRY_MASK.
+    part_ids is a sequence of N part names.
+    '''
+    indices = numpy.array(
+        [LDRAW_SYMMETRY_INDEX[str(part_id)] for part_id in part_ids],
+        dtype=numpy.int64,
+    )
+    return batch_pose_match_under_symmetries(
+        LDRAW_SYMMETRY_MASK[indices],
+        poses_a,
+        poses_b,
+        metric_tolerance,
+        angular_tolerance,
+    )
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import numpy
+
+from pyquaternion import Quaternion
+
+from ltron.geometry.relative_alignment import (
+    matrices_to_quaternions,
+    quaternions_to_matrices,
+    relative_alignment,
+)
+
+def random_rotations(random, n):
+    qs = random.normal(size=(n,4))
+    qs /= numpy.linalg.norm(qs, axis=-1, keepdims=True)
+    return numpy.array([Quaternion(q).rotation_matrix for q in qs])
+
+def random_configuration(random, n):
+    configuration = numpy.tile(numpy.eye(4), (n,1,1))
+    configuration[:,:3,:3] = random_rotations(random, n)
+    configuration[:,:3,3] = random.uniform(-200, 200, size=(n,3))
+    return configuration
+
+def half_turns(random, n):
+    # 180 degree rotations have w=0, which is where the trace branch fails
+    axes = random.normal(size=(n,3))
+    axes /= numpy.linalg.norm(axes, axis=-1, keepdims=True)
+    axes = numpy.concatenate((numpy.eye(3), axes))
+    return numpy.array([
+        Quaternion(axis=axis, angle=numpy.pi).rotation_matrix
+        for axis in axes
+    ])
+
+def shepperd_branch(rotations):
+    diagonal = numpy.stack((
+        numpy.trace(rotations, axis1=-2, axis2=-1),
+        rotations[:,0,0],
+        rotations[:,1,1],
+        rotations[:,2,2],
+    ), axis=-1)
+    return numpy.argmax(diagonal, axis=-1)
+
+def test_matrices_to_quaternions():
+    random = numpy.random.RandomState(0)
+    rotations = numpy.concatenate((
+        random_rotations(random, 200),
+        half_turns(random, 20),
+        numpy.eye(3)[None],
+    ))
+    assert set(shepperd_branch(rotations)) == {0,1,2,3}
+    
+    qs = matrices_to_quaternions(rotations)
+    assert qs.shape == (len(rotations), 4)
+    assert numpy.allclose(numpy.linalg.norm(qs, axis=-1), 1.)
+    for rotation, q in zip(rotations, qs):
+        expected = Quaternion(matrix=rotation).elements
+        # q and -q are the same rotation
+        assert numpy.isclose(abs(numpy.dot(q, expected)), 1.)
+    
+    assert numpy.allclose(quaternions_to_matrices(qs), rotations)
+    
+    batch = rotations[:12].reshape(3,4,3,3)
+    assert numpy.array_equal(
+        matrices_to_quaternions(batch), qs[:12].reshape(3,4,4))
+
+def relative_offsets(configuration):
+    return (
+        numpy.linalg.inv(configuration)[:,None] @ configuration[None,:])
+
+def test_relative_alignment_recovers_offsets():
+    random = numpy.random.RandomState(1)
+    for n in (1, 2, 5, 20):
+        goal = random_configuration(random, n)
+        current = random_configuration(random, n)
+        offsets = relative_offsets(goal)
+        aligned = relative_alignment(current, offsets, 3)
+        assert aligned.shape == (n,4,4)
+        assert numpy.allclose(relative_offsets(aligned), offsets, atol=1e-6)
+        assert numpy.allclose(aligned[:,3], [0,0,0,1])
+
+def test_relative_alignment_chunked():
+    random = numpy.random.RandomState(2)
+    n = 9
+    goal = random_configuration(random, n)
+    current = random_configuration(random, n)
+    offsets = relative_offsets(goal)
+    
+    full = relative_alignment(current, offsets, 3)
+    for max_chunk_size in (1, n, 2*n+1, n*n-1):
+        chunked = relative_alignment(
+            current, offsets, 3, max_chunk_size=max_chunk_size)
+        assert numpy.allclose(chunked, full, atol=1e-9)
+        assert numpy.allclose(relative_offsets(chunked), offsets, atol=1e-6)
+
+def test_relative_alignment_empty():
+    aligned = relative_alignment(
+        numpy.zeros((0,4,4)), numpy.zeros((0,0,4,4)), 3)
+    assert aligned.shape == (0,4,4)
+    
+    random = numpy.random.RandomState(3)
+    current = random_configuration(random, 3)
+    offsets = relative_offsets(random_configuration(random, 3))
+    assert numpy.array_equal(relative_alignment(current, offsets, 0), current)
+
+if __name__ == '__main__':
+    test_matrices_to_quaternions()
+    test_relative_alignment_recovers_offsets()
+    test_relative_alignment_chunked()
+    test_relative_alignment_empty()
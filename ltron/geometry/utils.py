@@ -42,6 +42,15 @@ def unscale_transform(transform):
         transform[:3,0] *= -1
     return transform
 
+def unscale_transforms(transforms):
+    # vectorized unscale_transform over (...,4,4) or (...,3,3) arrays
+    transforms = numpy.array(transforms, dtype=float)
+    transforms[...,:3,:3] /= numpy.linalg.norm(
+        transforms[...,:3,:3], axis=-2, keepdims=True)
+    mirrored = numpy.linalg.det(transforms[...,:3,:3]) < 0.
+    transforms[mirrored,:3,0] *= -1
+    return transforms
+
 def translate_matrix(t):
     transform = numpy.eye(4)
     transform[:3,3] = t
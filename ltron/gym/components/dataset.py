@@ -89,7 +89,7 @@ class DatasetPathComponent(LtronGymComponent):
             index = self.episode_id % len(self.dataset_ids)
             self.dataset_id = self.dataset_ids[index]
         elif self.reset_mode == 'single_pass':
-            if self.episode_id < len(self.dataset_paths['mpd']):
+            if self.episode_id < len(self.dataset_ids):
             #if self.episode_id < len(self.names):
                 self.dataset_id = self.dataset_ids[self.episode_id]
             else:
@@ -4,6 +4,7 @@ from ltron.gym.spaces import AssemblySpace
 from ltron.hierarchy import hierarchy_branch
 from ltron.gym.components.ltron_gym_component import LtronGymComponent
 from ltron.bricks.brick_scene import BrickScene
+from ltron.dataset.scene_archive import SceneArchive, SceneArchiveException
 
 class EmptySceneComponent(LtronGymComponent):
     def __init__(self,
@@ -103,3 +104,58 @@ class DatasetSceneComponent(EmptySceneComponent):
         observation = super(DatasetSceneComponent, self).reset()
         return observation
 
+
+
+class ArchiveSceneComponent(EmptySceneComponent):
+    '''
+    Like DatasetSceneComponent, but resets from a packed SceneArchive
+    (see ltron.dataset.scene_archive) with set_assembly instead of parsing
+    the LDraw file for each episode.  The archive must have been built from
+    the same dataset, split and subset as the dataset_component so that
+    archive indices line up with dataset ids.
+    '''
+    def __init__(self,
+        dataset_component=None,
+        scene_archive=None,
+        *args,
+        **kwargs
+    ):
+        self.dataset_component = dataset_component
+        if isinstance(scene_archive, str):
+            scene_archive = SceneArchive(scene_archive)
+        self.scene_archive = scene_archive
+        
+        dataset_info = self.dataset_component.dataset_info
+        if (scene_archive.shape_ids != dataset_info['shape_ids'] or
+            scene_archive.color_ids != dataset_info['color_ids']
+        ):
+            raise SceneArchiveException(
+                'Scene archive %s was built with different shape or color ids '
+                'than dataset %s'%(
+                    scene_archive.archive_path, dataset_component.dataset))
+        if len(scene_archive) != self.dataset_component.length:
+            raise SceneArchiveException(
+                'Scene archive %s has %i scenes, but the dataset component '
+                'has %i'%(
+                    scene_archive.archive_path,
+                    len(scene_archive),
+                    self.dataset_component.length,
+                ))
+        
+        super(ArchiveSceneComponent, self).__init__(
+            shape_ids=dataset_info['shape_ids'],
+            color_ids=dataset_info['color_ids'],
+            max_instances=dataset_info['max_instances_per_scene'],
+            max_edges=dataset_info['max_edges_per_scene'],
+            *args,
+            **kwargs,
+        )
+    
+    def reset(self):
+        dataset_id = self.dataset_component.dataset_id
+        self.current_scene_path = self.scene_archive.paths[dataset_id]
+        self.brick_scene.set_assembly(
+            self.scene_archive[dataset_id], self.shape_ids, self.color_ids)
+        
+        self.observe(initial=True)
+        return self.observation
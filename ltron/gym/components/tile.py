@@ -1,5 +1,12 @@
 import numpy
 
+from ltron.compression import (
+    tile_words,
+    tile_hashes,
+    compare_tiles,
+    hashable_frames,
+    background_tile_words,
+)
 from ltron.gym.components.ltron_gym_component import LtronGymComponent
 from ltron.gym.spaces import SegmentationSpace
 
@@ -9,6 +16,7 @@ class DeduplicateTileMaskComponent(LtronGymComponent):
         tile_height,
         render_component,
         background=102,
+        verify=True,
     ):
         self.tile_width = tile_width
         self.tile_height = tile_height
@@ -21,9 +29,41 @@ class DeduplicateTileMaskComponent(LtronGymComponent):
         
         self.observation_space = SegmentationSpace(self.width, self.height, 1)
         self.background = background
+        self.verify = verify
     
     def observe(self):
         frame = self.render_component.observation
+        if hashable_frames(frame, self.background):
+            self.observe_hashed(frame)
+        else:
+            self.observe_elementwise(frame)
+    
+    def observe_hashed(self, frame):
+        # compare tile hashes against the previous frame's, see
+        # ltron.compression
+        words = tile_words(frame, self.tile_height, self.tile_width)
+        hashes = tile_hashes(words)
+        if self.previous_words is None:
+            self.previous_words, self.previous_hashes = background_tile_words(
+                self.background,
+                frame.shape,
+                frame.dtype,
+                self.tile_height,
+                self.tile_width,
+            )
+        modified_tiles = compare_tiles(
+            words,
+            hashes,
+            self.previous_words,
+            self.previous_hashes,
+            verify=self.verify,
+        )
+        self.observation = modified_tiles.astype(numpy.long)
+        
+        self.previous_words = words
+        self.previous_hashes = hashes
+    
+    def observe_elementwise(self, frame):
         h, w, c = frame.shape
         modified_channels = frame != self.previous_frame
         modified_tiles = modified_channels.reshape(
@@ -40,6 +80,8 @@ class DeduplicateTileMaskComponent(LtronGymComponent):
     
     def reset(self):
         self.previous_frame = self.background
+        self.previous_words = None
+        self.previous_hashes = None
         self.observe()
         return self.observation
     
@@ -10,7 +10,11 @@ import numpy
 from ltron.config import Config
 from ltron.gym.envs.ltron_env import LtronEnv
 from ltron.gym.components.scene import (
-    EmptySceneComponent, DatasetSceneComponent, SingleSceneComponent)
+    EmptySceneComponent,
+    DatasetSceneComponent,
+    SingleSceneComponent,
+    ArchiveSceneComponent,
+)
 from ltron.gym.components.episode import MaxEpisodeLengthComponent
 from ltron.gym.components.dataset import DatasetPathComponent
 from ltron.gym.components.render import (
@@ -39,6 +43,7 @@ from ltron.gym.components.tile import DeduplicateTileMaskComponent
 class BreakAndMakeEnvConfig(Config):
     dataset = 'random_construction_6_6'
     ldraw_file = None
+    scene_archive = None
     split = 'train'
     subset = None
     
@@ -125,6 +130,14 @@ class BreakAndMakeEnv(LtronEnv):
         max_edges = dataset_info['max_edges_per_scene']
         
         # scenes
+        if config.egl_device is None:
+            render_args = None
+        else:
+            render_args = {
+                'opengl_mode':'egl',
+                'load_scene':'grey_cube',
+                'egl_device':config.egl_device,
+            }
         if config.ldraw_file is not None:
             components['table_scene'] = SingleSceneComponent(
                 config.ldraw_file,
@@ -134,7 +147,15 @@ class BreakAndMakeEnv(LtronEnv):
                 max_edges,
                 track_snaps=True,
                 collision_checker=config.check_collision,
-                #render_args={'egl_device':config.egl_device},
+                render_args=render_args,
+            )
+        elif config.scene_archive is not None:
+            components['table_scene'] = ArchiveSceneComponent(
+                dataset_component=components['dataset'],
+                scene_archive=config.scene_archive,
+                track_snaps=True,
+                collision_checker=config.check_collision,
+                render_args=render_args,
             )
         else:
             components['table_scene'] = DatasetSceneComponent(
@@ -142,14 +163,14 @@ class BreakAndMakeEnv(LtronEnv):
                 path_location=['mpd'],
                 track_snaps=True,
                 collision_checker=config.check_collision,
-                #render_args={'egl_device':config.egl_device},
+                render_args=render_args,
             )
         components['hand_scene'] = EmptySceneComponent(
             shape_ids=shape_ids,
             color_ids=color_ids,
             max_instances=max_instances,
             max_edges=max_edges,
-            #render_args=hand_render_args,
+            render_args=render_args,
             track_snaps=True,
             collision_checker=False,
         )
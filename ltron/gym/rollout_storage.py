@@ -9,20 +9,17 @@ import gym.spaces as spaces
 
 from ltron.hierarchy import (
     map_hierarchies,
-    index_hierarchy,
-    len_hierarchy,
     concatenate_numpy_hierarchies,
-    stack_numpy_hierarchies,
-    pad_numpy_hierarchy,
     hierarchy_branch,
     increase_capacity,
-    set_index_hierarchy,
+    TreeSpec,
 )
 
 class RolloutStorage:
     def __init__(self, batch_size):
         self.batch_size = batch_size
         self.gym_data = None
+        self.gym_data_spec = None
         
         self.seq_locations = {}
         self.finished_seqs = set()
@@ -74,6 +71,11 @@ class RolloutStorage:
         
         return sub_storage
     
+    def get_gym_data_spec(self):
+        if self.gym_data_spec is None:
+            self.gym_data_spec = TreeSpec(self.gym_data)
+        return self.gym_data_spec
+    
     def append_batch(self, valid=None, **kwargs):
         
         if valid is None:
@@ -85,9 +87,10 @@ class RolloutStorage:
         else:
             #self.gym_data = concatenate_numpy_hierarchies(
             #    self.gym_data, kwargs)
-            if self.batch_index >= len_hierarchy(self.gym_data):
+            spec = self.get_gym_data_spec()
+            if self.batch_index >= spec.len(self.gym_data):
                 self.gym_data = increase_capacity(self.gym_data, factor=2)
-            set_index_hierarchy(
+            spec.set_index(
                 self.gym_data, kwargs,
                 range(self.batch_index, self.batch_index+self.batch_size),
             )
@@ -131,15 +134,7 @@ class RolloutStorage:
         return self.seq_locations[seq][step]
     
     def get_batch_from_storage_ids(self, storage_ids):
-        # WHY IS THIS IF/ELSE NECESSARY?  Can't index_hierarchy handle this?
-        if isinstance(self.gym_data, dict):
-            gym_data = {}
-            for key, value in self.gym_data.items():
-                gym_data[key] = index_hierarchy(value, storage_ids)
-        else:
-            gym_data = index_hierarchy(self.gym_data, storage_ids)
-        
-        return gym_data
+        return self.get_gym_data_spec().index(self.gym_data, storage_ids)
     
     def get_batch(self, seq_step_ids):
         storage_ids = [
@@ -174,11 +169,12 @@ class RolloutStorage:
                 self.get_seq(seq, start, stop)
                 for seq, start, stop in seq_ids
             ]
+        spec = self.get_gym_data_spec()
         seq_lens = numpy.array(
-            [len_hierarchy(d) for d in gym_data], dtype=numpy.long)
+            [spec.len(d) for d in gym_data], dtype=numpy.long)
         max_seq_len = max(seq_lens)
-        gym_data = [pad_numpy_hierarchy(d, max_seq_len) for d in gym_data]
-        gym_data = stack_numpy_hierarchies(*gym_data, axis=axis)
+        gym_data = [spec.pad(d, max_seq_len) for d in gym_data]
+        gym_data = spec.stack(*gym_data, axis=axis)
         return gym_data, seq_lens
     
     def get_current_seqs(self, stack_axis=1, start=None, stop=None):
@@ -81,18 +81,21 @@ def hierarchy_branch(a, branch_keys):
         a = a[key]
     return a
 
-def len_hierarchy(a):
-    class HierarchyLenException(Exception):
-        def __init__(self, length):
-            self.length = length
-    def fn(a):
-        raise HierarchyLenException(len(a))
-
-    try:
-        map_hierarchies(fn, a)
-    except HierarchyLenException as e:
-        return e.length
+def iterate_leaves(a):
+    # leaves in the order map_hierarchies visits them
+    if isinstance(a, dict):
+        for value in a.values():
+            yield from iterate_leaves(value)
+    elif isinstance(a, (tuple, list)):
+        for value in a:
+            yield from iterate_leaves(value)
+    else:
+        yield a
 
+def len_hierarchy(a):
+    for leaf in iterate_leaves(a):
+        return len(leaf)
+    
     return 0
 
 def x_like_hierarchy(a, value):
@@ -122,6 +125,125 @@ def string_index_hierarchy(a, string_index):
     
     return a
 
+def flatten_hierarchy(a, separator='/'):
+    '''
+    Converts a nested dictionary to a flat dictionary mapping
+    separator-joined key paths to leaves.
+    '''
+    flat = {}
+    def flatten(a, prefix):
+        if isinstance(a, dict):
+            for key, value in a.items():
+                flatten(value, prefix + (str(key),))
+        else:
+            flat[separator.join(prefix)] = a
+    flatten(a, ())
+    return flat
+
+def unflatten_hierarchy(flat, separator='/'):
+    '''
+    Inverse of flatten_hierarchy.
+    '''
+    a = {}
+    for path, value in flat.items():
+        keys = path.split(separator)
+        branch = a
+        for key in keys[:-1]:
+            branch = branch.setdefault(key, {})
+        branch[keys[-1]] = value
+    return a
+
+# tree specs ===================================================================
+class TreeSpec:
+    '''
+    The structure of a hierarchy, compiled once so that other hierarchies
+    with the same structure (for example every observation of an env) can be
+    flattened to a list of leaves and rebuilt without recursing:
+    
+    spec = TreeSpec(observations[0])
+    observations = spec.stack(*observations)
+    
+    Dicts and lists/tuples are nodes and everything else is a leaf, like
+    map_hierarchies.  Leaves are ordered the way map_hierarchies visits them
+    and unflatten builds dicts and lists, so the methods return the same
+    results as the corresponding hierarchy functions.  Unlike those, the
+    structure of the inputs is not checked.
+    '''
+    def __init__(self, a):
+        self.paths = []
+        keys = []
+        
+        def key_source(key):
+            if type(key) in (str, int):
+                return repr(key)
+            keys.append(key)
+            return 'k[%i]'%(len(keys)-1)
+        
+        def compile_node(a, path):
+            if isinstance(a, dict):
+                items = []
+                for key, value in a.items():
+                    key = key_source(key)
+                    items.append(
+                        '%s:%s'%(key, compile_node(value, path + (key,))))
+                return '{%s}'%', '.join(items)
+            elif isinstance(a, (tuple, list)):
+                return '[%s]'%', '.join(
+                    compile_node(value, path + (repr(i),))
+                    for i, value in enumerate(a)
+                )
+            else:
+                self.paths.append(path)
+                return 'l[%i]'%(len(self.paths)-1)
+        
+        unflatten_source = compile_node(a, ())
+        leaf_sources = [
+            'a' + ''.join('[%s]'%key for key in path) for path in self.paths]
+        flatten_source = '[%s]'%', '.join(leaf_sources)
+        if leaf_sources:
+            first_source = leaf_sources[0]
+        else:
+            first_source = 'None'
+        
+        namespace = {'k':keys}
+        self.flatten = eval('lambda a : ' + flatten_source, namespace)
+        self.unflatten = eval('lambda l : ' + unflatten_source, namespace)
+        self.first_leaf = eval('lambda a : ' + first_source, namespace)
+    
+    def __len__(self):
+        return len(self.paths)
+    
+    def map(self, fn, *a):
+        if len(a) == 1:
+            return self.unflatten([fn(leaf) for leaf in self.flatten(a[0])])
+        leaves = [self.flatten(aa) for aa in a]
+        return self.unflatten([fn(*l) for l in zip(*leaves)])
+    
+    def index(self, a, index):
+        return self.unflatten([leaf[index] for leaf in self.flatten(a)])
+    
+    def set_index(self, a, b, index):
+        for leaf_a, leaf_b in zip(self.flatten(a), self.flatten(b)):
+            leaf_a[index] = leaf_b
+    
+    def len(self, a):
+        if not self.paths:
+            return 0
+        return len(self.first_leaf(a))
+    
+    def stack(self, *a, **kwargs):
+        leaves = [self.flatten(aa) for aa in a]
+        return self.unflatten(
+            [numpy.stack(l, **kwargs) for l in zip(*leaves)])
+    
+    def concatenate(self, *a, **kwargs):
+        leaves = [self.flatten(aa) for aa in a]
+        return self.unflatten(
+            [numpy.concatenate(l, **kwargs) for l in zip(*leaves)])
+    
+    def pad(self, a, pad, axis=0):
+        return self.map(lambda leaf : pad_numpy_leaf(leaf, pad, axis), a)
+
 # numpy ========================================================================
 def concatenate_numpy_hierarchies(*a, **kwargs):
     def fn(*a):
@@ -133,17 +255,20 @@ def stack_numpy_hierarchies(*a, **kwargs):
         return numpy.stack(a, **kwargs)
     return map_hierarchies(fn, *a)
 
+def pad_numpy_leaf(a, pad, axis=0):
+    if a.shape[axis] < pad:
+        pad_shape = list(a.shape)
+        pad_shape[axis] = pad - a.shape[axis]
+        z = numpy.zeros(pad_shape, dtype=a.dtype)
+        return numpy.concatenate((a, z), axis=axis)
+    
+    else:
+        return a
+
 def pad_numpy_hierarchy(a, pad, axis=0):
     def fn(a):
-        if a.shape[axis] < pad:
-            pad_shape = list(a.shape)
-            pad_shape[axis] = pad - a.shape[axis]
-            z = numpy.zeros(pad_shape, dtype=a.dtype)
-            return numpy.concatenate((a, z), axis=axis)
-
-        else:
-            return a
-
+        return pad_numpy_leaf(a, pad, axis=axis)
+    
     return map_hierarchies(fn, a)
 
 def auto_pad_stack_numpy_hierarchies(*a, pad_axis=0, stack_axis=0, **kwargs):
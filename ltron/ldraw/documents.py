@@ -1,6 +1,10 @@
 import io
 import os
 import zipfile
+import threading
+from collections import OrderedDict, Counter
+from collections.abc import MutableMapping
+from contextlib import contextmanager, nullcontext
 
 from ltron.home import get_ltron_home
 import ltron.settings as settings
@@ -33,7 +37,269 @@ offlib_csl = zipfile.ZipFile(
     io.BytesIO(shadow_zip.open(offlib_csl_path).read()))
 
 #dat_cache = {}
-shared_reference_table = {'ldraw':{}, 'shadow':{}}
+
+def reloadable(reference_name, kind):
+    if kind == 'shadow':
+        return reference_name in SHADOW_PATHS
+    else:
+        return reference_name in LDRAW_PATHS
+
+class LDrawDocumentCache(MutableMapping):
+    '''
+    The 'ldraw' or 'shadow' half of an LDrawReferenceTable.  Behaves like the
+    dictionaries used in an ordinary reference table.
+    '''
+    def __init__(self, table, kind):
+        self.table = table
+        self.kind = kind
+    
+    def __getitem__(self, reference_name):
+        return self.table.get_document(reference_name, self.kind)
+    
+    def __setitem__(self, reference_name, document):
+        self.table.put_document(reference_name, self.kind, document)
+    
+    def __delitem__(self, reference_name):
+        self.table.remove_document(reference_name, self.kind)
+    
+    def __contains__(self, reference_name):
+        return self.table.has_document(reference_name, self.kind)
+    
+    def __iter__(self):
+        return iter(list(self.table.documents[self.kind]))
+    
+    def __len__(self):
+        return len(self.table.documents[self.kind])
+
+class LDrawReferenceTable:
+    '''
+    A bounded replacement for the {'ldraw':{}, 'shadow':{}} dictionary used
+    as a reference table.  Documents are evicted in least recently used order
+    once there are more than max_documents reference names (the ldraw and
+    shadow documents for a name are evicted together) or, if max_commands is
+    set, once the documents hold more than max_commands parsed commands.
+    
+    Eviction only happens when the outermost parse_document call finishes,
+    and never evicts documents used during that call, so a file and all of
+    its references stay resident while it is being loaded and imported.
+    Evicted documents from the LDraw and shadow libraries are parsed again
+    the next time they are looked up.  Documents from other files (MPD files
+    and their internal files) are simply dropped.
+    
+    Library documents that have been looked up pin_threshold times are
+    pinned and never evicted, up to max_pinned of them.  pin and unpin can
+    be used to manage pins explicitly.
+    '''
+    def __init__(
+        self,
+        max_documents=16384,
+        max_commands=None,
+        pin_threshold=64,
+        max_pinned=4096,
+    ):
+        self.max_documents = max_documents
+        self.max_commands = max_commands
+        self.pin_threshold = pin_threshold
+        self.max_pinned = max_pinned
+        
+        self.documents = {'ldraw':{}, 'shadow':{}}
+        self.caches = {
+            'ldraw':LDrawDocumentCache(self, 'ldraw'),
+            'shadow':LDrawDocumentCache(self, 'shadow'),
+        }
+        self.order = OrderedDict()
+        self.pinned = set()
+        self.use_counts = Counter()
+        self.evicted = {'ldraw':set(), 'shadow':set()}
+        self.costs = {}
+        self.uncosted = []
+        self.num_commands = 0
+        
+        self.generation = 0
+        self.loading_depth = 0
+        self.lock = threading.RLock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+    
+    def __getitem__(self, kind):
+        return self.caches[kind]
+    
+    def keys(self):
+        return self.caches.keys()
+    
+    def touch(self, reference_name):
+        self.order[reference_name] = self.generation
+        self.order.move_to_end(reference_name)
+        if (reference_name not in self.pinned and
+            reloadable(reference_name, 'ldraw')
+        ):
+            self.use_counts[reference_name] += 1
+            if (self.use_counts[reference_name] >= self.pin_threshold and
+                len(self.pinned) < self.max_pinned
+            ):
+                self.pinned.add(reference_name)
+    
+    def get_document(self, reference_name, kind):
+        with self.lock:
+            if reference_name in self.documents[kind]:
+                self.hits += 1
+                self.touch(reference_name)
+                return self.documents[kind][reference_name]
+            self.misses += 1
+        
+        if not self.reload(reference_name, kind):
+            raise KeyError(reference_name)
+        return self.documents[kind][reference_name]
+    
+    def has_document(self, reference_name, kind):
+        with self.lock:
+            if reference_name in self.documents[kind]:
+                self.hits += 1
+                self.touch(reference_name)
+                return True
+            self.misses += 1
+        
+        return self.reload(reference_name, kind)
+    
+    def reload(self, reference_name, kind):
+        with self.lock:
+            if reference_name not in self.evicted[kind]:
+                return False
+            self.evicted[kind].discard(reference_name)
+            self.reloads += 1
+        
+        LDrawDocument.parse_document(
+            reference_name, self, shadow=(kind == 'shadow'))
+        return reference_name in self.documents[kind]
+    
+    def put_document(self, reference_name, kind, document):
+        with self.lock:
+            self.discard_cost(reference_name, kind)
+            self.documents[kind][reference_name] = document
+            self.uncosted.append((reference_name, kind))
+            self.evicted[kind].discard(reference_name)
+            self.touch(reference_name)
+    
+    def remove_document(self, reference_name, kind):
+        with self.lock:
+            del(self.documents[kind][reference_name])
+            self.discard_cost(reference_name, kind)
+            if not any(reference_name in d for d in self.documents.values()):
+                self.order.pop(reference_name, None)
+    
+    def discard_cost(self, reference_name, kind):
+        self.num_commands -= self.costs.pop((reference_name, kind), 0)
+    
+    def update_costs(self):
+        # documents are added to the table before their commands are parsed,
+        # so their cost is only known once loading has finished
+        for reference_name, kind in self.uncosted:
+            document = self.documents[kind].get(reference_name, None)
+            if document is None or (reference_name, kind) in self.costs:
+                continue
+            cost = len(getattr(document, 'commands', ()))
+            self.costs[reference_name, kind] = cost
+            self.num_commands += cost
+        self.uncosted.clear()
+    
+    def over_budget(self):
+        if (self.max_documents is not None and
+            len(self.order) > self.max_documents
+        ):
+            return True
+        if (self.max_commands is not None and
+            self.num_commands > self.max_commands
+        ):
+            return True
+        return False
+    
+    def evict(self, reference_name):
+        del(self.order[reference_name])
+        for kind, documents in self.documents.items():
+            if reference_name not in documents:
+                continue
+            del(documents[reference_name])
+            self.discard_cost(reference_name, kind)
+            if reloadable(reference_name, kind):
+                self.evicted[kind].add(reference_name)
+        self.evictions += 1
+    
+    def trim(self):
+        with self.lock:
+            self.update_costs()
+            for reference_name, generation in list(self.order.items()):
+                if not self.over_budget():
+                    break
+                if reference_name in self.pinned:
+                    continue
+                if generation == self.generation:
+                    continue
+                self.evict(reference_name)
+    
+    @contextmanager
+    def loading(self):
+        with self.lock:
+            if self.loading_depth == 0:
+                self.generation += 1
+            self.loading_depth += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.loading_depth -= 1
+                if self.loading_depth == 0:
+                    self.trim()
+    
+    def pin(self, reference_names):
+        with self.lock:
+            self.pinned.update(reference_names)
+    
+    def unpin(self, reference_names):
+        with self.lock:
+            self.pinned.difference_update(reference_names)
+    
+    def clear(self, keep_pins=True):
+        with self.lock:
+            for documents in self.documents.values():
+                documents.clear()
+            self.order.clear()
+            for evicted in self.evicted.values():
+                evicted.clear()
+            self.costs.clear()
+            self.uncosted.clear()
+            self.num_commands = 0
+            self.use_counts.clear()
+            if not keep_pins:
+                self.pinned.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.reloads = 0
+    
+    def stats(self):
+        with self.lock:
+            self.update_costs()
+            return {
+                'size' : len(self.order),
+                'max_documents' : self.max_documents,
+                'num_commands' : self.num_commands,
+                'max_commands' : self.max_commands,
+                'pinned' : len(self.pinned),
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'evictions' : self.evictions,
+                'reloads' : self.reloads,
+            }
+
+def document_loading(reference_table):
+    if isinstance(reference_table, LDrawReferenceTable):
+        return reference_table.loading()
+    return nullcontext()
+
+shared_reference_table = LDrawReferenceTable()
 
 class LDrawMissingFileComment(LDrawException):
     pass
@@ -43,31 +309,32 @@ class LDrawDocument:
     def parse_document(
         file_path, reference_table=shared_reference_table, shadow = False
     ):
-        file_name, ext = os.path.splitext(file_path)
-        if ext == '.mpd' or ext == '.ldr' or ext == '.l3b':
-            try:
-                return LDrawMPDMainFile(file_path, reference_table, shadow)
-            except LDrawMissingFileComment:
-                return LDrawLDR(file_path, reference_table, shadow)
-        # this doesn't work because a lot of ".ldr" files are actually
-        # structured as ".mpd" files
-        #elif ext == '.ldr':
-        #    return LDrawLDR(file_path, reference_table, shadow)
-        elif ext == '.dat':
-            '''
-            if file_path in dat_cache:
-                dat = dat_cache[file_path]
-                dat.set_reference_table(reference_table)
-                return dat
+        with document_loading(reference_table):
+            file_name, ext = os.path.splitext(file_path)
+            if ext == '.mpd' or ext == '.ldr' or ext == '.l3b':
+                try:
+                    return LDrawMPDMainFile(file_path, reference_table, shadow)
+                except LDrawMissingFileComment:
+                    return LDrawLDR(file_path, reference_table, shadow)
+            # this doesn't work because a lot of ".ldr" files are actually
+            # structured as ".mpd" files
+            #elif ext == '.ldr':
+            #    return LDrawLDR(file_path, reference_table, shadow)
+            elif ext == '.dat':
+                '''
+                if file_path in dat_cache:
+                    dat = dat_cache[file_path]
+                    dat.set_reference_table(reference_table)
+                    return dat
+                else:
+                    dat = LDrawDAT(file_path, reference_table, shadow)
+                    if dat.reference_name in LDRAW_PARTS:
+                        dat_cache[file_path] = dat
+                    return dat
+                '''
+                return LDrawDAT(file_path, reference_table, shadow)
             else:
-                dat = LDrawDAT(file_path, reference_table, shadow)
-                if dat.reference_name in LDRAW_PARTS:
-                    dat_cache[file_path] = dat
-                return dat
-            '''
-            return LDrawDAT(file_path, reference_table, shadow)
-        else:
-            raise ValueError('Unknown extension: %s (%s)'%(file_path, ext))
+                raise ValueError('Unknown extension: %s (%s)'%(file_path, ext))
     
     def set_reference_table(self, reference_table):
         if reference_table is None:
@@ -7,7 +7,7 @@ import tqdm
 from scipy.spatial import cKDTree
 
 #from ltron.geometry.utils import default_allclose
-from ltron.geometry.symmetry import brick_pose_match_under_symmetry
+from ltron.geometry.symmetry import batch_pose_match
 
 def match_assemblies(
     assembly_a,
@@ -153,31 +153,209 @@ def match_assemblies(
 def validate_matches(assembly_a, assembly_b, matches, a_to_b, part_names):
     # Ensure that shapes match, colors match, poses match and that each brick
     # is only matched to one other.
+    candidate_a, candidate_b = validate_candidates(
+        assembly_a, assembly_b, matches, a_to_b, part_names)
+    return first_matches(candidate_a, candidate_b)
+
+def validate_candidates(assembly_a, assembly_b, matches, a_to_b, part_names):
+    # Returns the (a,b) candidates in matches whose shapes, colors and poses
+    # agree, in order, without removing multiple matches for the same a.
+    candidates = [
+        (a,b) for a, a_matches in enumerate(matches) for b in a_matches]
+    if not len(candidates):
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    candidate_a, candidate_b = numpy.array(candidates).T
+    
+    shape_a = assembly_a['shape'][candidate_a]
+    shape_b = assembly_b['shape'][candidate_b]
+    color_a = assembly_a['color'][candidate_a]
+    color_b = assembly_b['color'][candidate_b]
+    keep = (
+        (shape_a == shape_b) & (shape_a != 0) &
+        (color_a == color_b) & (color_a != 0)
+    )
+    candidate_a = candidate_a[keep]
+    candidate_b = candidate_b[keep]
+    
+    # Test all remaining poses at once.
+    transformed_poses_a = a_to_b @ assembly_a['pose'][candidate_a]
+    poses_b = assembly_b['pose'][candidate_b]
+    pose_match = batch_pose_match(
+        [part_names[s] for s in shape_a[keep]],
+        transformed_poses_a,
+        poses_b,
+    )
+    
+    return candidate_a[pose_match], candidate_b[pose_match]
+
+def first_matches(candidate_a, candidate_b):
+    # Keep the first valid b for each a.
     valid_matches = set()
-    for a, a_matches in enumerate(matches):
-        for b in a_matches:
-            shape_a = assembly_a['shape'][a]
-            shape_b = assembly_b['shape'][b]
-            if shape_a != shape_b or shape_a == 0 or shape_b == 0:
-                continue
-            
-            color_a = assembly_a['color'][a]
-            color_b = assembly_b['color'][b]
-            if color_a != color_b or color_a == 0 or color_b == 0:
-                continue
-            
-            transformed_pose_a = a_to_b @ assembly_a['pose'][a]
-            pose_b = assembly_b['pose'][b]
-            if not brick_pose_match_under_symmetry(
-                part_names[shape_a], transformed_pose_a, pose_b
-            ):
-                continue
-            
-            valid_matches.add((a,b))
-            break
+    matched_a = set()
+    for a, b in zip(candidate_a, candidate_b):
+        a = int(a)
+        if a not in matched_a:
+            matched_a.add(a)
+            valid_matches.add((a, int(b)))
     
     return valid_matches
 
+class AssemblyMatcher:
+    '''
+    Matches two assemblies repeatedly while matched bricks are removed from
+    them (see ltron.score.edit_distance).  After remove, match returns the
+    same result as match_assemblies on copies of the assemblies where the
+    removed bricks have shape and color 0.  But the assemblies are not copied,
+    the kdtree is only built once, and each offset is only queried and
+    validated once.  Removing bricks does not move the others, so the
+    kdtree query and pose validation for an offset (computed over all
+    bricks) stay valid and only need to be filtered to the remaining bricks.
+    '''
+    def __init__(self, assembly_a, assembly_b, part_names, radius=0.01):
+        self.original_a = assembly_a
+        self.original_b = assembly_b
+        self.assembly_a = {
+            'shape' : numpy.array(assembly_a['shape']),
+            'color' : numpy.array(assembly_a['color']),
+            'pose' : assembly_a['pose'],
+        }
+        self.assembly_b = {
+            'shape' : numpy.array(assembly_b['shape']),
+            'color' : numpy.array(assembly_b['color']),
+            'pose' : assembly_b['pose'],
+        }
+        self.part_names = part_names
+        self.radius = radius
+        self.kdtree = cKDTree(assembly_b['pose'][:,:3,3])
+        
+        # (a,b) -> (offset, transformed positions, which a have a neighbor)
+        self.queries = {}
+        # (a,b) -> valid (candidate_a, candidate_b) over all bricks
+        self.candidates = {}
+    
+    def remove(self, a_to_b):
+        for a, b in a_to_b.items():
+            self.assembly_a['shape'][a] = 0
+            self.assembly_a['color'][a] = 0
+            self.assembly_b['shape'][b] = 0
+            self.assembly_b['color'][b] = 0
+    
+    def query(self, a, bs):
+        # Computes the offsets that align a with each b in bs and which
+        # bricks in assembly_a have a neighbor in assembly_b under each
+        # offset, all in one kdtree query.
+        new_bs = [b for b in bs if (a,b) not in self.queries]
+        if new_bs:
+            pose_a = self.assembly_a['pose'][a]
+            poses_b = self.assembly_b['pose'][new_bs]
+            a_to_bs = poses_b @ numpy.linalg.inv(pose_a)
+            transformed_a = numpy.matmul(
+                a_to_bs[:,None], self.assembly_a['pose'][None])
+            pos_a = transformed_a[:,:,:3,3]
+            has_match = self.kdtree.query_ball_point(
+                pos_a.reshape(-1,3), self.radius, return_length=True
+            ).reshape(len(new_bs), -1) != 0
+            for i, b in enumerate(new_bs):
+                self.queries[a,b] = (a_to_bs[i], pos_a[i], has_match[i])
+    
+    def valid_matches(self, a, b):
+        if (a,b) not in self.candidates:
+            a_to_b, pos_a, has_match = self.queries[a,b]
+            matches = self.kdtree.query_ball_point(pos_a, self.radius)
+            self.candidates[a,b] = validate_candidates(
+                self.original_a,
+                self.original_b,
+                matches,
+                a_to_b,
+                self.part_names,
+            )
+        
+        candidate_a, candidate_b = self.candidates[a,b]
+        remaining = (
+            (self.assembly_a['shape'][candidate_a] != 0) &
+            (self.assembly_b['shape'][candidate_b] != 0)
+        )
+        return first_matches(candidate_a[remaining], candidate_b[remaining])
+    
+    def match(self):
+        # This follows match_assemblies step for step, see the comments
+        # there.
+        assembly_a = self.assembly_a
+        assembly_b = self.assembly_b
+        
+        ab_tested_matches = set()
+        
+        unique_a, count_a = numpy.unique(
+            assembly_a['shape'], return_counts=True)
+        sort_order = numpy.argsort(count_a)
+        shape_order = unique_a[sort_order]
+        
+        best_matches = set()
+        best_offset = numpy.eye(4)
+        
+        matched_a = set()
+        matched_b = set()
+        
+        finished = False
+        while not finished:
+            finished = True
+            for s in shape_order:
+                if s == 0:
+                    continue
+                
+                instance_indices_b = numpy.where(assembly_b['shape'] == s)[0]
+                if not len(instance_indices_b):
+                    continue
+                
+                instance_indices_a = numpy.where(assembly_a['shape'] == s)[0]
+                
+                for a in instance_indices_a:
+                    color_a = assembly_a['color'][a]
+                    self.query(int(a), [
+                        int(b) for b in instance_indices_b
+                        if not (a in matched_a and b in matched_b) and
+                        (a,b) not in ab_tested_matches and
+                        assembly_b['color'][b] == color_a
+                    ])
+                    for b in instance_indices_b:
+                        if a in matched_a and b in matched_b:
+                            continue
+                        
+                        if (a,b) in ab_tested_matches:
+                            continue
+                        
+                        color_b = assembly_b['color'][b]
+                        if color_a != color_b:
+                            continue
+                        
+                        a_to_b, pos_a, has_match = self.queries[a,b]
+                        potential_matches = numpy.count_nonzero(
+                            has_match & (assembly_a['shape'] != 0))
+                        if potential_matches <= len(best_matches):
+                            continue
+                        
+                        valid_matches = self.valid_matches(int(a), int(b))
+                        ab_tested_matches.update(valid_matches)
+                        
+                        if len(valid_matches) > len(best_matches):
+                            best_matches.clear()
+                            best_matches.update(valid_matches)
+                            best_offset = a_to_b
+                            matched_a.clear()
+                            matched_b.clear()
+                            matched_a.update(set(a for a,b in valid_matches))
+                            matched_b.update(set(b for a,b in valid_matches))
+                            finished = False
+                            break
+                    
+                    if not finished:
+                        break
+                
+                if not finished:
+                    break
+        
+        return best_matches, best_offset
+
 def match_lookup(matching, assembly_a, assembly_b):
     a_to_b = {a:b for a, b in matching}
     b_to_a = {b:a for a, b in matching}
@@ -0,0 +1,90 @@
+import numpy
+
+def membership_mask(membership):
+    '''
+    Converts a collection of instance ids to an integer bitmask.
+    '''
+    mask = 0
+    for i in membership:
+        mask |= 1 << int(i)
+    return mask
+
+class AssemblyGraph:
+    '''
+    Undirected connectivity of an assembly, built once from its (4,n) edge
+    array.  Padding columns (instance 0) are dropped.  The adjacency is kept
+    in CSR form (indptr, indices) and as one neighbor bitmask per instance so
+    that connectivity queries restricted to a membership can be answered with
+    integer bit operations.
+    '''
+    def __init__(self, assembly):
+        edges = numpy.asarray(assembly['edges'])
+        valid = (edges[0] != 0) & (edges[1] != 0) & (edges[0] != edges[1])
+        src = edges[0, valid].astype(numpy.int64)
+        dst = edges[1, valid].astype(numpy.int64)
+        src, dst = (
+            numpy.concatenate((src, dst)), numpy.concatenate((dst, src)))
+        pairs = numpy.unique(numpy.stack((src, dst), axis=1), axis=0)
+        pairs = pairs.reshape(-1, 2)
+
+        num_instances = max(
+            len(assembly['shape']), int(pairs.max(initial=-1)) + 1)
+        self.num_instances = num_instances
+        counts = numpy.bincount(pairs[:,0], minlength=num_instances)
+        self.indptr = numpy.concatenate(([0], numpy.cumsum(counts)))
+        self.indices = pairs[:,1]
+
+        self.neighbor_masks = [
+            membership_mask(self.neighbors(i)) for i in range(num_instances)]
+        # ids outside the assembly have no edges
+        self.instance_mask = (1 << num_instances) - 1
+
+    def neighbors(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+    def connected_to(self, i, membership):
+        '''
+        Returns True if instance i shares an edge with any member.
+        '''
+        if not isinstance(membership, int):
+            membership = membership_mask(membership)
+        if not 0 <= i < self.num_instances:
+            return False
+        return bool(self.neighbor_masks[i] & membership)
+
+    def connected_without(self, membership, remove):
+        '''
+        Returns True if the members other than remove form a single connected
+        component when restricted to edges between them.  Returns None if no
+        member other than remove shares an edge with any member, in which
+        case there is nowhere to start the search from.  Members outside
+        the assembly have no edges, so they are never connected.
+        '''
+        if not isinstance(membership, int):
+            membership = membership_mask(membership)
+        remaining = membership & ~(1 << int(remove))
+
+        start = None
+        bits = remaining & self.instance_mask
+        while bits:
+            low_bit = bits & -bits
+            i = low_bit.bit_length() - 1
+            if self.neighbor_masks[i] & membership:
+                start = i
+                break
+            bits ^= low_bit
+        if start is None:
+            return None
+
+        reached = 1 << start
+        frontier = [start]
+        while frontier:
+            i = frontier.pop()
+            new = self.neighbor_masks[i] & remaining & ~reached
+            reached |= new
+            while new:
+                low_bit = new & -new
+                frontier.append(low_bit.bit_length() - 1)
+                new ^= low_bit
+
+        return reached == remaining
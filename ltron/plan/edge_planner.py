@@ -8,7 +8,7 @@ import numpy
 from splendor.image import save_image
 
 from ltron.bricks.snap import SnapFinger
-from ltron.bricks.brick_shape import BrickShape
+from ltron.bricks.brick_shape import get_brick_shape
 from ltron.bricks.brick_instance import BrickInstance
 from ltron.exceptions import LtronException
 from ltron.geometry.utils import default_allclose, unscale_transform
@@ -306,7 +306,7 @@ def compute_discrete_rotation(
         wip_transform
     )
     
-    brick_shape = BrickShape(brick_shape_name)
+    brick_shape = get_brick_shape(brick_shape_name)
     snap_transform = brick_shape.snaps[snap].transform
     inv_snap_transform = numpy.linalg.inv(snap_transform)
     wip_snap_transform = wip_transform @ snap_transform
@@ -403,7 +403,7 @@ def plan_add_first_brick(
     brick_transform = goal_assembly['pose'][instance]
     
     # find the upright snaps ---------------------------------------------------
-    brick_shape = BrickShape(shape_id_to_brick_shape[shape_index])
+    brick_shape = get_brick_shape(shape_id_to_brick_shape[shape_index])
     brick_instance = BrickInstance(0, brick_shape, color_index, brick_transform)
     upright_snaps = brick_instance.get_upright_snaps()
     
@@ -859,7 +859,7 @@ def plan_remove_nth_brick(
     
     if not len(wip_instances):
         brick_shape = wip_assembly['shape'][wip_instance]
-        brick_shape = BrickShape(shape_id_to_brick_shape[brick_shape])
+        brick_shape = get_brick_shape(shape_id_to_brick_shape[brick_shape])
         instance_snaps = numpy.array(range(len(brick_shape.snaps)))
     
     # compute the table camera motion
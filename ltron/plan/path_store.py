@@ -0,0 +1,137 @@
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+from ltron.exceptions import LtronException
+
+class PathStoreException(LtronException):
+    pass
+
+class PathStore:
+    '''
+    Stores the observations and env states produced while evaluating the
+    edges of a Roadmap.  Only the actions of each edge are guaranteed to stay
+    in memory.  Everything else can be recovered from them, because the
+    observations and end state of an edge are a deterministic function of the
+    state it started from and its actions.
+
+    observation_storage controls where edge observations are kept:
+        'memory' : in memory, as before
+        'spill' : pickled to a (temporary) directory on disk
+        'regenerate' : discarded, and regenerated by replaying the actions
+
+    max_resident_states bounds the number of env states held in memory.  The
+    least recently used states are evicted first, except for the start state
+    which is pinned.  Evicted states are rebuilt by replaying actions from
+    the nearest resident ancestor.
+    '''
+    def __init__(
+        self,
+        env,
+        observation_storage='memory',
+        max_resident_states=None,
+        spill_directory=None,
+    ):
+        if observation_storage not in ('memory', 'spill', 'regenerate'):
+            raise PathStoreException(
+                'Unknown observation storage: %s'%observation_storage)
+        self.env = env
+        self.observation_storage = observation_storage
+        self.max_resident_states = max_resident_states
+
+        self.action_seqs = {}
+        self.env_states = OrderedDict()
+        self.observation_seqs = {}
+        self.pinned = set()
+
+        if observation_storage == 'spill':
+            # the TemporaryDirectory removes itself when the store is
+            # garbage collected
+            self.spill_directory = tempfile.TemporaryDirectory(
+                dir=spill_directory, prefix='ltron_path_store_')
+            self.spill_count = 0
+
+    def set_start(self, path, env_state):
+        self.action_seqs[path] = []
+        self.env_states[path] = env_state
+        self.pinned.add(path)
+
+    def add_edge(self, path, observation_seq, action_seq, env_state):
+        self.action_seqs[path] = action_seq
+        self.put_env_state(path, env_state)
+
+        if self.observation_storage == 'memory':
+            self.observation_seqs[path] = observation_seq
+        elif self.observation_storage == 'spill':
+            self.spill_count += 1
+            spill_path = os.path.join(
+                self.spill_directory.name, '%08i.pkl'%self.spill_count)
+            with open(spill_path, 'wb') as f:
+                pickle.dump(observation_seq, f, pickle.HIGHEST_PROTOCOL)
+            self.observation_seqs[path] = spill_path
+
+    def remove(self, path):
+        self.action_seqs.pop(path, None)
+        self.env_states.pop(path, None)
+        self.pinned.discard(path)
+        observation_seq = self.observation_seqs.pop(path, None)
+        if self.observation_storage == 'spill' and observation_seq is not None:
+            os.remove(observation_seq)
+
+    def put_env_state(self, path, env_state):
+        self.env_states[path] = env_state
+        self.env_states.move_to_end(path)
+        if self.max_resident_states is None:
+            return
+
+        num_evict = len(self.env_states) - self.max_resident_states
+        if num_evict <= 0:
+            return
+
+        # only walk as far as the least recently used unpinned states
+        evict = []
+        for p in self.env_states:
+            if p in self.pinned:
+                continue
+            evict.append(p)
+            if len(evict) == num_evict:
+                break
+        for p in evict:
+            del(self.env_states[p])
+
+    def replay_edge(self, path, collect_observations=False):
+        '''
+        Replays the actions of the last edge of path starting from the (possibly
+        rebuilt) state of its parent, leaving the env at the end of the edge.
+        '''
+        observation = self.env.set_state(self.get_env_state(path[:-1]))
+        observation_seq = [observation]
+        for action in self.action_seqs[path]:
+            observation, reward, terminal, info = self.env.step(action)
+            if collect_observations:
+                observation_seq.append(observation)
+
+        return observation_seq
+
+    def get_env_state(self, path):
+        if path in self.env_states:
+            self.env_states.move_to_end(path)
+            return self.env_states[path]
+
+        if path not in self.action_seqs or len(path) < 2:
+            raise PathStoreException('No state for path: %s'%(path,))
+
+        self.replay_edge(path)
+        env_state = self.env.get_state()
+        self.put_env_state(path, env_state)
+        return env_state
+
+    def get_observation_seq(self, path):
+        if self.observation_storage == 'memory':
+            return self.observation_seqs[path]
+        elif self.observation_storage == 'spill':
+            with open(self.observation_seqs[path], 'rb') as f:
+                return pickle.load(f)
+        else:
+            return self.replay_edge(path, collect_observations=True)
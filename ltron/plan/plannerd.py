@@ -10,10 +10,12 @@ import numpy
 
 from ltron.exceptions import LtronException
 from ltron.bricks.brick_scene import BrickScene
-from ltron.geometry.collision import build_collision_map
+from ltron.geometry.collision import (
+    build_collision_map, BitmaskCollisionMap)
 from ltron.matching import match_assemblies, match_lookup
 from ltron.bricks.brick_instance import BrickInstance
-from ltron.bricks.brick_shape import BrickShape
+from ltron.bricks.brick_shape import get_brick_shape
+from ltron.plan.connectivity import AssemblyGraph
 
 from ltron.plan.edge_planner import (
     plan_add_first_brick,
@@ -35,11 +37,11 @@ def node_connected_collision_free(
     new_brick_shape_name,
     existing_bricks,
     goal_state,
-    collision_map,
+    collision_bits,
     goal_assembly,
 ):
     if not len(existing_bricks):
-        brick_shape = BrickShape(new_brick_shape_name)
+        brick_shape = get_brick_shape(new_brick_shape_name)
         brick_transform = goal_assembly['pose'][new_brick]
         brick_instance = BrickInstance(0, brick_shape, 0, brick_transform)
         upright_snaps = brick_instance.get_upright_snaps()
@@ -56,16 +58,10 @@ def node_connected_collision_free(
         updated_bricks = existing_bricks | frozenset((new_brick,))
 
         unadded_bricks = goal_state - updated_bricks
-        for unadded_brick in unadded_bricks:
-            for axis, polarity, snap_group in collision_map[unadded_brick]:
-                colliding_bricks = collision_map[unadded_brick][
-                    axis, polarity, snap_group]
-                colliding_bricks = frozenset(colliding_bricks)
-                if not len(colliding_bricks & updated_bricks):
-                    break
-            
-            else:
-                return False
+        membership_words = collision_bits.encode(updated_bricks)
+        if not collision_bits.all_have_free_group(
+            unadded_bricks, membership_words):
+            return False
         
         return True
 
@@ -73,56 +69,23 @@ def node_removable_collision_free(
     remove_brick,
     remove_brick_shape_name,
     existing_bricks,
-    collision_map,
+    collision_bits,
     start_assembly,
     maintain_connectivity=False,
+    assembly_graph=None,
 ):
     if maintain_connectivity and len(existing_bricks) > 1:
-        # this is not efficient, but I don't care yet
-        edges = start_assembly['edges']
-        connectivity = {}
-        for i in range(edges.shape[1]):
-            if edges[0,i] == 0:
-                continue
-            
-            if edges[0,i] not in existing_bricks:
-                continue
-            
-            if edges[0,i] == remove_brick:
-                continue
-            
-            if edges[1,i] in existing_bricks:
-                connectivity.setdefault(edges[0,i], set())
-                if edges[1,i] == remove_brick:
-                    continue
-                connectivity[edges[0,i]].add(edges[1,i])
-        
-        connected = set()
-        try:
-            frontier = [list(connectivity.keys())[0]]
-        except:
+        if assembly_graph is None:
+            assembly_graph = AssemblyGraph(start_assembly)
+        connected = assembly_graph.connected_without(
+            existing_bricks, remove_brick)
+        if connected is None:
             raise FrontierError
-        while frontier:
-            node = frontier.pop()
-            if node in connected:
-                continue
-            
-            connected.add(node)
-            frontier.extend(connectivity[node])
-        
-        if len((existing_bricks - {remove_brick}) - connected):
+        if not connected:
             return False
     
-    for axis, polarity, snap_group in collision_map[remove_brick]:
-        colliding_bricks = collision_map[remove_brick][
-            axis, polarity, snap_group]
-        colliding_bricks = frozenset(colliding_bricks)
-        if not len(colliding_bricks & existing_bricks):
-            break
-    else:
-        return False
-    
-    return True
+    membership_words = collision_bits.encode(existing_bricks)
+    return collision_bits.has_free_group(remove_brick, membership_words)
 
 class Roadmap:
     def __init__(self, env, goal_assembly, shape_ids, color_ids):
@@ -145,6 +108,7 @@ class Roadmap:
         goal_scene.import_assembly(
             self.goal_assembly, self.brick_shape_to_shape_id, self.color_ids)
         self.goal_collision_map = build_collision_map(goal_scene)
+        self.goal_collision_bits = BitmaskCollisionMap(self.goal_collision_map)
     
     def get_observation_action_seq(self, path):
         observation_seq = []
@@ -196,6 +160,9 @@ class RoadmapPlanner:
             self.roadmap.color_ids,
         )
         self.start_collision_map = build_collision_map(start_scene)
+        self.start_collision_bits = BitmaskCollisionMap(
+            self.start_collision_map)
+        self.start_graph = AssemblyGraph(self.start_assembly)
     
     def make_false_positive_labels(self, fp):
         max_fp = max(self.roadmap.false_positive_labels, default=0)
@@ -284,9 +251,10 @@ class RoadmapPlanner:
                     false_positive,
                     self.roadmap.shape_id_to_brick_shape[false_positive_shape],
                     state,
-                    self.start_collision_map,
+                    self.start_collision_bits,
                     self.start_assembly,
                     maintain_connectivity=True,
+                    assembly_graph=self.start_graph,
                 ):
                     successor = state - frozenset((false_positive,))
                     successors.add(successor)
@@ -302,7 +270,7 @@ class RoadmapPlanner:
                     self.roadmap.shape_id_to_brick_shape[false_negative_shape],
                     state,
                     self.roadmap.goal_state,
-                    self.roadmap.goal_collision_map,
+                    self.roadmap.goal_collision_bits,
                     self.roadmap.goal_assembly,
                 ):
                     successor = state | frozenset((false_negative,))
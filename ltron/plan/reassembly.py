@@ -1,13 +1,15 @@
+import os
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy
 
 from PIL import Image
 
-from ltron.bricks.brick_shape import BrickShape
+from ltron.bricks.brick_shape import get_brick_shape
 from ltron.gym.reassembly_env import handspace_reassembly_template_action
 from ltron.matching import match_configurations, match_lookup
-from ltron.hierarchy import len_hierarchy, index_hierarchy
+from ltron.hierarchy import TreeSpec
 from ltron.visualization.drawing import stack_images_horizontal, write_text
 
 class ExpertError(Exception):
@@ -34,14 +36,74 @@ class CantFindSnapError(ExpertError):
 class TooManyRotatableSnapsError(ExpertError):
     pass
 
+def batch_presence(ids):
+    '''
+    Takes a (b,...) array of non-negative integer ids and returns a (b,n)
+    boolean array marking which ids appear in each batch entry.
+    '''
+    b = ids.shape[0]
+    flat_ids = ids.reshape(b, -1).astype(numpy.int64)
+    n = int(flat_ids.max(initial=0)) + 1
+    offset_ids = flat_ids + numpy.arange(b).reshape(-1,1) * n
+    counts = numpy.bincount(offset_ids.reshape(-1), minlength=b*n)
+    return counts.reshape(b, n) > 0
+
 class ReassemblyExpert:
-    def __init__(self, batch_size, shape_ids, color_ids):
+    '''
+    Computes expert actions for a batch of stacked observations.  Anything
+    that can be computed for the whole batch at once (which instances and
+    snaps are visible) is done up front with numpy before the per-item
+    decision logic runs.  Visualizations are only written when visualize is
+    True, in a background thread so they do not stall the expert.
+    '''
+    def __init__(
+        self,
+        batch_size,
+        shape_ids,
+        color_ids,
+        visualize=False,
+        visualization_directory='.',
+        verbose=False,
+    ):
         self.batch_size = batch_size
         self.shape_ids = shape_ids
         self.class_names = {value:key for key, value in shape_ids.items()}
         self.color_ids = color_ids
         self.color_names = {value:key for key, value in color_ids.items()}
         self.broken_seqs = {}
+        self.brick_shapes = {}
+        self.visualize = visualize
+        self.visualization_directory = visualization_directory
+        self.visualization_count = 0
+        self.visualization_executor = None
+        self.verbose = verbose
+        
+        # compiled from the first batch, every later batch has the same
+        # structure
+        self.observation_spec = None
+        self.feature_spec = None
+    
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
+    
+    def get_brick_shape(self, brick_class):
+        brick_class = int(brick_class)
+        if brick_class not in self.brick_shapes:
+            self.brick_shapes[brick_class] = get_brick_shape(
+                self.class_names[brick_class])
+        return self.brick_shapes[brick_class]
+    
+    def batch_features(self, observations):
+        return {
+            'workspace_visible_instances' : batch_presence(
+                observations['workspace_segmentation_render']),
+            'handspace_visible_snaps' : batch_presence(numpy.concatenate((
+                observations['handspace_pos_snap_render'][...,1],
+                observations['handspace_neg_snap_render'][...,1]),
+                axis=1,
+            )),
+        }
     
     def __call__(
         self,
@@ -51,7 +113,11 @@ class ReassemblyExpert:
         seq_ids=None,
         frame_ids=None
     ):
-        num_observations = len_hierarchy(observations)
+        batch_features = self.batch_features(observations)
+        if self.observation_spec is None:
+            self.observation_spec = TreeSpec(observations)
+            self.feature_spec = TreeSpec(batch_features)
+        num_observations = self.observation_spec.len(observations)
         actions = []
         statusses = []
         for i in range(num_observations):
@@ -62,8 +128,10 @@ class ReassemblyExpert:
                 else:
                     seq_id = seq_ids[i]
                     frame_id = frame_ids[i]
+                observation = self.observation_spec.index(observations, i)
+                observation.update(self.feature_spec.index(batch_features, i))
                 action = self.act(
-                    index_hierarchy(observations, i),
+                    observation,
                     check_collision=check_collision,
                     unfixable_mode=unfixable_mode,
                     seq_id=seq_id,
@@ -82,7 +150,7 @@ class ReassemblyExpert:
                     self.broken_seqs[type_str] = 0
                 self.broken_seqs[type_str] += 1
                 for c, n in self.broken_seqs.items():
-                    print('%s: %i'%(str(c), n))
+                    self.log('%s: %i'%(str(c), n))
                 
         return actions, statusses
     
@@ -94,14 +162,15 @@ class ReassemblyExpert:
         seq_id=None,
         frame_id=None,
     ):
-        observation['workspace_visualization'] = (
-            observation['workspace_color_render'].copy())
-        observation['handspace_visualization'] = (
-            observation['handspace_color_render'].copy())
+        if self.visualize:
+            observation['workspace_visualization'] = (
+                observation['workspace_color_render'].copy())
+            observation['handspace_visualization'] = (
+                observation['handspace_color_render'].copy())
         
         try:
-            print('='*80)
-            print('act')
+            self.log('='*80)
+            self.log('act')
             if not observation['reassembly']['reassembling']:
                 return self.disassembly_step(
                     observation,
@@ -115,20 +184,45 @@ class ReassemblyExpert:
                 )
         
         except ExpertError as e:
-            observation['workspace_visualization'] = write_text(
-                observation['workspace_visualization'], str(type(e)))
+            if self.visualize:
+                observation['workspace_visualization'] = write_text(
+                    observation['workspace_visualization'], str(type(e)))
             raise
         
         finally:
+            if self.visualize:
+                self.save_visualization(observation, seq_id, frame_id)
+    
+    def save_visualization(self, observation, seq_id, frame_id):
+        if seq_id is None:
+            file_name = 'vis_%i.png'%self.visualization_count
+        else:
+            file_name = 'vis_%i_%i.png'%(seq_id, frame_id)
+        self.visualization_count += 1
+        path = os.path.join(self.visualization_directory, file_name)
+        
+        def save(workspace_visualization, handspace_visualization):
             visualization = stack_images_horizontal(
-                (observation['workspace_visualization'],
-                 observation['handspace_visualization']),
+                (workspace_visualization, handspace_visualization),
                 align='bottom')
-            Image.fromarray(visualization).save(
-                './vis_%i_%i.png'%(seq_id, frame_id))
+            Image.fromarray(visualization).save(path)
+        
+        if self.visualization_executor is None:
+            self.visualization_executor = ThreadPoolExecutor(max_workers=1)
+        self.visualization_executor.submit(
+            save,
+            observation['workspace_visualization'],
+            observation['handspace_visualization'],
+        )
+    
+    def close(self):
+        # wait for any pending visualizations to be written
+        if self.visualization_executor is not None:
+            self.visualization_executor.shutdown(wait=True)
+            self.visualization_executor = None
     
     def disassembly_step(self, observation, check_collision=False):
-        print('-- disassembly_step')
+        self.log('-- disassembly_step')
         
         # If there are still items in the workspace, pick one to remove and 
         workspace_config = observation['reassembly']['workspace_configuration']
@@ -142,11 +236,15 @@ class ReassemblyExpert:
             return self.switch_to_reassembly_action()
     
     def choose_instance_to_remove(self, observation):
-        print('---- choose instance to remove')
+        self.log('---- choose instance to remove')
         
         # Figure out what can be removed.
-        visible_instances = numpy.unique(
-            observation['workspace_segmentation_render'])
+        if 'workspace_visible_instances' in observation:
+            visible_instances = numpy.nonzero(
+                observation['workspace_visible_instances'])[0]
+        else:
+            visible_instances = numpy.unique(
+                observation['workspace_segmentation_render'])
         
         # TODO: collisions
         
@@ -159,7 +257,7 @@ class ReassemblyExpert:
         return instance_to_remove
     
     def disassemble_instance_action(self, observation, instance_to_remove):
-        print('---- disassemble instance action')
+        self.log('---- disassemble instance action')
         
         # Initialize the action.
         action = handspace_reassembly_template_action()
@@ -182,7 +280,7 @@ class ReassemblyExpert:
         return action
     
     def switch_to_reassembly_action(self):
-        print('---- switch to reassembly action')
+        self.log('---- switch to reassembly action')
         # Initialize the action, fill in the entries and return.
         action = handspace_reassembly_template_action()
         action['reassembly']['start'] = 1
@@ -194,7 +292,7 @@ class ReassemblyExpert:
         check_collision=False,
         unfixable_mode='terminate',
     ):
-        print('-- reassembly step')
+        self.log('-- reassembly step')
         
         # Pull out the configurations.
         workspace_config = observation['reassembly']['workspace_configuration']
@@ -282,7 +380,7 @@ class ReassemblyExpert:
             connected_workspace_id = target_to_workspace[connected_target_id]
             
             misplaced_class = workspace_config['class'][misplaced_instance]
-            brick_shape = BrickShape(self.class_names[misplaced_class])
+            brick_shape = self.get_brick_shape(misplaced_class)
             pose_to_fix = workspace_config['pose'][instance_to_fix]
             snap_transform = brick_shape.snaps[snap_to_rotate].transform
             inv_snap_transform = numpy.linalg.inv(snap_transform)
@@ -367,7 +465,7 @@ class ReassemblyExpert:
         # model is complete and we can terminate the sequence.
         if len(unplaced_target_instances) == 0:
             
-            print('end')
+            self.log('end')
             
             action = handspace_reassembly_template_action()
             action['reassembly']['end'] = True
@@ -375,8 +473,8 @@ class ReassemblyExpert:
         
         # Is there anything in the hand?
         handspace_class = handspace_config['class'][1]
-        print('handspace class')
-        print(handspace_class)
+        self.log('handspace class')
+        self.log(handspace_class)
         if handspace_class != 0:
             # Can we place it?
             # TODO: FIGURE OUT IF WE CAN PLACE THE THING IN THE HAND
@@ -411,19 +509,17 @@ class ReassemblyExpert:
         # is ok to start with.
         else:
             all_target_instances = numpy.where(target_config['class'] != 0)[0]
-            placeable_target_instances = []
-            brick_shapes = {}
-            for target_instance in all_target_instances:
-                instance_class = target_config['class'][target_instance]
-                instance_class_name = self.class_names[instance_class]
-                if instance_class_name not in brick_shapes:
-                    brick_shapes[instance_class_name] = BrickShape(
-                        instance_class_name)
-                brick_shape = brick_shapes[instance_class_name]
-                pose = target_config['pose'][target_instance]
-                upright_snaps = self.upright_snaps(brick_shape, pose)
-                if len(upright_snaps):
-                    placeable_target_instances.append(target_instance)
+            all_target_classes = target_config['class'][all_target_instances]
+            placeable = numpy.zeros(len(all_target_instances), dtype=bool)
+            for instance_class in numpy.unique(all_target_classes):
+                brick_shape = self.get_brick_shape(instance_class)
+                class_entries = all_target_classes == instance_class
+                poses = target_config['pose'][
+                    all_target_instances[class_entries]]
+                upright = self.upright_snap_mask(brick_shape, poses)
+                placeable[class_entries] = numpy.any(upright, axis=1)
+            placeable_target_instances = list(
+                all_target_instances[placeable])
             
         #assert len(placeable_target_instances), (
         #    'No placeable instances, there may be no upright target instances')
@@ -442,7 +538,7 @@ class ReassemblyExpert:
         target_to_workspace,
         unplaced_class_colors,
     ):
-        print('---- find misplaced rotatable snaps')
+        self.log('---- find misplaced rotatable snaps')
         
         # If it's not even a good class/color combo, then it's not fixable.
         misplaced_class = workspace_config['class'][misplaced_instance]
@@ -526,7 +622,7 @@ class ReassemblyExpert:
         target_config,
         placeable_target_instances,
     ):
-        print('---- pick target instance')
+        self.log('---- pick target instance')
         instance_to_pick = random.choice(placeable_target_instances)
         class_to_pick = target_config['class'][instance_to_pick]
         color_to_pick = target_config['color'][instance_to_pick]
@@ -536,7 +632,7 @@ class ReassemblyExpert:
         return action
     
     def first_brick_placement_action(self, observation):
-        print('---- first brick placement action')
+        self.log('---- first brick placement action')
         
         # Initialize the action.
         action = handspace_reassembly_template_action()
@@ -548,25 +644,30 @@ class ReassemblyExpert:
         # Find the snaps that are aligned with the brick's up direction when
         # placed in the scene.
         brick_class = handspace_config['class'][1]
-        class_name = self.class_names[brick_class]
-        brick_shape = BrickShape(class_name)
+        brick_shape = self.get_brick_shape(brick_class)
         matching_target_instances = numpy.where(
             target_config['class'] == brick_class)[0]
         target_poses = target_config['pose'][matching_target_instances]
-        potential_instances = []
-        for instance, pose in zip(matching_target_instances, target_poses):
-            upright_snaps = self.upright_snaps(brick_shape, pose)
-            if len(upright_snaps):
-                potential_instances.append((instance, upright_snaps))
+        upright = self.upright_snap_mask(brick_shape, target_poses)
+        potential_instances = [
+            (instance, numpy.nonzero(instance_upright)[0].tolist())
+            for instance, instance_upright
+            in zip(matching_target_instances, upright)
+            if numpy.any(instance_upright)
+        ]
         
         # Pick an upright visible snap
         picked_instance, upright_snaps = random.choice(potential_instances)
         pos_snaps = observation['handspace_pos_snap_render']
         neg_snaps = observation['handspace_neg_snap_render']
-        visible_snaps = (
-            set(numpy.unique(pos_snaps[:,:,1])) |
-            set(numpy.unique(neg_snaps[:,:,1]))
-        )
+        if 'handspace_visible_snaps' in observation:
+            visible_snaps = set(
+                numpy.nonzero(observation['handspace_visible_snaps'])[0])
+        else:
+            visible_snaps = (
+                set(numpy.unique(pos_snaps[:,:,1])) |
+                set(numpy.unique(neg_snaps[:,:,1]))
+            )
         upright_visible_snaps = (visible_snaps & set(upright_snaps)) - set([0])
         #assert len(upright_visible_snaps), (
         #    'Somehow none of the upright snaps are visible')
@@ -594,7 +695,7 @@ class ReassemblyExpert:
         unplaced_target_instances,
         target_to_workspace,
     ):
-        print('---- nth brick placement action')
+        self.log('---- nth brick placement action')
         
         # TODO:
         # need some combination of workspace_to_target, target_to_workspace,
@@ -686,36 +787,38 @@ class ReassemblyExpert:
         
         return action
     
-    def upright_snaps(self, brick_shape, pose):
+    def upright_snap_mask(self, brick_shape, poses):
         # Get the up (+y) direction for each snap and compare it against the
-        # up (-y) direction of the pose.  Any of these 
-        snap_ys = [snap.transform[:3,1] for snap in brick_shape.snaps]
+        # up (-y) direction of each pose, returns a (poses x snaps) mask.
         # I think this is wrong
-        # pose_y = pose[:3,1]
+        # pose_y = poses[:,:3,1]
         # I think this is right
-        pose_y = pose[1,:3]
-        snap_ys = [snap.transform[1,:3] for snap in brick_shape.snaps]
-        alignment = [-snap_y @ pose_y for snap_y in snap_ys]
-        upright_snaps = [i for i, a in enumerate(alignment) if a > 0.99]
-        
-        return upright_snaps
+        pose_ys = poses[:,1,:3]
+        snap_ys = brick_shape.snap_transforms[:,1,:3]
+        alignment = -pose_ys @ snap_ys.T
+        return alignment > 0.99
+    
+    def upright_snaps(self, brick_shape, pose):
+        upright = self.upright_snap_mask(brick_shape, pose[None])[0]
+        return numpy.nonzero(upright)[0].tolist()
     
     def select_from_pos_neg_maps(self, pos_map, neg_map):
-        pos_y, pos_x = numpy.where(pos_map)
-        neg_y, neg_x = numpy.where(neg_map)
-        y = numpy.concatenate((pos_y, neg_y))
-        x = numpy.concatenate((pos_x, neg_x))
-        p = numpy.concatenate((
-            numpy.ones(pos_y.shape, dtype=numpy.long),
-            numpy.zeros(neg_y.shape, dtype=numpy.long),
-        ))
+        # sample uniformly from the positive pixels followed by the negative
+        # pixels without building coordinate lists for either
+        pos_indices = numpy.flatnonzero(pos_map)
+        neg_indices = numpy.flatnonzero(neg_map)
+        num_pos = pos_indices.shape[0]
         
         try:
-            r = random.randint(0, y.shape[0]-1)
+            r = random.randint(0, num_pos + neg_indices.shape[0] - 1)
         except:
             raise CantFindSnapError
         
-        pick_y = y[r]
-        pick_x = x[r]
-        pick_p = p[r]
+        if r < num_pos:
+            pick_y, pick_x = numpy.unravel_index(pos_indices[r], pos_map.shape)
+            pick_p = 1
+        else:
+            pick_y, pick_x = numpy.unravel_index(
+                neg_indices[r - num_pos], neg_map.shape)
+            pick_p = 0
         return pick_y, pick_x, pick_p
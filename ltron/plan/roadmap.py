@@ -2,6 +2,7 @@ import random
 import time
 import math
 import copy
+import heapq
 from bisect import insort
 
 import tqdm
@@ -10,11 +11,14 @@ import numpy
 
 from ltron.exceptions import LtronException
 #from ltron.bricks.brick_scene import BrickScene
-from ltron.geometry.collision import build_collision_map
+from ltron.geometry.collision import (
+    build_collision_map, BitmaskCollisionMap)
 from ltron.matching import match_assemblies, match_lookup
 from ltron.bricks.brick_instance import BrickInstance
-from ltron.bricks.brick_shape import BrickShape
+from ltron.bricks.brick_shape import get_brick_shape
 
+from ltron.plan.path_store import PathStore
+from ltron.plan.connectivity import AssemblyGraph
 from ltron.plan.edge_planner import (
     plan_add_first_brick,
     plan_add_nth_brick,
@@ -53,6 +57,11 @@ class Roadmap:
     are transferred to the goal's indexing scheme using a matching.  Instances
     from the start assembly that do not exist in the goal assembly are assigned
     new labels after the largest index in the goal assembly.
+    
+    Evaluated paths that still have unevaluated successors are kept in a
+    heap (the frontier) keyed on their cost.  Entries are invalidated lazily:
+    a path that has been pruned or has had all its successors evaluated is
+    simply skipped when it reaches the top of the heap.
     '''
     def __init__(
         self,
@@ -66,6 +75,9 @@ class Roadmap:
         target_steps_per_view_change=4,
         split_cursor_actions=False,
         allow_snap_flip=False,
+        observation_storage='memory',
+        max_resident_states=None,
+        spill_directory=None,
     ):
         
         # store arguments
@@ -84,9 +96,23 @@ class Roadmap:
         
         self.start_collision_map = start_collision_map
         self.goal_collision_map = goal_collision_map
+        self.start_collision_bits = BitmaskCollisionMap(start_collision_map)
+        self.goal_collision_bits = BitmaskCollisionMap(goal_collision_map)
+        
+        # precompute the connectivity of the start and goal assemblies
+        self.start_graph = AssemblyGraph(self.start_assembly)
+        self.goal_graph = AssemblyGraph(self.goal_assembly)
         
         # initialize paths
         self.paths = {}
+        self.path_store = PathStore(
+            env,
+            observation_storage=observation_storage,
+            max_resident_states=max_resident_states,
+            spill_directory=spill_directory,
+        )
+        self.frontier = []
+        self.frontier_pushes = 0
         
         # compute a matching from start to goal
         matching, offset = match_assemblies(
@@ -114,8 +140,9 @@ class Roadmap:
         # initialize the first path
         first_path = (self.start_membership,)
         self.initialize_path(first_path)
-        self.paths[first_path]['env_state'] = start_env_state
+        self.path_store.set_start(first_path, start_env_state)
         self.paths[first_path]['evaluated'] = True
+        self.push_frontier(first_path)
         
         '''
         # build start collision map
@@ -169,40 +196,86 @@ class Roadmap:
         path,
         include_last_observation=True
     ):
+        # observations are only materialized here, for the chosen path
         observation_seq = []
         action_seq = []
         reward_seq = []
-        for i in range(len(path)):
+        if len(path) == 1:
+            edge_observation_seq = [
+                self.env.set_state(self.path_store.get_env_state(path))]
+        for i in range(1, len(path)):
             sub_path = path[:i+1]
             path_data = self.paths[sub_path]
-            observation_seq.extend(path_data['observation_seq'][:-1])
+            edge_observation_seq = self.path_store.get_observation_seq(sub_path)
+            observation_seq.extend(edge_observation_seq[:-1])
             action_seq.extend(path_data['action_seq'])
             reward_seq.extend(path_data['reward_seq'])
         
         if include_last_observation:
-            observation_seq.append(path_data['observation_seq'][-1])
+            observation_seq.append(edge_observation_seq[-1])
         
         return observation_seq, action_seq, reward_seq
     
+    def push_frontier(self, path):
+        # the counter breaks cost ties in insertion order and identifies the
+        # live heap entry for this path
+        self.frontier_pushes += 1
+        self.paths[path]['frontier_key'] = self.frontier_pushes
+        heapq.heappush(
+            self.frontier, (self.cost(path), self.frontier_pushes, path))
+    
+    def frontier_entry_valid(self, entry):
+        cost, key, path = entry
+        path_data = self.paths.get(path, None)
+        return (
+            path_data is not None and
+            path_data['frontier_key'] == key and
+            not path_data['all_successors_evaluated']
+        )
+    
+    def clean_frontier(self):
+        while self.frontier and not self.frontier_entry_valid(self.frontier[0]):
+            heapq.heappop(self.frontier)
+    
+    def best_frontier_paths(self):
+        self.clean_frontier()
+        if not self.frontier:
+            raise PathNotFoundError
+        
+        best = heapq.heappop(self.frontier)
+        self.clean_frontier()
+        if self.frontier:
+            next_best_cost = self.frontier[0][0]
+        else:
+            next_best_cost = 0
+        heapq.heappush(self.frontier, best)
+        
+        cost, _, path = best
+        return cost, path, next_best_cost
+    
+    def next_unevaluated_successor(self, path):
+        path_data = self.paths[path]
+        mask = path_data['unevaluated_successors']
+        if not mask:
+            return None
+        i = (mask & -mask).bit_length() - 1
+        return path_data['successor_list'][i]
+    
+    def clear_successor_bit(self, path, successor):
+        path_data = self.paths[path]
+        i = path_data['successor_index'][successor]
+        path_data['unevaluated_successors'] &= ~(1 << i)
+    
+    def remove_successor(self, path, successor):
+        self.paths[path]['successors'].remove(successor)
+        self.clear_successor_bit(path, successor)
+    
     def plan_collision_free(self):
         
         while True:
             
             # find the best evaluated starting path so far
-            path_costs = sorted([
-                (self.cost(path), path)
-                for path, path_data in self.paths.items()
-                if path_data['evaluated'] and
-                not path_data['all_successors_evaluated']
-            ])
-            if len(path_costs) == 0:
-                raise PathNotFoundError
-            
-            cost, path = path_costs[0]
-            if len(path_costs) > 1:
-                next_best_cost, _ = path_costs[1]
-            else:
-                next_best_cost = 0
+            cost, path, next_best_cost = self.best_frontier_paths()
             
             starting_path = path
             
@@ -218,28 +291,24 @@ class Roadmap:
                 # if this path has no successors, prune it and either
                 # step backward or break to find a new starting path
                 if not len(self.paths[path]['successors']):
-                    del(self.paths[path])
+                    self.delete_path(path)
                     previous_path = path[:-1]
                     leaf = path[-1]
-                    self.paths[previous_path]['successors'].remove(leaf)
+                    self.remove_successor(previous_path, leaf)
                     
                     if path != starting_path:
                         path = previous_path
                     else:
                         break
                 
-                # find all unevaluated successors
-                unevaluated_successors = [
-                    s for s in self.paths[path]['successors']
-                    if not self.paths[path + (s,)]['evaluated']
-                ]
+                # find the first unevaluated successor
+                successor = self.next_unevaluated_successor(path)
                 
                 # if there are no unevaluated successors, record this and break
-                if not len(unevaluated_successors):
+                if successor is None:
                     self.paths[path]['all_successors_evaluated'] = True
                     break
                 
-                successor = unevaluated_successors[0]
                 path = path + (successor,)
             
             if path[-1] == self.goal_membership:
@@ -280,7 +349,13 @@ class Roadmap:
                     successors.add(path[-1] | frozenset((fn,)))
         
         # add the succesors to the roadmap
-        self.paths[path]['successors'] = successors
+        path_data = self.paths[path]
+        path_data['successors'] = successors
+        path_data['successor_list'] = list(successors)
+        path_data['successor_index'] = {
+            s:i for i, s in enumerate(path_data['successor_list'])}
+        path_data['unevaluated_successors'] = (
+            1 << len(path_data['successor_list'])) - 1
         
         # add the successor paths roadmap
         for successor in successors:
@@ -293,50 +368,19 @@ class Roadmap:
         maintain_connectivity=False,
     ):
         
-        collision_map = self.start_collision_map
-        start_assembly = self.start_assembly
+        collision_bits = self.start_collision_bits
         
         # check if removing this brick will affect connectivity
         if maintain_connectivity and len(current_membership) > 2:
-            
-            # first build up the connectivity structure of this membership
-            edges = start_assembly['edges']
-            connectivity = {}
-            for i in range(edges.shape[1]):
-                if (edges[0,i] == 0 or
-                    edges[0,i] not in current_membership or
-                    edges[0,i] == remove_brick):
-                    continue
-                
-                if edges[1,i] in current_membership:
-                    connectivity.setdefault(edges[0,i], set())
-                    if edges[1,i] == remove_brick:
-                        continue
-                    connectivity[edges[0,i]].add(edges[1,i])
-            
-            connected = set()
-            try:
-                frontier = [next(iter(connectivity.keys()))]
-            except StopIteration:
+            connected = self.start_graph.connected_without(
+                current_membership, remove_brick)
+            if connected is None:
                 raise FrontierError
-            while frontier:
-                node = frontier.pop()
-                if node in connected:
-                    continue
-                
-                connected.add(node)
-                frontier.extend(connectivity[node])
-            
-            if len((current_membership - {remove_brick}) - connected):
+            if not connected:
                 return False
         
-        remove_snaps = []
-        for axis, polarity, snap_group in collision_map[remove_brick]:
-            colliding_bricks = collision_map[remove_brick][
-                axis, polarity, snap_group]
-            colliding_bricks = frozenset(colliding_bricks)
-            if not len(colliding_bricks & current_membership):
-                remove_snaps.extend(snap_group)
+        membership_words = collision_bits.encode(current_membership)
+        remove_snaps = collision_bits.free_snaps(remove_brick, membership_words)
         
         if len(remove_snaps):
             return True
@@ -350,11 +394,11 @@ class Roadmap:
         existing_bricks,
     ):
         
-        collision_map = self.goal_collision_map
+        collision_bits = self.goal_collision_bits
         goal_assembly = self.goal_assembly
         
         if not len(existing_bricks):
-            brick_shape = BrickShape(new_brick_shape_name)
+            brick_shape = get_brick_shape(new_brick_shape_name)
             brick_transform = goal_assembly['pose'][new_brick]
             brick_instance = BrickInstance(0, brick_shape, 0, brick_transform)
             upright_snaps = brick_instance.get_upright_snaps()
@@ -365,19 +409,7 @@ class Roadmap:
         
         else:
             # there must be a connection to a new brick
-            new_edges = numpy.where(goal_assembly['edges'][0] == new_brick)[0]
-            #connected_bricks = goal_assembly['edges'][1, new_edges]
-            #new_connected_snaps = goal_assembly['edges'][2, new_edges]
-            new_edge_data = goal_assembly['edges'][:,new_edges]
-            new_connected_existing_snaps = [
-                sa for ia, ib, sa, sb in new_edge_data.T
-                if ib in existing_bricks
-            ]
-            
-            #connected_bricks = frozenset(connected_bricks)
-            #connected_existing_bricks = connected_bricks & existing_bricks
-            #if not len(connected_existing_bricks):
-            if not len(new_connected_existing_snaps):
+            if not self.goal_graph.connected_to(new_brick, existing_bricks):
                 return False
             
             updated_bricks = existing_bricks | frozenset((new_brick,))
@@ -386,30 +418,30 @@ class Roadmap:
             # a way to get connected without collision after this brick has been
             # added
             unadded_bricks = self.goal_membership - updated_bricks
-            for unadded_brick in unadded_bricks:
-                for axis, polarity, snap_group in collision_map[unadded_brick]:
-                    colliding_bricks = collision_map[unadded_brick][
-                        axis, polarity, snap_group]
-                    colliding_bricks = frozenset(colliding_bricks)
-                    if not len(colliding_bricks & updated_bricks):
-                        break
-                
-                else:
-                    return False
+            membership_words = collision_bits.encode(updated_bricks)
+            if not collision_bits.all_have_free_group(
+                unadded_bricks, membership_words):
+                return False
             
             return True
     
+    def delete_path(self, path):
+        del(self.paths[path])
+        self.path_store.remove(path)
+    
     def initialize_path(self, path):
         self.paths[path] = {
             'view_changes':0, #None,
             'total_view_changes':0,
-            'env_state':None,
             'action_seq':[],
-            'observation_seq':[],
             'reward_seq':[],
             'successors':None,
+            'successor_list':[],
+            'successor_index':{},
+            'unevaluated_successors':0,
             'evaluated':False,
             'all_successors_evaluated':False,
+            'frontier_key':None,
             'good_actions':set(),
         }
     
@@ -433,6 +465,7 @@ class Roadmap:
                 #a_path_data['good_actions'] != better_actions
                 
                 b_path_data['evaluated'] = True
+                self.clear_successor_bit(a_path, b_path[-1])
                 
                 # if this action is not feasible:
                 # delete b_path and all successors from the graph
@@ -440,21 +473,20 @@ class Roadmap:
                 # then return False (path to goal not found yet)
                 if action_seq is None:
                     b = b_path[-1]
-                    successors = self.paths[a_path]['successors']
-                    successors.remove(b)
+                    self.remove_successor(a_path, b)
                     
                     for j in range(i, len(candidate_path)):
                         post_feasible_path = candidate_path[:j+1]
-                        del(self.paths[post_feasible_path])
+                        self.delete_path(post_feasible_path)
                     
                     return False
                 
                 # if the path is feasible:
                 # update the observations, actions, rewards and env_state
-                b_path_data['observation_seq'] = observation_seq
                 b_path_data['action_seq'] = action_seq
                 b_path_data['reward_seq'] = reward_seq
-                b_path_data['env_state'] = self.env.get_state()
+                self.path_store.add_edge(
+                    b_path, observation_seq, action_seq, self.env.get_state())
                 
                 # find out how many view changes were necessary
                 view_changes = len([
@@ -466,6 +498,7 @@ class Roadmap:
                 b_path_data['view_changes'] = view_changes
                 b_path_data['total_view_changes'] = (
                     a_path_data['total_view_changes'] + view_changes)
+                self.push_frontier(b_path)
             
                 # if the cost so far is greater than the next best path:
                 # return False (path to goal not found yet)
@@ -489,7 +522,7 @@ class Roadmap:
         
         # initialize the env state
         prev_path = path[:-1]
-        env_state = self.paths[prev_path]['env_state']
+        env_state = self.path_store.get_env_state(prev_path)
         start_observation = self.env.set_state(env_state)
         
         a, b = path[-2:]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+import numpy
+
+from ltron.plan.connectivity import AssemblyGraph
+
+def chain_assembly():
+    # 1 - 2 - 3 - 4 with symmetric edges and a padding column
+    edges = [(1,2), (2,1), (2,3), (3,2), (3,4), (4,3), (0,0)]
+    edges = numpy.array([[a, b, 0, 0] for a, b in edges]).T
+    return {'shape' : numpy.zeros(5, dtype=numpy.int64), 'edges' : edges}
+
+def reference_connected_without(assembly, membership, remove):
+    # the dict based search the planners used before AssemblyGraph
+    edges = assembly['edges']
+    connectivity = {}
+    for i in range(edges.shape[1]):
+        if (edges[0,i] == 0 or
+            edges[0,i] not in membership or
+            edges[0,i] == remove):
+            continue
+        if edges[1,i] in membership:
+            connectivity.setdefault(edges[0,i], set())
+            if edges[1,i] == remove:
+                continue
+            connectivity[edges[0,i]].add(edges[1,i])
+    
+    if not connectivity:
+        return None
+    connected = set()
+    frontier = [next(iter(connectivity.keys()))]
+    while frontier:
+        node = frontier.pop()
+        if node in connected:
+            continue
+        connected.add(node)
+        frontier.extend(connectivity[node])
+    
+    return not len((membership - {remove}) - connected)
+
+def test_connected_without():
+    assembly = chain_assembly()
+    graph = AssemblyGraph(assembly)
+    assert graph.connected_without({1,2,3,4}, 4)
+    assert graph.connected_without({1,2,3,4}, 1)
+    assert not graph.connected_without({1,2,3,4}, 2)
+    assert graph.connected_without({1,3}, 2) is None
+
+def test_connected_to():
+    graph = AssemblyGraph(chain_assembly())
+    assert graph.connected_to(1, {2})
+    assert not graph.connected_to(1, {3,4})
+
+def test_out_of_range_members():
+    assembly = chain_assembly()
+    graph = AssemblyGraph(assembly)
+    assert graph.num_instances == 5
+    
+    assert not graph.connected_to(7, {1,2})
+    assert not graph.connected_to(2, {7})
+    
+    for membership, remove in (
+        ({1,2,3,7}, 3),
+        ({1,2,3,7}, 7),
+        ({7,9}, 7),
+        ({3,4,64}, 3),
+    ):
+        assert (
+            graph.connected_without(membership, remove) ==
+            reference_connected_without(assembly, membership, remove)
+        )
+
+def test_matches_reference():
+    random = numpy.random.RandomState(0)
+    for _ in range(200):
+        n = random.randint(2, 10)
+        pairs = random.randint(0, n, size=(random.randint(0, 20), 2))
+        # assemblies store symmetric edges and never connect a brick to itself
+        pairs = pairs[pairs[:,0] != pairs[:,1]]
+        pairs = numpy.concatenate((pairs, pairs[:,::-1]))
+        edges = numpy.zeros((4, len(pairs)), dtype=numpy.int64)
+        edges[:2] = pairs.T
+        assembly = {
+            'shape' : numpy.zeros(n, dtype=numpy.int64), 'edges' : edges}
+        graph = AssemblyGraph(assembly)
+        membership = set(random.randint(1, n+2, size=random.randint(1, 8)))
+        membership = {int(i) for i in membership}
+        remove = int(random.choice(sorted(membership)))
+        assert (
+            graph.connected_without(membership, remove) ==
+            reference_connected_without(assembly, membership, remove)
+        )
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import time
+import argparse
+
+from ltron.dataset.paths import get_dataset_info
+from ltron.bricks.brick_shape import BrickShape
+from ltron.render.environment import RenderEnvironment
+
+parser = argparse.ArgumentParser()
+parser.add_argument('dataset', type=str)
+parser.add_argument('--mesh-archive-path', type=str, default=None)
+parser.add_argument('--egl-device', type=int, default=None)
+
+def time_mesh_loading(render_environment, brick_shapes):
+    render_environment.clear_meshes()
+    t0 = time.time()
+    for brick_shape in brick_shapes:
+        render_environment.load_brick_mesh(brick_shape)
+    return time.time() - t0
+
+def main():
+    args = parser.parse_args()
+
+    shape_names = sorted(get_dataset_info(args.dataset)['shape_ids'].keys())
+    print('Parsing %i brick shapes'%len(shape_names))
+    brick_shapes = [BrickShape(shape_name) for shape_name in shape_names]
+
+    render_environment = RenderEnvironment(
+        opengl_mode='egl',
+        egl_device=args.egl_device,
+        mesh_archive_path=args.mesh_archive_path,
+    )
+    mesh_archive = render_environment.mesh_archive
+    if mesh_archive is None:
+        print('No mesh archive found, run ltron.render.mesh_archive first')
+        return
+
+    missing = [s for s in brick_shapes if s.mesh_name not in mesh_archive]
+    if missing:
+        print('Shapes missing from archive (loaded from obj): %s'%(
+            ','.join(str(s) for s in missing)))
+
+    render_environment.mesh_archive = None
+    obj_elapsed = time_mesh_loading(render_environment, brick_shapes)
+    print('obj load elapsed: %.04f'%obj_elapsed)
+
+    render_environment.mesh_archive = mesh_archive
+    archive_elapsed = time_mesh_loading(render_environment, brick_shapes)
+    print('archive load elapsed: %.04f'%archive_elapsed)
+
+    print('speedup: %.02fx'%(obj_elapsed / archive_elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import math
+import os
 
 import splendor.contexts.egl as egl
 import splendor.contexts.glut as glut
@@ -7,6 +8,7 @@ import splendor.camera as camera
 import splendor.masks as masks
 
 import ltron.settings as settings
+from ltron.render.mesh_archive import MeshArchive, default_mesh_archive_path
 
 default_projection = camera.projection_matrix(
     math.radians(60.),
@@ -31,6 +33,8 @@ class RenderEnvironment:
         window_anti_alias=True,
         window_anti_alias_samples=8,
         load_scene=None,
+        mesh_archive_path=None,
+        use_mesh_archive=True,
     ):
         if opengl_mode == 'egl':
             egl.initialize_plugin()
@@ -63,6 +67,13 @@ class RenderEnvironment:
         if self.load_scene is not None:
             self.renderer.load_scene(self.load_scene)
         self.make_snap_materials()
+        
+        self.mesh_archive = None
+        if use_mesh_archive:
+            if mesh_archive_path is None:
+                mesh_archive_path = default_mesh_archive_path()
+            if os.path.exists(mesh_archive_path):
+                self.mesh_archive = MeshArchive(mesh_archive_path)
     
     # materials ================================================================
     
@@ -97,10 +108,29 @@ class RenderEnvironment:
     
     def load_brick_mesh(self, brick_shape):
         if not self.renderer.mesh_exists(brick_shape.mesh_name):
-            self.renderer.load_mesh(
-                brick_shape.mesh_name,
-                **brick_shape.splendor_mesh_args(),
-            )    
+            if (self.mesh_archive is not None and
+                brick_shape.mesh_name in self.mesh_archive
+            ):
+                self.load_archived_mesh(brick_shape.mesh_name)
+            else:
+                self.renderer.load_mesh(
+                    brick_shape.mesh_name,
+                    **brick_shape.splendor_mesh_args(),
+                )
+    
+    def load_archived_mesh(self, mesh_name):
+        # the archive arrays are memory-mapped, so only this mesh is read
+        # from disk instead of parsing its obj file
+        vertex_data, faces = self.mesh_archive.get_mesh_arrays(mesh_name)
+        self.renderer.load_mesh(
+            mesh_name,
+            mesh_data={
+                'vertices' : vertex_data[:,:3],
+                'normals' : vertex_data[:,3:],
+                'faces' : faces,
+            },
+            color_mode='flat_color',
+        )
     
     # instances ================================================================
     
@@ -121,9 +151,41 @@ class RenderEnvironment:
         for i, snap in enumerate(brick_instance.snaps):
             self.add_snap_instance(snap)
     
-    def add_snap_instance(self, snap):
+    def add_instances(self, brick_instances):
+        # batched version of add_instance that loads each mesh and material
+        # once up front instead of checking for them on every instance
         if self.window is not None:
             self.window.set_active()
+        
+        brick_shapes = {}
+        colors = {}
+        snap_styles = {}
+        for brick_instance in brick_instances:
+            brick_shapes.setdefault(
+                brick_instance.brick_shape.mesh_name,
+                brick_instance.brick_shape,
+            )
+            colors.setdefault(
+                brick_instance.color.color_name, brick_instance.color)
+            for snap in brick_instance.brick_shape.snaps:
+                snap_styles.setdefault(snap.subtype_id, snap)
+        
+        for brick_shape in brick_shapes.values():
+            self.load_brick_mesh(brick_shape)
+        for color in colors.values():
+            self.load_color_material(color)
+        for snap in snap_styles.values():
+            self.load_snap_mesh(snap)
+        
+        for brick_instance in brick_instances:
+            self.renderer.add_instance(
+                brick_instance.instance_name,
+                **brick_instance.splendor_instance_args(),
+            )
+            for snap in brick_instance.snaps:
+                self.add_snap_splendor_instance(snap)
+    
+    def load_snap_mesh(self, snap):
         # create the mesh if it doesn't exist
         if not self.renderer.mesh_exists(snap.subtype_id):
             self.renderer.load_mesh(
@@ -131,7 +193,14 @@ class RenderEnvironment:
                 mesh_data=snap.get_snap_mesh(),
                 color_mode='flat_color',
             )
-        
+    
+    def add_snap_instance(self, snap):
+        if self.window is not None:
+            self.window.set_active()
+        self.load_snap_mesh(snap)
+        self.add_snap_splendor_instance(snap)
+    
+    def add_snap_splendor_instance(self, snap):
         # add the splendor instance
         self.renderer.add_instance(
             str(snap),
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+import os
+import json
+import struct
+import argparse
+
+import numpy
+
+import tqdm
+
+from splendor.home import get_splendor_home
+import splendor.assets as assets
+import splendor.obj_mesh as obj_mesh
+
+from ltron.exceptions import LtronException
+
+'''
+A mesh archive packs many flat_color meshes into a single binary file that
+can be memory-mapped and uploaded to OpenGL without parsing any obj text.
+
+Layout (little endian):
+    header : magic (8 bytes), version (uint32), reserved (uint32),
+             table offset (uint64), table length (uint64)
+    blocks : for each mesh, an (n,6) float32 array of interleaved
+             vertex/normal data followed by an (m,3) int32 array of faces,
+             each block aligned to ALIGNMENT bytes
+    table  : utf-8 json mapping mesh name to
+             [vertex_offset, num_vertices, face_offset, num_faces]
+'''
+
+MAGIC = b'LTRONMSH'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQ')
+ALIGNMENT = 64
+
+class MeshArchiveException(LtronException):
+    pass
+
+def default_mesh_archive_path(asset_package='ltron_assets'):
+    return os.path.join(get_splendor_home(), '%s.ltmesh'%asset_package)
+
+def pad_to_alignment(f):
+    position = f.tell()
+    padding = (-position) % ALIGNMENT
+    if padding:
+        f.write(b'\0' * padding)
+    return position + padding
+
+def mesh_to_arrays(mesh):
+    vertices = numpy.array(mesh['vertices'], dtype=numpy.float32)
+    normals = numpy.array(mesh['normals'], dtype=numpy.float32)
+    faces = numpy.array(mesh['faces'], dtype=numpy.int32)
+    if not len(vertices):
+        return None, None
+    vertex_data = numpy.concatenate(
+        (vertices[:,:3], normals[:,:3]), axis=1)
+    return vertex_data, faces.reshape(-1,3)
+
+def write_mesh_archive(mesh_paths, archive_path, progress=False):
+    '''
+    mesh_paths should be a dictionary mapping mesh names to obj paths.
+    Meshes with no vertices are skipped so that loading them falls back to
+    the original (failing) obj path.
+    '''
+    table = {}
+    items = sorted(mesh_paths.items())
+    if progress:
+        items = tqdm.tqdm(items)
+
+    tmp_path = archive_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        for mesh_name, mesh_path in items:
+            mesh = obj_mesh.load_mesh(mesh_path)
+            vertex_data, faces = mesh_to_arrays(mesh)
+            if vertex_data is None:
+                continue
+
+            vertex_offset = pad_to_alignment(f)
+            f.write(vertex_data.tobytes())
+            face_offset = pad_to_alignment(f)
+            f.write(faces.tobytes())
+            table[mesh_name] = [
+                vertex_offset, vertex_data.shape[0], face_offset, faces.shape[0]]
+
+        table_data = json.dumps(table).encode('utf-8')
+        table_offset = pad_to_alignment(f)
+        f.write(table_data)
+
+        f.seek(0)
+        f.write(HEADER.pack(
+            MAGIC, VERSION, 0, table_offset, len(table_data)))
+
+    os.replace(tmp_path, archive_path)
+
+    return table
+
+def pack_asset_meshes(
+    asset_packages='ltron_assets',
+    archive_path=None,
+    mesh_names=None,
+    progress=True,
+):
+    if archive_path is None:
+        archive_path = default_mesh_archive_path()
+
+    asset_library = assets.AssetLibrary(asset_packages)
+    mesh_finder = asset_library['meshes']
+    if mesh_names is None:
+        mesh_paths = {}
+        # earlier directories take precedence, matching PathFinder
+        for directory in reversed(mesh_finder.paths):
+            if not os.path.isdir(directory):
+                continue
+            for file_name in os.listdir(directory):
+                mesh_name, ext = os.path.splitext(file_name)
+                if ext == '.obj':
+                    mesh_paths[mesh_name] = os.path.join(directory, file_name)
+    else:
+        mesh_paths = {
+            mesh_name : mesh_finder[mesh_name] for mesh_name in mesh_names}
+
+    return write_mesh_archive(mesh_paths, archive_path, progress=progress)
+
+class MeshArchive:
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self.data = numpy.memmap(archive_path, dtype=numpy.uint8, mode='r')
+        if len(self.data) < HEADER.size:
+            raise MeshArchiveException(
+                'File too small to be a mesh archive: %s'%archive_path)
+        magic, version, _, table_offset, table_length = HEADER.unpack(
+            self.data[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise MeshArchiveException(
+                'Not a mesh archive: %s'%archive_path)
+        if version != VERSION:
+            raise MeshArchiveException(
+                'Unsupported mesh archive version %i: %s'%(
+                    version, archive_path))
+        table_data = self.data[table_offset:table_offset+table_length]
+        self.table = json.loads(table_data.tobytes().decode('utf-8'))
+
+    def __contains__(self, mesh_name):
+        return mesh_name in self.table
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+    def get_mesh_arrays(self, mesh_name):
+        '''
+        Returns an (n,6) float32 array of interleaved vertex/normal data and
+        an (m,3) int32 array of faces.  Both are read-only views into the
+        memory-mapped file, so no data is copied until it is touched.
+        '''
+        vertex_offset, num_vertices, face_offset, num_faces = (
+            self.table[mesh_name])
+        vertex_data = self.data[
+            vertex_offset:vertex_offset + num_vertices * 6 * 4]
+        vertex_data = vertex_data.view(numpy.float32).reshape(num_vertices, 6)
+        faces = self.data[face_offset:face_offset + num_faces * 3 * 4]
+        faces = faces.view(numpy.int32).reshape(num_faces, 3)
+        return vertex_data, faces
+
+    def get_mesh(self, mesh_name):
+        vertex_data, faces = self.get_mesh_arrays(mesh_name)
+        return {
+            'vertices' : vertex_data[:,:3],
+            'normals' : vertex_data[:,3:],
+            'faces' : faces,
+        }
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--asset-packages', type=str, default='ltron_assets')
+parser.add_argument('--output-path', type=str, default=None)
+parser.add_argument('--meshes', type=str, default=None)
+
+def main():
+    args = parser.parse_args()
+    if args.meshes is None:
+        mesh_names = None
+    else:
+        mesh_names = [m.strip().replace('.dat', '')
+            for m in args.meshes.split(',')]
+    if args.output_path is None:
+        output_path = default_mesh_archive_path()
+    else:
+        output_path = args.output_path
+    table = pack_asset_meshes(
+        asset_packages=args.asset_packages,
+        archive_path=output_path,
+        mesh_names=mesh_names,
+    )
+    print('Packed %i meshes to: %s'%(len(table), output_path))
+
+if __name__ == '__main__':
+    main()
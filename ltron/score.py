@@ -1,6 +1,4 @@
-import copy
-
-from ltron.matching import match_assemblies, match_lookup
+from ltron.matching import match_assemblies, match_lookup, AssemblyMatcher
 
 def f1(tp, fp, fn):
     return tp / (tp + 0.5 * (fp + fn))
@@ -20,44 +18,30 @@ def edit_distance(
     miss_a_penalty=1,
     miss_b_penalty=1,
 ):
+    '''
+    Repeatedly matches the largest rigidly aligned group of bricks between
+    the two assemblies and removes it until nothing else matches.  Each group
+    after the first costs 1 and each brick that is never matched costs its
+    miss penalty.  Returns the distance and the combined a to b matching.
     
-    running_a_to_b = {}
-    
-    first_a = assembly_a
-    first_b = assembly_b
-    
-    def remove_and_match(a, b, remove):
-        a = copy.deepcopy(a)
-        b = copy.deepcopy(b)
-        for aa, bb in remove.items():
-            a['shape'][aa] = 0
-            a['color'][aa] = 0
-            b['shape'][bb] = 0
-            b['color'][bb] = 0
-        
-        match, offset = match_assemblies(a, b, part_names, radius=radius)
-        a_to_b, b_to_a, miss_a, miss_b = match_lookup(match, a, b)
-        
-        return a, b, a_to_b, miss_a, miss_b
+    Each round is solved incrementally with an AssemblyMatcher instead of
+    deep-copying the assemblies and matching them from scratch.
+    '''
+    matcher = AssemblyMatcher(assembly_a, assembly_b, part_names, radius=radius)
     
-    first_match, _ = match_assemblies(
-        assembly_a, assembly_b, part_names, radius=radius)
-    a_to_b, b_to_a, miss_a, miss_b = match_lookup(
-        first_match, assembly_a, assembly_b)
-    running_a_to_b.update(a_to_b)
-    
-    assembly_a, assembly_b, a_to_b, miss_a, miss_b = remove_and_match(
-        assembly_a, assembly_b, a_to_b)
-    running_a_to_b.update(a_to_b)
-    
-    d = 0
-    while len(a_to_b):
-        assembly_a, assembly_b, a_to_b, miss_a, miss_b = remove_and_match(
-            assembly_a, assembly_b, a_to_b)
+    running_a_to_b = {}
+    num_groups = 0
+    while True:
+        matching, offset = matcher.match()
+        a_to_b, b_to_a, miss_a, miss_b = match_lookup(
+            matching, matcher.assembly_a, matcher.assembly_b)
+        if not len(a_to_b):
+            break
         running_a_to_b.update(a_to_b)
-        
-        d += 1
+        matcher.remove(a_to_b)
+        num_groups += 1
     
+    d = max(num_groups - 1, 0)
     d += len(miss_a) * miss_a_penalty
     d += len(miss_b) * miss_b_penalty
     
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+import argparse
+
+from ltron.geometry.symmetry import (
+    build_symmetry_table,
+    symmetry_table_path,
+    default_resolution,
+    default_tolerance,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--bricks', type=str, default=None)
+parser.add_argument('--output-path', type=str, default=symmetry_table_path)
+parser.add_argument('--resolution', type=int, default=default_resolution)
+parser.add_argument('--tolerance', type=float, default=default_tolerance)
+parser.add_argument('--error-handling', type=str, default='skip')
+parser.add_argument('--num-processes', type=int, default=1)
+parser.add_argument('--egl-devices', type=str, default=None)
+parser.add_argument('--incremental', action='store_true')
+
+def main():
+    args = parser.parse_args()
+    if args.bricks is None:
+        bricks = None
+    else:
+        bricks = [b.strip() for b in args.bricks.split(',')]
+    if args.egl_devices is None:
+        egl_devices = None
+    else:
+        egl_devices = [int(d) for d in args.egl_devices.split(',')]
+    
+    build_symmetry_table(
+        bricks=bricks,
+        symmetry_table_path=args.output_path,
+        resolution=args.resolution,
+        tolerance=args.tolerance,
+        error_handling=args.error_handling,
+        num_processes=args.num_processes,
+        egl_devices=egl_devices,
+        incremental=args.incremental,
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+import numpy
+
+from ltron.compression import batch_deduplicate_tiled_seqs
+
+# the elementwise implementation that the hashed comparison replaced
+def reference_batch_deduplicate_tiled_seqs(
+    seqs,
+    pad,
+    tile_width,
+    tile_height,
+    background=0,
+    s_start=None,
+):
+    s, b, h, w, c = seqs.shape
+    assert h % tile_height == 0
+    assert w % tile_width == 0
+    hh = h // tile_height
+    ww = w // tile_width
+    
+    # reshape to b x s x hh x ww x (tile_height*tile_width*c)
+    # batch must come first because this makes it possible to map
+    # the extracted tiles onto the compressed batch tensor later
+    seq_tiles = seqs.reshape(s, b, hh, tile_height, ww, tile_width, c)
+    seq_tiles = seq_tiles.transpose(1, 0, 2, 4, 3, 5, 6)
+    seq_tiles = seq_tiles.reshape(b, s, hh, ww, -1)
+    
+    # make the background
+    try:
+        background = background.reshape(
+            b, 1, hh, tile_height, ww, tile_width, c)
+        background = background.transpose(0, 1, 2, 4, 3, 5, 6)
+        background = background.reshape(b, 1, hh, ww, -1)
+    except AttributeError:
+        background = background * numpy.ones(
+            (b, 1, hh, ww, tile_height*tile_width*c), dtype=seq_tiles.dtype)
+    
+    # compute tiles that change
+    prev_tiles = numpy.concatenate((background, seq_tiles[:,:-1]), axis=1)
+    nonstatic_tiles = numpy.any(seq_tiles != prev_tiles, axis=-1)
+    
+    # get indices of changing tiles
+    b_coord, s_coord, h_coord, w_coord = numpy.where(nonstatic_tiles)
+    max_lengths = pad[b_coord]
+    nonpadded_indices = s_coord < max_lengths
+    b_coord = b_coord[nonpadded_indices]
+    s_coord = s_coord[nonpadded_indices]
+    h_coord = h_coord[nonpadded_indices]
+    w_coord = w_coord[nonpadded_indices]
+    
+    # extract the changing tiles
+    compressed_len = len(b_coord)
+    compressed_tiles = seq_tiles[b_coord, s_coord, h_coord, w_coord]
+    compressed_tiles = compressed_tiles.reshape(
+        compressed_len, tile_height, tile_width, c)
+    
+    # compute the coordinates for the tiles on the new padded grid
+    # this time the padding is not based on the original frame sequences,
+    # but on the lengths of the newly computed tile sequences
+    # the reason why the batch dimension must come first above, is so that
+    # b_coord will align properly with t_coord below
+    batch_pad = numpy.bincount(b_coord, minlength=b)
+    max_len = numpy.max(batch_pad)
+    t_coord = numpy.concatenate([numpy.arange(cc) for cc in batch_pad])
+    
+    # place the tiles in the padded grid and swap the batch and time axes
+    batch_padded_tiles = numpy.zeros(
+        (b, max_len, tile_height, tile_width, c), dtype=compressed_tiles.dtype)
+    batch_padded_tiles[b_coord, t_coord] = compressed_tiles
+    batch_padded_tiles = batch_padded_tiles.transpose(1,0,2,3,4)
+    
+    # place the coordinates in a padded grid and swap the batch and time axes
+    batch_padded_coords = numpy.zeros((b, max_len, 3), dtype=s_coord.dtype)
+    shw_coord = numpy.stack((s_coord, h_coord, w_coord), axis=-1)
+    batch_padded_coords[b_coord, t_coord] = shw_coord
+    if s_start is not None:
+        batch_padded_coords[:,:,0] += s_start.reshape(b, 1)
+    batch_padded_coords = batch_padded_coords.transpose(1,0,2)
+    
+    return (
+        batch_padded_tiles,
+        batch_padded_coords,
+        batch_pad,
+    )
+
+def random_case(random):
+    dtype = random.choice([
+        numpy.uint8, numpy.int8, numpy.uint16, numpy.int32, numpy.int64,
+        numpy.float32, bool,
+    ])
+    tile_height, tile_width = random.choice([1, 2, 3, 4], size=2)
+    s = random.randint(1, 7)
+    b = random.randint(1, 4)
+    h = tile_height * random.randint(1, 4)
+    w = tile_width * random.randint(1, 4)
+    c = random.randint(1, 4)
+    
+    # a few values so that tiles often repeat from one frame to the next
+    seqs = random.randint(0, 3, size=(s, b, h, w, c)).astype(dtype)
+    for i in range(1, s):
+        keep = random.rand(b, h, w) < 0.7
+        seqs[i][keep] = seqs[i-1][keep]
+    pad = random.randint(0, s+1, size=b)
+    pad[random.randint(b)] = s
+    
+    if random.rand() < 0.5:
+        background = random.randint(0, 3, size=(b, h, w, c)).astype(dtype)
+    else:
+        background = int(random.randint(0, 3))
+    s_start = random.randint(0, 10, size=b) if random.rand() < 0.5 else None
+    
+    return seqs, pad, tile_width, tile_height, background, s_start
+
+def test_matches_elementwise():
+    random = numpy.random.RandomState(0)
+    for _ in range(300):
+        seqs, pad, tile_width, tile_height, background, s_start = (
+            random_case(random))
+        expected = reference_batch_deduplicate_tiled_seqs(
+            seqs,
+            pad,
+            tile_width,
+            tile_height,
+            background=background,
+            s_start=s_start,
+        )
+        for verify in (True, False):
+            result = batch_deduplicate_tiled_seqs(
+                seqs,
+                pad,
+                tile_width,
+                tile_height,
+                background=background,
+                s_start=s_start,
+                verify=verify,
+            )
+            assert len(result) == len(expected)
+            for a, b in zip(result, expected):
+                assert a.dtype == b.dtype
+                assert numpy.array_equal(a, b)
+
+def test_background_only_changes():
+    # frames equal to the background produce no tiles at all
+    seqs = numpy.full((4, 2, 8, 8, 3), 102, dtype=numpy.uint8)
+    pad = numpy.array([4, 2])
+    tiles, coords, batch_pad = batch_deduplicate_tiled_seqs(
+        seqs, pad, 4, 4, background=102)
+    assert tiles.shape == (0, 2, 4, 4, 3)
+    assert coords.shape == (0, 2, 3)
+    assert batch_pad.tolist() == [0, 0]
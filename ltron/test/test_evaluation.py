@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+import numpy
+
+from ltron.evaluation import (
+    ap, edge_ap, edge_ap_arrays, batch_edge_ap, instance_map)
+
+# expected scores were computed with the original loop implementations
+
+def test_ap():
+    assert ap([0.9, 0.8, 0.7], [1, 0, 1], 1)[2] == 0.5555555555555555
+    assert ap([0.5, 0.5, 0.2, 0.9], [0., 1., 1., 0.], 0)[2] == 0.75
+    assert ap([], [], 2)[2] == 0.0
+    assert ap([0.3], [0.], 0)[2] == 0.0
+
+def test_edge_ap():
+    edges = {(1,2):0.9, (2,3):0.4, (3,4):0.8}
+    ground_truth = {(1,2):1., (3,4):1., (5,6):1.}
+    assert edge_ap(edges, ground_truth)[2] == 2/3
+    
+    _, _, score = edge_ap_arrays(
+        list(edges.keys()),
+        list(edges.values()),
+        list(ground_truth.keys()),
+        list(ground_truth.values()),
+    )
+    assert score == 2/3
+
+def test_empty_edges():
+    assert edge_ap_arrays(numpy.zeros((0,2)), [], [(1,2)], [1.])[2] == 0.0
+    assert edge_ap_arrays([(1,2)], [0.5], numpy.zeros((0,2)), [])[2] == 0.0
+    assert batch_edge_ap([], [], [], [], [], []) == {}
+    
+    keys = [(1,2), (3,4), (5,6)]
+    scores = [0.9, 0.5, 0.1]
+    scene_ids = [0, 0, 1]
+    assert batch_edge_ap(
+        keys, scores, scene_ids, numpy.zeros((0,2), dtype=int), [], [],
+    ) == {0:0.0, 1:0.0}
+    assert batch_edge_ap(
+        keys, scores, scene_ids, [(1,2)], [1.], [0],
+    ) == {0:1.0, 1:0.0}
+
+def test_batch_edge_ap_matches_edge_ap():
+    random = numpy.random.RandomState(0)
+    keys, scores, scene_ids = [], [], []
+    ground_truth_keys, ground_truth_scene_ids = [], []
+    expected = {}
+    for scene_id in range(20):
+        edges = {
+            tuple(key) : float(score) for key, score in zip(
+                random.randint(0, 8, size=(12,2)).tolist(),
+                random.rand(12),
+            )
+        }
+        ground_truth = {
+            tuple(key) : 1. for key in
+            random.randint(0, 8, size=(12,2)).tolist()
+        }
+        expected[scene_id] = edge_ap(edges, ground_truth)[2]
+        keys.extend(edges.keys())
+        scores.extend(edges.values())
+        scene_ids.extend([scene_id] * len(edges))
+        ground_truth_keys.extend(ground_truth.keys())
+        ground_truth_scene_ids.extend([scene_id] * len(ground_truth))
+    
+    result = batch_edge_ap(
+        keys,
+        scores,
+        scene_ids,
+        ground_truth_keys,
+        [1.] * len(ground_truth_keys),
+        ground_truth_scene_ids,
+    )
+    assert result == expected
+
+def test_instance_map():
+    predictions = [
+        ((1, 0.9), 1),
+        ((1, 0.6), 2),
+        ((2, 0.8), 2),
+        ((1, 0.3), 1),
+        ((3, 0.5), 1),
+    ]
+    mean_ap, class_ap = instance_map(predictions, {1:1, 2:0}, {1, 2})
+    assert class_ap == {1:0.5555555555555555, 2:1.0}
+    assert mean_ap == 0.7777777777777777
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import numpy
+
+from ltron.hierarchy import (
+    map_hierarchies,
+    index_hierarchy,
+    set_index_hierarchy,
+    len_hierarchy,
+    stack_numpy_hierarchies,
+    concatenate_numpy_hierarchies,
+    pad_numpy_hierarchy,
+    TreeSpec,
+)
+
+def make_hierarchy(random, n):
+    # tuple nodes, non-str dict keys and nested lists
+    return {
+        'image' : random.rand(n, 4, 4, 3),
+        'pose' : (random.rand(n, 4, 4), [random.randint(10, size=n)]),
+        3 : {
+            (1, 'a') : random.randint(10, size=(n, 2)),
+            None : random.rand(n),
+        },
+        2.5 : [
+            {'x' : random.rand(n, 2)},
+            (random.rand(n, 1),),
+        ],
+    }
+
+def assert_equal(a, b):
+    assert type(a) == type(b)
+    if isinstance(a, dict):
+        assert list(a.keys()) == list(b.keys())
+        for key in a:
+            assert_equal(a[key], b[key])
+    elif isinstance(a, (tuple, list)):
+        assert len(a) == len(b)
+        for aa, bb in zip(a, b):
+            assert_equal(aa, bb)
+    else:
+        assert numpy.array_equal(a, b)
+        assert numpy.asarray(a).dtype == numpy.asarray(b).dtype
+
+def test_tree_spec_matches_recursive():
+    random = numpy.random.RandomState(0)
+    a = make_hierarchy(random, 5)
+    b = make_hierarchy(random, 5)
+    c = make_hierarchy(random, 3)
+    spec = TreeSpec(a)
+    assert len(spec) == 7
+    
+    assert_equal(spec.unflatten(spec.flatten(a)), map_hierarchies(
+        lambda leaf : leaf, a))
+    assert_equal(
+        spec.map(lambda leaf : leaf * 2, a),
+        map_hierarchies(lambda leaf : leaf * 2, a),
+    )
+    assert_equal(
+        spec.map(lambda x, y : x + y, a, b),
+        map_hierarchies(lambda x, y : x + y, a, b),
+    )
+    assert_equal(spec.index(a, 2), index_hierarchy(a, 2))
+    assert_equal(spec.index(a, slice(1, 4)), index_hierarchy(a, slice(1, 4)))
+    assert spec.len(a) == len_hierarchy(a) == 5
+    assert spec.len(c) == len_hierarchy(c) == 3
+    assert_equal(spec.stack(a, b), stack_numpy_hierarchies(a, b))
+    assert_equal(
+        spec.stack(a, b, axis=1), stack_numpy_hierarchies(a, b, axis=1))
+    assert_equal(
+        spec.concatenate(a, c), concatenate_numpy_hierarchies(a, c))
+    assert_equal(spec.pad(c, 5), pad_numpy_hierarchy(c, 5))
+    assert_equal(spec.pad(a, 3), pad_numpy_hierarchy(a, 3))
+    
+    spec_a = map_hierarchies(lambda leaf : leaf.copy(), a)
+    recursive_a = map_hierarchies(lambda leaf : leaf.copy(), a)
+    spec.set_index(spec_a, index_hierarchy(b, 1), 4)
+    set_index_hierarchy(recursive_a, index_hierarchy(b, 1), 4)
+    assert_equal(spec_a, recursive_a)
+
+def test_empty_tree_spec():
+    for a in ({}, [], {'a' : {}, 'b' : ()}):
+        spec = TreeSpec(a)
+        assert len(spec) == 0
+        assert spec.len(a) == len_hierarchy(a) == 0
+        assert_equal(spec.stack(a, a), stack_numpy_hierarchies(a, a))
+
+if __name__ == '__main__':
+    test_tree_spec_matches_recursive()
+    test_empty_tree_spec()
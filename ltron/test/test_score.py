@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+import numpy
+
+from ltron.score import edit_distance
+
+part_names = {1:'3001.dat', 2:'3003.dat', 3:'3004.dat', 4:'3010.dat'}
+
+def random_assembly_pair(random):
+    '''
+    Builds two assemblies made of rigid groups of bricks.  Every brick has
+    the identity rotation and the groups are offset from each other by
+    translations only, so the results do not depend on the part symmetries.
+    '''
+    num_groups = random.randint(1, 5)
+    shapes = []
+    colors = []
+    positions_a = []
+    positions_b = []
+    for group in range(num_groups):
+        group_size = random.randint(1, 6)
+        # groups live in separate regions so bricks never overlap
+        origin = numpy.array([group * 400, 0, 0])
+        cells = random.choice(64, size=group_size, replace=False)
+        positions = origin + numpy.stack(
+            (cells % 4, (cells // 4) % 4, cells // 16), axis=-1) * 20
+        if random.rand() < 0.3:
+            offset = numpy.zeros(3)
+        else:
+            offset = random.randint(-5, 6, size=3) * 80
+        shapes.extend(random.randint(1, 5, size=group_size))
+        colors.extend(random.randint(1, 3, size=group_size))
+        positions_a.extend(positions)
+        positions_b.extend(positions + offset)
+    
+    n = len(shapes)
+    shapes = numpy.array(shapes)
+    colors = numpy.array(colors)
+    
+    # drop some bricks from each side and recolor a few in b
+    keep_a = random.rand(n) > 0.15
+    keep_b = random.rand(n) > 0.15
+    colors_b = colors.copy()
+    recolor = random.rand(n) < 0.1
+    colors_b[recolor] = 3
+    
+    # extra bricks that only exist in b
+    num_extra = random.randint(0, 4)
+    extra_positions = numpy.array([0, 2000, 0]) + random.randint(
+        0, 10, size=(num_extra, 3)) * 20
+    extra_shapes = random.randint(1, 5, size=num_extra)
+    extra_colors = random.randint(1, 3, size=num_extra)
+    
+    def make_assembly(shapes, colors, positions, order):
+        # instance 0 is empty, like the assemblies of a BrickScene
+        m = len(shapes) + 1
+        assembly = {
+            'shape' : numpy.zeros(m, dtype=numpy.int64),
+            'color' : numpy.zeros(m, dtype=numpy.int64),
+            'pose' : numpy.tile(numpy.eye(4), (m,1,1)),
+        }
+        assembly['shape'][order+1] = shapes
+        assembly['color'][order+1] = colors
+        assembly['pose'][order+1,:3,3] = positions
+        return assembly
+    
+    assembly_a = make_assembly(
+        shapes[keep_a],
+        colors[keep_a],
+        numpy.array(positions_a)[keep_a],
+        random.permutation(keep_a.sum()),
+    )
+    shapes_b = numpy.concatenate((shapes[keep_b], extra_shapes))
+    colors_b = numpy.concatenate((colors_b[keep_b], extra_colors))
+    positions_b = numpy.concatenate(
+        (numpy.array(positions_b)[keep_b], extra_positions))
+    assembly_b = make_assembly(
+        shapes_b, colors_b, positions_b, random.permutation(len(shapes_b)))
+    
+    return assembly_a, assembly_b
+
+# (distance, matching) from the previous edit_distance, which deep-copied
+# the assemblies and called match_assemblies from scratch every round
+expected_results = [
+    (3, [(1,1)]),
+    (3, [(1,1), (2,3)]),
+    (5, [(1,3), (3,4), (4,1), (5,2), (6,7)]),
+    (6, [(1,4), (2,3), (3,8), (4,2), (5,1)]),
+    (9, [(1,5), (2,9), (3,2), (4,1), (6,3)]),
+    (9, [(1,11), (2,3), (3,2), (4,4), (6,13), (7,1), (8,14), (10,6), (11,7),
+        (12,12)]),
+    (6, [(1,1), (3,5), (4,13), (5,12), (6,6), (7,10), (8,9), (9,2), (10,7),
+        (11,15), (12,8), (13,3)]),
+    (6, [(1,1), (2,3), (4,4), (5,2)]),
+    (4, [(1,6), (2,1), (4,5)]),
+    (7, [(1,5), (3,3), (4,10), (5,6), (6,1), (7,7), (8,11), (9,2), (10,12),
+        (12,8)]),
+    (0, [(1,2), (2,1)]),
+    (9, [(1,11), (2,8), (3,7), (4,13), (5,1), (6,6), (7,17), (8,2), (9,4),
+        (11,10), (12,3), (13,5)]),
+    (2, [(1,5), (2,6), (3,4), (4,2), (5,1), (6,3)]),
+    (11, [(1,5), (2,7), (4,3)]),
+    (1, [(1,1)]),
+    (10, [(1,11), (2,5), (5,1), (7,2), (8,10), (9,3), (10,6)]),
+    (1, [(1,2), (2,3), (3,1)]),
+    (5, [(2,3), (3,5), (4,1)]),
+    (13, [(2,13), (3,9), (4,3), (7,7), (8,11), (10,2), (11,5), (12,8)]),
+    (5, [(2,3)]),
+    (7, [(1,6), (2,1), (3,4), (4,7), (5,5), (7,2)]),
+    (4, [(1,4), (2,2), (3,1)]),
+    (5, [(1,4), (3,6), (4,1), (5,3), (6,2), (7,7)]),
+    (6, [(2,3), (3,1), (4,2)]),
+    (4, [(1,6), (2,7), (3,3), (4,4)]),
+    (3, [(1,2), (2,1)]),
+    (10, [(1,5), (2,4), (3,12), (5,2), (6,3), (7,7), (8,9)]),
+    (2, [(1,2)]),
+    (4, [(3,4), (4,2)]),
+    (5, [(1,8), (2,9), (3,11), (4,2), (5,10), (6,4), (7,6), (8,5), (9,7),
+        (11,3), (12,1)]),
+]
+
+def test_edit_distance_matches_recorded_results():
+    random = numpy.random.RandomState(0)
+    for expected_distance, expected_matching in expected_results:
+        assembly_a, assembly_b = random_assembly_pair(random)
+        distance, matching = edit_distance(assembly_a, assembly_b, part_names)
+        assert distance == expected_distance
+        assert sorted(matching.items()) == expected_matching
+
+def test_edit_distance_empty():
+    empty = {
+        'shape' : numpy.zeros(1, dtype=numpy.int64),
+        'color' : numpy.zeros(1, dtype=numpy.int64),
+        'pose' : numpy.eye(4)[None],
+    }
+    assert edit_distance(empty, empty, part_names) == (0, {})
+    
+    random = numpy.random.RandomState(1)
+    assembly_a, assembly_b = random_assembly_pair(random)
+    num_bricks = numpy.count_nonzero(assembly_a['shape'])
+    assert edit_distance(assembly_a, empty, part_names) == (num_bricks, {})
+    distance, matching = edit_distance(
+        assembly_a, assembly_a, part_names)
+    assert distance == 0
+    assert matching == {i:i for i in range(1, num_bricks+1)}
+
+if __name__ == '__main__':
+    test_edit_distance_matches_recorded_results()
+    test_edit_distance_empty()
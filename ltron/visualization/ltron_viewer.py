@@ -20,6 +20,7 @@ from splendor.image import save_image
 import ltron.settings as settings
 from ltron.dataset.paths import resolve_subdocument
 from ltron.bricks.brick_scene import BrickScene
+from ltron.bricks.ldraw_reload import LDrawReloader
 
 instructions = '''
 LTRON Viewer Hotkeys
@@ -154,6 +155,8 @@ def start_viewer(
         'pick_snap' : None,
     }
     
+    reloader = LDrawReloader(scene, file_path)
+    
     print(instructions)
     
     def reload_scene(force=False):
@@ -163,8 +166,7 @@ def start_viewer(
                 if change_time != state['recent_file_change_time'] or force:
                     t_start_load = time.time()
                     view_matrix = scene.get_view_matrix()
-                    scene.instances.clear()
-                    scene.import_ldraw(file_path)
+                    changes = reloader.reload(full=force)
                     
                     #renderer.load_scene(scene, clear_scene=True)
                     if state['recent_file_change_time'] == -1:
@@ -178,6 +180,8 @@ def start_viewer(
                     print('Shapes: %i'%len(scene.shape_library))
                     print('Colors: %i'%len(scene.color_library))
                     print('Brick Instances: %i'%len(scene.instances))
+                    print('Changes: %s'%', '.join(
+                        '%s %i'%(key, value) for key, value in changes.items()))
             except:
                 print('Unable to load file: %s'%file_path)
                 raise
@@ -31,6 +31,7 @@ setuptools.setup(
                 'main',
             'ltron_generate_episodes=ltron.dataset.break_and_make:'
                 'generate_episodes_for_dataset',
+            'ltron_pack_meshes=ltron.render.mesh_archive:main',
             'ltron_clean_omr=ltron.dataset.omr_clean.ultimate_cleanup:'
                 'clean_omr',
         ]